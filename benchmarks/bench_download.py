@@ -0,0 +1,268 @@
+"""
+End-to-end benchmark of the download engine.
+
+Serves generated files by the LCMS-like range server (range_server.py),
+and downloads them by FileDownloader (or AsyncFileDownloader) for each
+combination of chunk size and worker count. Each case runs in its own
+process, so peak RSS and thread count are of the case only.
+
+Reports throughput (MB/s), p50/p95 time to complete each file,
+peak RSS and peak thread count as JSON. After each run, the downloaded
+files are verified by SHA-256 of the generated content.
+
+Usage:
+    python benchmarks/bench_download.py --files 8 --size 64 --chunk-size 1 4 16 auto \\
+        --workers 4 8 --latency 20 --bandwidth 10 -o result.json
+"""
+from argparse import ArgumentParser, Namespace
+from typing import Any
+import itertools
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from range_server import RangeServer, ServerOptions
+
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+SAMPLE_INTERVAL = 0.005  # seconds
+POLL_INTERVAL = 1  # seconds, to check whether the case process is alive
+
+
+def _peak_rss_kib() -> int | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak  # bytes on macOS
+
+
+def _sha256_of(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while data := file.read(1024 ** 2):
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+def _run_case(case: dict[str, Any], files: list[tuple[str, str, str, str]], results: multiprocessing.Queue) -> None:
+    """Runs a case. (In child process)"""
+    sys.path.insert(0, SRC_DIR)
+    # pylint: disable = import-outside-toplevel, import-error
+    import asyncio
+    from workers import MaterialTypes
+    from workers.async_commons import AsyncFileDownloader
+    from workers.commons import FileDownloader, MIN_CHUNK_SIZE, MAX_CHUNK_SIZE
+
+    peak_threads = threading.active_count()
+    sampling = threading.Event()
+
+    def sample_threads():
+        nonlocal peak_threads
+        while not sampling.wait(SAMPLE_INTERVAL):
+            peak_threads = max(peak_threads, threading.active_count())
+
+    done_at: dict[int, float] = {}
+
+    def new_callback(index: int):
+        def inner(status: str):
+            if status.startswith('성공'):
+                done_at[index] = time.monotonic()
+        return inner
+
+    works = [
+        (name, MaterialTypes.VIDEO if kind == 'video' else MaterialTypes.DOCUMENT, url, new_callback(k))
+        for k, (name, kind, url, _) in enumerate(files)
+    ]
+    chunk_size = case['chunk_size']
+    options = {
+        'segments': case['segments'],
+        'min_chunk_size': MIN_CHUNK_SIZE if chunk_size is None else chunk_size,
+        'max_chunk_size': MAX_CHUNK_SIZE if chunk_size is None else chunk_size,
+        'write_buffers': case['write_buffers'],
+    }
+
+    destination = tempfile.mkdtemp(prefix='bench-download-')
+    sampler = threading.Thread(target=sample_threads, daemon=True)
+    sampler.start()
+    try:
+        started = time.monotonic()
+        if case['engine'] == 'asyncio':
+            downloader = AsyncFileDownloader()
+            downloader._workers_count = case['workers']  # pylint: disable = protected-access
+            download_results = asyncio.run(downloader.runner(
+                works, destination, connections_per_host=case['workers'] * case['segments'], **options
+            ))
+        else:
+            downloader = FileDownloader()
+            downloader._workers_count = case['workers']  # pylint: disable = protected-access
+            download_results = downloader.runner(works, destination, **options)
+        elapsed = time.monotonic() - started
+        sampling.set()
+        sampler.join()
+        downloaded = [
+            (path, sha256) for name, _, _, sha256 in files if os.path.isfile(path := os.path.join(destination, name))
+        ]  # Failed files are counted by the results
+        total_bytes = sum(os.path.getsize(path) for path, _ in downloaded)
+        corrupt = sum(_sha256_of(path) != sha256 for path, sha256 in downloaded)
+    finally:
+        shutil.rmtree(destination, ignore_errors=True)
+
+    results.put({
+        'elapsed': elapsed,
+        'bytes': total_bytes,
+        'failed': sum(not success for success, _ in download_results),
+        'corrupt': corrupt,
+        'times_to_complete': [done_at[k] - started for k in sorted(done_at)],
+        'peak_rss_kib': _peak_rss_kib(),
+        'peak_threads': peak_threads,
+    })
+
+
+def _run_in_process(
+    context: multiprocessing.context.BaseContext, case: dict[str, Any], files: list[tuple[str, str, str, str]]
+) -> dict[str, Any] | None:
+    """Runs a case in its own process. None if the process exits without the result. (e.g. crashed)"""
+    results = context.Queue()
+    process = context.Process(target=_run_case, args=(case, files, results))
+    process.start()
+    try:
+        while True:
+            try:
+                return results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if process.is_alive():
+                    continue
+            try:  # Put just before the exit
+                return results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                print(f'case exited with {process.exitcode}: {json.dumps(case)}', file=sys.stderr, flush=True)
+                return None
+    finally:
+        process.join()
+
+
+def _percentile(values: list[float], percent: int) -> float | None:
+    if not values:
+        return None
+    if len(values) == 1:
+        return round(values[0], 3)
+    return round(statistics.quantiles(values, n=100, method='inclusive')[percent - 1], 3)
+
+
+def _parse_chunk_size(value: str) -> int | None:
+    return None if value == 'auto' else int(float(value) * 1024 ** 2)
+
+
+def _parse_args() -> Namespace:
+    parser = ArgumentParser(description='Benchmark of the download engine')
+    parser.add_argument('--files', type=int, default=4, help='the number of files')
+    parser.add_argument('--size', type=float, default=64, help='size of each file in MiB')
+    parser.add_argument(
+        '--kind', choices=('video', 'document'), default='video',
+        help='video: ranged (206) like LCMS, document: whole body (200)'
+    )
+    parser.add_argument(
+        '--chunk-size', nargs='+', default=['4'],
+        help="range size in MiB, or 'auto' for the adaptive size (default: 4)"
+    )
+    parser.add_argument('--workers', type=int, nargs='+', default=[4], help='worker counts (default: 4)')
+    parser.add_argument('--segments', type=int, nargs='+', default=[4], help='segments of each file (default: 4)')
+    parser.add_argument('--engine', choices=('thread', 'asyncio'), nargs='+', default=['thread'])
+    parser.add_argument(
+        '--write-buffers', type=int, nargs='+', default=[16],
+        help='buffers of the writer stage (0: written by the fetchers, default: 16)'
+    )
+    parser.add_argument('--latency', type=float, default=0., help='latency of each response in ms')
+    parser.add_argument('--bandwidth', type=float, default=0., help='MiB/s of each connection (0: unlimited)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each case')
+    parser.add_argument('-o', '--output', help='JSON output file (default: stdout)')
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    options = ServerOptions(args.latency / 1000, int(args.bandwidth * 1024 ** 2))
+    server = RangeServer(options)
+    files = []
+    for k in range(args.files):
+        name = f'{k}.mp4' if args.kind == 'video' else f'{k}.pdf'
+        server.add_file(name, int(args.size * 1024 ** 2))
+        files.append((name, args.kind, server.url_of(args.kind, name), server.files[name].sha256()))
+    server.start()
+
+    context = multiprocessing.get_context('spawn')
+    cases = []
+    for engine, chunk_size, workers, segments, write_buffers in itertools.product(
+        args.engine, args.chunk_size, args.workers, args.segments, args.write_buffers
+    ):
+        case = {
+            'engine': engine,
+            'chunk_size': _parse_chunk_size(chunk_size),
+            'workers': workers,
+            'segments': segments,
+            'write_buffers': write_buffers,
+        }
+        server.take_stats()
+        runs = [run for _ in range(args.repeat) if (run := _run_in_process(context, case, files)) is not None]
+        server_stats = server.take_stats()
+        if not runs:
+            cases.append(case | {'crashed': args.repeat})
+            print(json.dumps(cases[-1]), file=sys.stderr, flush=True)
+            continue
+
+        elapsed = sum(run['elapsed'] for run in runs)
+        times = sorted(t for run in runs for t in run['times_to_complete'])
+        cases.append(case | {
+            'crashed': args.repeat - len(runs),
+            'mb_per_s': round(sum(run['bytes'] for run in runs) / elapsed / 1e6, 2),
+            'elapsed': [round(run['elapsed'], 3) for run in runs],
+            'ttc_p50': _percentile(times, 50),
+            'ttc_p95': _percentile(times, 95),
+            'peak_rss_kib': max((run['peak_rss_kib'] or 0 for run in runs), default=None) or None,
+            'peak_threads': max(run['peak_threads'] for run in runs),
+            'failed': sum(run['failed'] for run in runs),
+            'corrupt': sum(run['corrupt'] for run in runs),
+            'requests_per_run': server_stats['requests'] / args.repeat,
+        })
+        print(json.dumps(cases[-1]), file=sys.stderr, flush=True)
+    server.shutdown()
+
+    report = {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'server': {
+            'files': args.files,
+            'size': int(args.size * 1024 ** 2),
+            'kind': args.kind,
+            'latency': options.latency,
+            'bandwidth': options.bandwidth,
+        },
+        'repeat': args.repeat,
+        'cases': cases,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""
+Local HTTP server, which mimics lcms.knu.ac.kr for benchmarks.
+
+Serves generated files of given sizes. Videos (/video/<name>) are served
+like LCMS: ranged requests get 206 with Content-Range, and documents
+(/document/<name>) always get 200 with the whole body.
+Latency (before each response) and bandwidth of each connection can be limited.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple
+import hashlib
+import random
+import re
+import threading
+import time
+
+
+BLOCK_SIZE = 1024 ** 2  # 1MiB
+WRITE_SIZE = 64 * 1024  # 64KiB
+
+
+class ServerOptions(NamedTuple):
+    latency: float = 0.  # seconds
+    bandwidth: int = 0  # bytes per second of each connection, 0 means unlimited
+
+
+class GeneratedFile:
+    """
+    File content of given size, generated from the name. (Not held in memory)
+
+    Each block is a random block of the file, with its bytes substituted by
+    a table seeded by the block index, so the content never repeats (and
+    can't be compressed or deduplicated along the way), but is still fast
+    enough to generate.
+    """
+
+    def __init__(self, name: str, size: int):
+        self.size = size
+        self.__seed = hashlib.sha256(name.encode()).digest()
+        self.__block = random.Random(self.__seed).randbytes(BLOCK_SIZE)
+        self.__tables: dict[int, bytes] = {}  # block index -> substitution table
+        self.etag = f'"{hashlib.sha256(self.__seed + str(size).encode()).hexdigest()[:16]}"'
+
+    def read(self, start: int, end: int):
+        """Yields bytes of [start, end], in pieces of at most WRITE_SIZE."""
+        position = start
+        while position <= end:
+            index, offset = divmod(position, BLOCK_SIZE)
+            length = min(WRITE_SIZE, BLOCK_SIZE - offset, end - position + 1)
+            yield self.__block[offset:offset + length].translate(self.__table_of(index))
+            position += length
+
+    def content(self) -> bytes:
+        return b''.join(self.read(0, self.size - 1))
+
+    def sha256(self) -> str:
+        """Gets SHA-256 of the content, to verify downloaded files."""
+        hasher = hashlib.sha256()
+        for data in self.read(0, self.size - 1):
+            hasher.update(data)
+        return hasher.hexdigest()
+
+    def __table_of(self, index: int) -> bytes:
+        if (table := self.__tables.get(index)) is None:  # A permutation of bytes
+            rng = random.Random(self.__seed + index.to_bytes(8, 'big'))
+            table = self.__tables[index] = bytes(rng.sample(range(256), 256))
+        return table
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: 'RangeServer'
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.__respond(False)
+
+    def do_GET(self):
+        self.__respond(True)
+
+    def __respond(self, send_body: bool):
+        options = self.server.options
+        if options.latency:
+            time.sleep(options.latency)
+        self.server.count_request()
+
+        kind, _, name = self.path.split('?', 1)[0].lstrip('/').partition('/')
+        file = self.server.files.get(name)
+        if file is None or kind not in ('video', 'document'):
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        range_header = self.headers.get('Range')
+        if kind == 'video' and range_header is not None:
+            match = re.fullmatch(r'bytes=(\d+)-(\d*)', range_header.strip())
+            start = int(match[1]) if match else file.size
+            end = min(int(match[2]), file.size - 1) if match and match[2] else file.size - 1
+            if start >= file.size or start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{file.size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{file.size}')
+        else:
+            start, end = 0, file.size - 1
+            self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4' if kind == 'video' else 'application/pdf')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('ETag', file.etag)
+        self.send_header('Accept-Ranges', 'bytes' if kind == 'video' else 'none')
+        self.end_headers()
+        if send_body:
+            self.__send_body(file, start, end, options.bandwidth)
+
+    def __send_body(self, file: GeneratedFile, start: int, end: int, bandwidth: int):
+        started = time.monotonic()
+        sent = 0
+        for data in file.read(start, end):
+            self.wfile.write(data)
+            sent += len(data)
+            if bandwidth:
+                wait = sent / bandwidth - (time.monotonic() - started)
+                if wait > 0:
+                    time.sleep(wait)
+        self.server.count_bytes(sent)
+
+
+class RangeServer(ThreadingHTTPServer):
+    """
+    The LCMS-like server. Runs in a daemon thread by start().
+
+    Public functions and its signature:
+        def add_file(self, name: str, size: int) -> None:
+            Adds a generated file.
+        def url_of(self, kind: str, name: str) -> str:
+            Gets url of the file. (kind: 'video' or 'document')
+        def start(self) -> None:
+            Starts serving in background.
+        def take_stats(self) -> dict[str, int]:
+            Takes the number of requests and sent bytes after last take.
+    """
+    daemon_threads = True
+
+    def __init__(self, options: ServerOptions = ServerOptions(), host: str = '127.0.0.1', port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.options = options
+        self.files: dict[str, GeneratedFile] = {}
+        self.__lock = threading.Lock()
+        self.__requests = 0
+        self.__bytes = 0
+
+    def add_file(self, name: str, size: int) -> None:
+        self.files[name] = GeneratedFile(name, size)
+
+    def url_of(self, kind: str, name: str) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/{kind}/{name}'
+
+    def start(self) -> None:
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def count_request(self) -> None:
+        with self.__lock:
+            self.__requests += 1
+
+    def count_bytes(self, sent: int) -> None:
+        with self.__lock:
+            self.__bytes += sent
+
+    def take_stats(self) -> dict[str, int]:
+        with self.__lock:
+            stats = {'requests': self.__requests, 'bytes': self.__bytes}
+            self.__requests = self.__bytes = 0
+        return stats
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description='LCMS-like range server for benchmarks')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--size', type=int, action='append', default=[], help='file size in MiB (repeatable)')
+    parser.add_argument('--latency', type=float, default=0., help='latency in ms')
+    parser.add_argument('--bandwidth', type=float, default=0., help='MiB/s of each connection (0: unlimited)')
+    args = parser.parse_args()
+
+    server = RangeServer(ServerOptions(args.latency / 1000, int(args.bandwidth * 1024 ** 2)), port=args.port)
+    for k, size in enumerate(args.size or [64]):
+        server.add_file(f'{k}.mp4', size * 1024 ** 2)
+        print(server.url_of('video', f'{k}.mp4'))
+    server.serve_forever()
@@ -120,13 +120,29 @@ class Ui_MainWin(object):
         self.sp = QSpacerItem(198, 20, QSizePolicy.Expanding, QSizePolicy.Minimum)
         self.glFile.addItem(self.sp, 0, 2, 1, 1)
 
+        self.cbSchedule = QComboBox(self.gbFile)
+        self.cbSchedule.addItem("")
+        self.cbSchedule.addItem("")
+        self.cbSchedule.addItem("")
+        self.cbSchedule.setObjectName(u"cbSchedule")
+        self.glFile.addWidget(self.cbSchedule, 0, 3, 1, 1)
+
         self.btnDownload = QPushButton(self.gbFile)
         self.btnDownload.setObjectName(u"btnDownload")
-        self.glFile.addWidget(self.btnDownload, 0, 3, 1, 1)
+        self.glFile.addWidget(self.btnDownload, 0, 4, 1, 1)
+
+        self.btnPause = QPushButton(self.gbFile)
+        self.btnPause.setObjectName(u"btnPause")
+        self.glFile.addWidget(self.btnPause, 0, 5, 1, 1)
+
+        self.btnCancel = QPushButton(self.gbFile)
+        self.btnCancel.setObjectName(u"btnCancel")
+        self.glFile.addWidget(self.btnCancel, 0, 6, 1, 1)
 
         self.tvFile = QTreeView(self.gbFile)
         self.tvFile.setObjectName(u"tvFile")
-        self.glFile.addWidget(self.tvFile, 1, 0, 1, 4)
+        self.tvFile.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.glFile.addWidget(self.tvFile, 1, 0, 1, 7)
 
         self.glCent.addWidget(self.gbFile, 2, 0, 1, 2)
         # end files
@@ -155,7 +171,12 @@ class Ui_MainWin(object):
         self.gbFile.setTitle(QCoreApplication.translate("MainWindow", u"\ud30c\uc77c \uc815\ubcf4", None))
         self.btnSelect.setText(QCoreApplication.translate("MainWindow", u"\ubaa8\ub450 \uc120\ud0dd", None))
         self.btnReverse.setText(QCoreApplication.translate("MainWindow", u"\uc120\ud0dd \ubc18\uc804", None))
+        self.cbSchedule.setItemText(0, QCoreApplication.translate("MainWindow", u"\ubaa9\ub85d \uc21c\uc11c\ub300\ub85c", None))
+        self.cbSchedule.setItemText(1, QCoreApplication.translate("MainWindow", u"\uc791\uc740 \ud30c\uc77c \uba3c\uc800", None))
+        self.cbSchedule.setItemText(2, QCoreApplication.translate("MainWindow", u"\ud070 \ud30c\uc77c \uba3c\uc800", None))
         self.btnDownload.setText(QCoreApplication.translate("MainWindow", u"\uc120\ud0dd \ub2e4\uc6b4\ub85c\ub4dc", None))
+        self.btnPause.setText(QCoreApplication.translate("MainWindow", u"\uc77c\uc2dc\uc815\uc9c0", None))
+        self.btnCancel.setText(QCoreApplication.translate("MainWindow", u"\ucde8\uc18c", None))
     # retranslateUi
 
 class Ui_LoginWin:
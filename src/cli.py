@@ -0,0 +1,467 @@
+"""
+Headless batch downloader. (Without Qt)
+
+Logs in, lists materials of the selected courses and downloads them,
+by the same workers as GUI. Progress is printed to stdout as JSON lines.
+
+With --sink zip, each course is saved as a ZIP file; with --sink tar,
+every course is written to stdout as one tar stream (a directory for each
+course), e.g. to pipe into other tools, and the progress goes to stderr.
+
+Ctrl+C cancels the download (received parts are kept, and resumed by the
+next run); Ctrl+C again stops at once. SIGUSR1 pauses, and SIGUSR2 resumes
+the download. (Not on Windows)
+
+Usage:
+    python -m src.cli --semester '2024년 1학기' --course 자료구조 -d ~/lectures
+    python src/cli.py --list
+    python src/cli.py --course 자료구조 --sink tar | tar -x -C ~/lectures
+"""
+from argparse import ArgumentParser, Namespace
+from configparser import ConfigParser
+from typing import Any, Iterable
+import asyncio
+import getpass
+import json
+import os
+import re
+import signal
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# pylint: disable = wrong-import-position
+from universal_main.universal_constants import DATADIR, PATHSEP
+from workers import LectureMaterial
+from workers.async_commons import AsyncFileDownloader, CONNECTIONS_PER_HOST
+from workers.canvas import CanvasLoginWorker, CanvasSubjectGetter, CanvasFileInfoGetter
+from workers.checksums import new_hash
+from workers.commons import (
+    FileDownloader, MaterialProber, ProbedMaterial, SEGMENT_COUNT, MIN_CHUNK_SIZE, MAX_CHUNK_SIZE, free_space
+)
+from workers.concurrency import HostLimiter, DEFAULT_HOST_CONNECTIONS
+from workers.control import CANCELLED_TEXT, TransferControl
+from workers.knu import KNUIdPwLoginWorker, KNULoginPushSender, KNUPushLoginWorker
+from workers.ledger import DownloadLedger
+from workers.metrics import DownloadMetrics
+from workers.progress import ProgressBoard
+from workers.retry import RETRY_BUDGET
+from workers.scheduling import SchedulingPolicy
+from workers.sinks import SinkType, TarSink, archive_name, open_archive
+from workers.store import BlobStore
+from workers.throttle import BandwidthLimiter
+from workers.writer import WRITE_BUFFERS
+
+
+CONFIG_DIR = DATADIR + 'hys.LectureMaterialDownloader/'
+CONFIG_FILE = CONFIG_DIR + 'config.ini'
+LEDGER_FILE = CONFIG_DIR + 'ledger.sqlite3'
+SERVICE_NAME = 'hys.LectureMaterialDownloader'
+
+PROGRESS_INTERVAL = 1.  # seconds
+
+_TERMS = ('1', '여름', '2', '겨울')  # In the order of a year
+
+EXIT_FAILED = 1
+EXIT_LOGIN_FAILED = 2
+EXIT_NOT_FOUND = 3
+EXIT_CANCELLED = 4
+EXIT_NO_SPACE = 5
+EXIT_BAD_CONFIG = 6
+
+_print_lock = threading.Lock()
+_events = sys.stdout  # stderr, while stdout is the tar stream
+
+
+class LoginFailed(Exception):
+    pass
+
+
+def emit(event: str, **fields: Any) -> None:
+    """Prints an event as a JSON line. (Thread-safe)"""
+    line = json.dumps({'event': event, **fields}, ensure_ascii=False)
+    with _print_lock:
+        print(line, file=_events, flush=True)
+
+
+def _parse_args(argv: list[str] | None) -> Namespace:
+    parser = ArgumentParser(prog='cli', description='LMS 강의자료 다운로더 (CLI)')
+    parser.add_argument('-u', '--username', help='통합정보시스템 ID (기본값: 설정 파일의 ID)')
+    parser.add_argument(
+        '--push', action='store_true',
+        help='KNUPIA 푸시로 로그인 (기본값: ID/PW 로그인)'
+    )
+    parser.add_argument(
+        '--password-stdin', action='store_true',
+        help='암호를 표준 입력에서 읽음 (없으면 KNU_PASSWORD 환경 변수, 키링, 프롬프트 순서)'
+    )
+    parser.add_argument('-s', '--semester', help='학기 (예: 2024년 1학기, 기본값: 최근 학기)')
+    parser.add_argument(
+        '-c', '--course', action='append', default=[],
+        help='과목 이름에 포함된 문자열 (정규식, 여러 번 지정 가능, 기본값: 모든 과목)'
+    )
+    parser.add_argument('-d', '--destination', help='저장할 폴더 (기본값: 설정 파일의 폴더)')
+    parser.add_argument('--course-dirs', action='store_true', help='과목별 하위 폴더에 저장')
+    parser.add_argument(
+        '--sink', choices=[sink.value for sink in SinkType],
+        help='저장 방식 (directory: 폴더, zip: 과목별 ZIP 파일, tar: 표준 출력에 tar 스트림, '
+             '기본값: 설정 파일의 방식)'
+    )
+    parser.add_argument('--list', action='store_true', help='다운로드하지 않고 목록만 출력')
+    parser.add_argument(
+        '--progress-interval', type=float, default=PROGRESS_INTERVAL,
+        help='진행 상황 출력 간격 (초, 0이면 출력 안 함)'
+    )
+    parser.add_argument('--metrics-json', help='다운로드 통계를 저장할 JSON 파일')
+    parser.add_argument(
+        '--metrics-prom', help='다운로드 통계를 저장할 Prometheus 텍스트 파일 (진행 중에도 갱신)'
+    )
+    return parser.parse_args(argv)
+
+
+def _load_config() -> ConfigParser:
+    config = ConfigParser()
+    config.read(CONFIG_FILE, encoding='utf-8')
+    for section in ('download', 'credentials', 'host_rate_limit', 'host_connections'):
+        if not config.has_section(section):
+            config.add_section(section)
+    return config
+
+
+def _apply_limits(config: ConfigParser) -> None:
+    limiter = BandwidthLimiter()
+    limiter.set_rate(config['download'].getint('rate_limit', fallback=0))
+    for host, rate in config['host_rate_limit'].items():
+        limiter.set_host_rate(host, int(rate))
+
+    host_limiter = HostLimiter()
+    host_limiter.set_default_limit(config['download'].getint('host_connections', fallback=DEFAULT_HOST_CONNECTIONS))
+    for host, limit in config['host_connections'].items():
+        host_limiter.set_limit(host, int(limit))
+
+
+def _get_password(args: Namespace, username: str) -> str:
+    if args.password_stdin:
+        return sys.stdin.readline().rstrip('\n')
+    if password := os.environ.get('KNU_PASSWORD'):
+        return password
+    try:
+        import keyring  # pylint: disable = import-outside-toplevel
+        if (password := keyring.get_password(SERVICE_NAME, username)) is not None:
+            return password
+    except Exception:  # pylint: disable = broad-except  # Keyring is not available
+        pass
+    if not sys.stdin.isatty():
+        raise LoginFailed('암호 없음')
+    return getpass.getpass('암호: ', stream=sys.stderr)
+
+
+def login(args: Namespace, config: ConfigParser) -> tuple[str, str]:
+    """
+    Logs in to KNU SSO and Canvas.
+
+    Returns:
+        tuple[str, str]: The Canvas session and LearningX session.
+
+    Raises:
+        LoginFailed: If login failed.
+    """
+    username = args.username or config['credentials'].get('username', '')
+    if not username:
+        raise LoginFailed('ID 없음')
+
+    if args.push:
+        result = KNULoginPushSender().runner(username)
+        if not result['success']:
+            raise LoginFailed(f"{result['message']} ({result['code']})")
+        emit('login', status='push_sent')
+        print('KNUPIA 앱에서 로그인을 승인한 후, Enter를 눌러주세요', file=sys.stderr, flush=True)
+        sys.stdin.readline()
+        result = KNUPushLoginWorker().runner(username, result['trial'])
+    else:
+        result = KNUIdPwLoginWorker().runner(username, _get_password(args, username))
+    if not result['success']:
+        raise LoginFailed(f"{result['message']} ({result['code']})")
+
+    sessions = CanvasLoginWorker().runner(result['knu_session'])
+    emit('login', status='succeeded')
+    return sessions['canvas_session'], sessions['learningx_session']
+
+
+def _semester_order(semester: str) -> tuple[int, int]:
+    """Gets the key to sort the semester (e.g. '2024년 여름계절학기'), by the year and the term in it."""
+    year, term = semester.split('년 ', 1)
+    return int(year), _TERMS.index(term.removesuffix('학기').removesuffix('계절'))
+
+
+def select_courses(
+    subjects: dict[str, list[tuple[str, str]]], semester: str | None, patterns: Iterable[str]
+) -> tuple[str, list[tuple[str, str]]]:
+    """
+    Selects the courses to download.
+
+    Args:
+        subjects: The courses of each semester. (from CanvasSubjectGetter)
+        semester: The semester. If not given, the latest one.
+        patterns: Regular expressions, one of which the course name must contain.
+            If empty, every course of the semester is selected.
+
+    Returns:
+        tuple[str, list[tuple[str, str]]]: The semester and (name, id) of selected courses.
+    """
+    if not subjects:
+        return '', []
+    if semester is None:
+        semester = max(subjects, key=_semester_order)
+    patterns = [re.compile(pattern) for pattern in patterns]
+    return semester, [
+        (name, id_) for name, id_ in subjects.get(semester, [])
+        if not patterns or any(pattern.search(name) for pattern in patterns)
+    ]
+
+
+def _groups(materials: list[tuple[str, LectureMaterial]], destination: str) -> list[tuple[str, list[int]]]:
+    """Groups the materials by directory, since runners save to one directory. (Directory -> indexes)"""
+    return [
+        (
+            os.path.join(destination, directory) if directory else destination,
+            [k for k, (d, _) in enumerate(materials) if d == directory]
+        )
+        for directory in dict.fromkeys(directory for directory, _ in materials)
+    ]
+
+
+def probe(
+    materials: list[tuple[str, LectureMaterial]], destination: str, ledger: DownloadLedger | None
+) -> list[ProbedMaterial]:
+    """Probes size, content type and validator of the materials, and prints them."""
+    probes: dict[int, ProbedMaterial] = {}
+    for target_dir, indexes in _groups(materials, destination):
+        group_probes = MaterialProber().runner([materials[k][1] for k in indexes], target_dir, ledger)
+        for k, probed in zip(indexes, group_probes):
+            probes[k] = probed
+            emit(
+                'probe', file=os.path.join(materials[k][0], materials[k][1].name),
+                size=probed.probe.size, remaining=probed.remaining, content_type=probed.probe.content_type
+            )
+    return [probes[k] for k in range(len(materials))]
+
+
+def download(
+    materials: list[tuple[str, LectureMaterial]], destination: str, config: ConfigParser,
+    ledger: DownloadLedger, progress_interval: float, metrics: DownloadMetrics,
+    metrics_prom: str | None = None, control: TransferControl | None = None,
+    sizes: list[int | None] | None = None, sink_type: SinkType = SinkType.DIRECTORY
+) -> list[tuple[bool, str]]:
+    """
+    Downloads the materials, with the download settings of the config.
+
+    Args:
+        materials: The materials, with the directory (relative to destination) to save each.
+        destination: The directory to save.
+        config: The configuration. (Shared with GUI)
+        ledger: The ledger of downloaded materials.
+        progress_interval: Seconds between progress outputs. 0 means no output.
+        metrics: The metrics of the run, recorded while downloading.
+        metrics_prom: The Prometheus text file, updated with progress outputs.
+        control: The token to pause, resume or cancel the download.
+        sizes: The remaining size of each material, if probed.
+        sink_type: How the materials are saved. Archives are written by the thread engine,
+            without the ledger.
+
+    Returns:
+        list[tuple[bool, str]]: The result of each material.
+    """
+    download_config = config['download']
+    options = {
+        'segments': download_config.getint('segments', fallback=SEGMENT_COUNT),
+        'min_chunk_size': download_config.getint('min_chunk_size', fallback=MIN_CHUNK_SIZE),
+        'max_chunk_size': download_config.getint('max_chunk_size', fallback=MAX_CHUNK_SIZE),
+        'ledger': ledger,
+        'store': BlobStore(store_dir) if (store_dir := download_config.get('dedup_store')) else None,
+        'scheduling': SchedulingPolicy(download_config.get('scheduling', fallback=SchedulingPolicy.FIFO.value)),
+        'retry_budget': download_config.getint('retry_budget', fallback=RETRY_BUDGET),
+        'fast_hash': download_config.get('fast_hash', fallback=''),
+        'checksum_manifest': download_config.getboolean('checksum_manifest', fallback=False),
+        'write_buffers': download_config.getint('write_buffers', fallback=WRITE_BUFFERS),
+        'fsync': download_config.getboolean('fsync', fallback=False),
+        'metrics': metrics,
+        'auto_tune': download_config.getboolean('auto_tune', fallback=False),
+        'control': control,
+    }
+    if sink_type is not SinkType.DIRECTORY:
+        options['ledger'] = options['store'] = None
+    is_async = sink_type is SinkType.DIRECTORY and download_config.get('engine', fallback='thread') == 'asyncio'
+    if is_async:
+        options['connections_per_host'] =\
+            download_config.getint('connections_per_host', fallback=CONNECTIONS_PER_HOST)
+
+    board = ProgressBoard()
+    names = [os.path.join(directory, material.name) for directory, material in materials]
+    stopped = threading.Event()
+
+    def print_progress():
+        while not stopped.wait(progress_interval):
+            for index, status in sorted(board.take().items()):
+                emit('progress', file=names[index], status=status)
+            received, expected, eta = metrics.estimate()
+            if expected is not None:
+                emit('total', received=received, expected=expected, eta=None if eta is None else round(eta, 1))
+            if metrics_prom:
+                metrics.write_prometheus(metrics_prom)
+
+    if sink_type is SinkType.TAR:  # One stream of every course, with a directory of each
+        groups = [(destination, list(range(len(materials))))]
+        tar_sink = TarSink(sys.stdout.buffer)
+    else:
+        groups = _groups(materials, destination)
+        tar_sink = None
+
+    results: list[tuple[bool, str]] = []
+    printer = threading.Thread(target=print_progress, daemon=True)
+    if progress_interval > 0:
+        printer.start()
+    try:
+        for target_dir, indexes in groups:
+            works = [(*materials[k][1], board.reporter(k)) for k in indexes]
+            if tar_sink is not None:
+                works = [
+                    ('/'.join(filter(None, (materials[k][0], name))), *work)
+                    for k, (name, *work) in zip(indexes, works)
+                ]
+            group_options = options | {'sizes': [sizes[k] for k in indexes]} if sizes is not None else options
+            if sink_type is SinkType.ZIP:
+                os.makedirs(destination, exist_ok=True)
+                path = os.path.join(destination, archive_name(materials[indexes[0]][0], SinkType.ZIP))
+                sink = open_archive(SinkType.ZIP, path)
+            else:
+                os.makedirs(target_dir, exist_ok=True)
+                sink = tar_sink
+            try:
+                if is_async:
+                    group_results = asyncio.run(AsyncFileDownloader().runner(works, target_dir, **group_options))
+                else:
+                    group_results = FileDownloader().runner(works, target_dir, **group_options, sink=sink)
+            finally:
+                if sink_type is SinkType.ZIP:
+                    sink.close()
+            for k, (success, text) in zip(indexes, group_results):
+                emit('result', file=names[k], success=success, status=text)
+            results += group_results
+    finally:
+        stopped.set()
+        if printer.is_alive():
+            printer.join()
+        if tar_sink is not None:
+            tar_sink.close()
+            if tar_sink.broken:  # The file which broke it is failed, so the exit code is of failure
+                emit('error', message='tar 스트림 손상 (이어받을 수 없는 파일)')
+    return results
+
+
+def _install_signal_handlers(control: TransferControl) -> None:
+    """Handles signals by the control. (Handlers only set flags, so nothing is printed in them)"""
+    def cancel(*_):
+        control.cancel()
+        signal.signal(signal.SIGINT, signal.default_int_handler)  # Ctrl+C again stops at once
+
+    signal.signal(signal.SIGINT, cancel)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda *_: control.pause())
+        signal.signal(signal.SIGUSR2, lambda *_: control.resume())
+
+
+def _safe_dir_name(name: str) -> str:
+    return re.sub(r'[\\/:*?"<>|]', '_', name).strip(' .') or '_'
+
+
+def main(argv: list[str] | None = None) -> int:
+    global _events  # pylint: disable = global-statement
+    args = _parse_args(argv)
+    config = _load_config()
+    sink_type = SinkType(args.sink or config['download'].get('sink', fallback=SinkType.DIRECTORY.value))
+    if sink_type is SinkType.TAR:
+        _events = sys.stderr
+    destination = args.destination or config['download'].get('destination', '') or os.getcwd()
+    destination = os.path.abspath(os.path.expanduser(destination)) + PATHSEP
+    try:
+        _apply_limits(config)
+    except ValueError as e:
+        emit('error', message='설정 파일의 제한 값 오류', detail=str(e))
+        return EXIT_BAD_CONFIG
+    if fast_hash := config['download'].get('fast_hash', fallback=''):
+        try:
+            new_hash(fast_hash)
+        except ValueError as e:
+            emit('error', message='설정 파일의 해시 알고리즘 오류', detail=str(e))
+            return EXIT_BAD_CONFIG
+
+    try:
+        canvas_session, learningx_session = login(args, config)
+    except LoginFailed as e:
+        emit('login', status='failed', message=str(e))
+        return EXIT_LOGIN_FAILED
+
+    subjects = CanvasSubjectGetter().runner(canvas_session)
+    semester, courses = select_courses(subjects, args.semester, args.course)
+    if not courses:
+        emit('error', message='선택된 과목 없음', semesters=sorted(subjects, key=_semester_order))
+        return EXIT_NOT_FOUND
+
+    file_info_getter = CanvasFileInfoGetter()
+    materials: list[tuple[str, LectureMaterial]] = []
+    for course_name, course_id in courses:
+        course_materials = file_info_getter.runner(canvas_session, learningx_session, course_id)
+        emit(
+            'course', semester=semester, name=course_name, id=course_id,
+            materials=[{'name': m.name, 'type': m.type_.name.lower(), 'url': m.url} for m in course_materials]
+        )
+        # Archives are named (or tar directories) by the course
+        directory = _safe_dir_name(course_name) if args.course_dirs or sink_type is not SinkType.DIRECTORY else ''
+        materials += [(directory, material) for material in course_materials]
+    if args.list or not materials:
+        return 0
+
+    ledger = DownloadLedger(LEDGER_FILE)
+    sizes = [
+        remaining for _, remaining
+        in probe(materials, destination, ledger if sink_type is SinkType.DIRECTORY else None)
+    ]
+    expected = sum(size for size in sizes if size is not None)
+    if sink_type is not SinkType.TAR and (free := free_space(destination)) is not None and expected > free:
+        ledger.close()
+        emit('error', message='저장 공간 부족', required=expected, free=free)
+        return EXIT_NO_SPACE
+
+    metrics = DownloadMetrics(lambda level, reason: emit('tuning', concurrency=level, reason=reason))
+    metrics.expect(expected)
+    control = TransferControl()
+    _install_signal_handlers(control)
+    try:
+        results = download(
+            materials, destination, config, ledger, args.progress_interval, metrics, args.metrics_prom,
+            control, sizes, sink_type
+        )
+    finally:
+        ledger.close()
+        if args.metrics_json:
+            metrics.write_json(args.metrics_json)
+        if args.metrics_prom:
+            metrics.write_prometheus(args.metrics_prom)
+    cancelled = sum(text == CANCELLED_TEXT for _, text in results)
+    failed = sum(not success for success, _ in results) - cancelled
+    report = metrics.report()
+    emit(
+        'done', succeeded=len(results) - failed - cancelled, failed=failed, cancelled=cancelled,
+        bytes=report['bytes'], wall_time=report['wall_time'], retries=report['retries'],
+        connections=sum(pool['connections'] for pool in report['pools'].values()),
+        reused_connections=sum(pool['reused'] for pool in report['pools'].values())
+    )
+    if failed:
+        return EXIT_FAILED
+    return EXIT_CANCELLED if cancelled else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
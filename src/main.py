@@ -1,13 +1,11 @@
 # pylint: disable = import-error
-from PySide6.QtCore import QTimer, Signal, QEvent
-from PySide6.QtGui import QStandardItem
+from PySide6.QtCore import QFileSystemWatcher, QTimer, Signal, QEvent
 from PySide6.QtWidgets import (
     QApplication, QWidget, QMainWindow,
-    QDialog, QFileDialog, QProgressDialog, QMessageBox
+    QDialog, QFileDialog, QProgressDialog, QMessageBox, QMenu
 )
 
-from configparser import ConfigParser
-from collections.abc import Callable
+from configparser import ConfigParser, Error as ConfigError
 from typing import Iterable
 import os
 import subprocess
@@ -22,9 +20,25 @@ from universal_main.universal_constants import (
 from pyside_commons import ExceptionBridge
 from models import Files, CanvasSubjectsModel
 from workers import LectureMaterial, MaterialTypes
-from workers.canvas import CanvasLoginWorker, CanvasSubjectGetter, CanvasFileInfoGetter
-from workers.commons import FileDownloader
-from workers.knu import KNUIdPwLoginWorker, KNULoginPushSender, KNUPushLoginWorker
+from workers.checksums import new_hash
+from workers.async_commons import CONNECTIONS_PER_HOST
+from workers.commons import SEGMENT_COUNT, MIN_CHUNK_SIZE, MAX_CHUNK_SIZE, ProbedMaterial, free_space
+from workers.concurrency import HostLimiter, DEFAULT_HOST_CONNECTIONS
+from workers.control import CANCELLED_TEXT, TransferControl
+from workers.ledger import DownloadLedger
+from workers.metrics import DownloadMetrics
+from workers.progress import ProgressBoard, REFRESH_INTERVAL, format_duration, format_size
+from workers.retry import RETRY_BUDGET
+from workers.scheduling import SchedulingPolicy
+from workers.sinks import SinkType, archive_name, open_archive
+from workers.store import BlobStore
+from workers.throttle import BandwidthLimiter
+from workers.writer import WRITE_BUFFERS
+from workers.qt import (
+    KNUIdPwLoginWorker, KNULoginPushSender, KNUPushLoginWorker,
+    CanvasLoginWorker, CanvasSubjectGetter, CanvasFileInfoGetter,
+    MaterialProber, FileDownloader, AsyncFileDownloader
+)
 
 os.chdir(PROGRAM_DIR)
 
@@ -228,10 +242,14 @@ class LoginWin(QDialog, Ui_LoginWin):
         super().closeEvent(event)
 
 class MainWin(QMainWindow, Ui_MainWin):
+    __SCHEDULING_POLICIES = (
+        SchedulingPolicy.FIFO, SchedulingPolicy.SHORTEST_FIRST, SchedulingPolicy.LONGEST_FIRST
+    )
+
     __CONFIG_DIR = DATADIR + 'hys.LectureMaterialDownloader/'
     __CONFIG_FILE = __CONFIG_DIR + 'config.ini'
-
-    download_result = Signal(QStandardItem, str)
+    __LEDGER_FILE = __CONFIG_DIR + 'ledger.sqlite3'
+    __METRICS_INTERVAL = 1000  # ms, of refreshing the Prometheus textfile while downloading
 
     def __init__(self):
         super().__init__()
@@ -241,20 +259,42 @@ class MainWin(QMainWindow, Ui_MainWin):
 
         self.__config = ConfigParser()
         self.__load_config()
+        self.__rate_limited_hosts: set[str] = set()  # Of the applied limits, to lift them when removed
+        self.__connection_limited_hosts: set[str] = set()
+        try:
+            self.__apply_limits()
+        except ValueError as e:  # Runs without the limits, until the config file is fixed
+            QMessageBox.warning(self, '설정 파일 오류', f'제한 값 오류: {e}')
+        # Limits edited in the config file are applied at once, even to the download in progress
+        self.__config_watcher = QFileSystemWatcher(self)
+        self.__watch_config()
 
         self.__login_win = LoginWin(self, self.__config)
+        self.__ledger = DownloadLedger(self.__LEDGER_FILE)
 
         self.__files = Files()
         self.__canvas_subjects = CanvasSubjectsModel()
+        self.__progress_board = ProgressBoard()
+        self.__progress_timer = QTimer(self)
+        self.__progress_timer.setInterval(REFRESH_INTERVAL)
+        self.__metrics_timer = QTimer(self)  # Keeps the textfile fresh, to be scraped during long downloads
+        self.__metrics_timer.setInterval(self.__METRICS_INTERVAL)
 
         self.__canvas_session: str = ''
         self.__learningx_session: str = ''
         self.__all_subjects: dict[str, list[tuple[str, str]]] = {}
+        self.__files_subject = ''  # Name of the subject of the listed files
+        self.__control: TransferControl | None = None  # Of the download in progress
+        self.__download_rows: list[int] = []  # Rows of the files of the download in progress
+        self.__metrics: DownloadMetrics | None = None  # Of the download in progress, after probing
+        self.__closing = False  # Waiting for the workers to be finished, to close
 
         # Workers
         self.__canvas_subject_getter = CanvasSubjectGetter(self)
         self.__canvas_file_info_getter = CanvasFileInfoGetter(self)
+        self.__material_prober = MaterialProber(self)
         self.__file_downloader = FileDownloader(self)
+        self.__async_file_downloader = AsyncFileDownloader(self)
 
         self.tvFile.setModel(self.__files)
         self.cbSubject.setModel(self.__canvas_subjects)
@@ -275,13 +315,21 @@ class MainWin(QMainWindow, Ui_MainWin):
         self.btnSelect.clicked.connect(self.__select_or_unselect_all)
         self.btnReverse.clicked.connect(self.__reverse_selection)
         self.btnDownload.clicked.connect(self.__download)
+        self.btnPause.clicked.connect(self.__pause_or_resume)
+        self.btnCancel.clicked.connect(self.__cancel_download)
+        self.tvFile.customContextMenuRequested.connect(self.__show_file_menu)
 
         self.btnSetSubject.clicked.connect(self.__set_subject)
 
-        self.download_result.connect(self.__on_download_result)
+        self.__progress_timer.timeout.connect(self.__refresh_progress)
+        self.__metrics_timer.timeout.connect(self.__refresh_metrics_textfile)
+
+        self.__config_watcher.fileChanged.connect(self.__reload_limits)
+        self.__config_watcher.directoryChanged.connect(self.__reload_limits)
 
         self.__set_item_selection_selected(False)
         self.__set_subject_selection_enabled(False)
+        self.__set_download_control_enabled(False)
 
     # Display related functions
     def showEvent(self, event):
@@ -300,6 +348,24 @@ class MainWin(QMainWindow, Ui_MainWin):
         self.btnReverse.setEnabled(state)
         self.btnDownload.setEnabled(state)
 
+    def __set_download_control_enabled(self, state: bool):
+        self.btnPause.setText('일시정지')
+        self.btnPause.setEnabled(state)
+        self.btnCancel.setEnabled(state)
+
+    def __set_downloading(self, state: bool):
+        """Switches the controls, between selecting files and controlling the download."""
+        self.cbSemester.setEnabled(not state)
+        self.btnSetDst.setEnabled(not state)
+        self.__set_subject_selection_enabled(not state)
+        self.__set_item_selection_selected(not state)
+        self.__set_download_control_enabled(state)
+        if not state:
+            self.statusbar.clearMessage()
+            self.__control = None
+            self.__metrics = None
+            self.__download_rows = []
+
     def __on_semester_changed(self):
         self.__set_item_selection_selected(False)
         self.__files.clear()
@@ -309,8 +375,41 @@ class MainWin(QMainWindow, Ui_MainWin):
         self.__set_item_selection_selected(False)
         self.__files.clear()
 
-    def __on_download_result(self, item: QStandardItem, progress: str):
-        item.setText(progress)
+    def __refresh_progress(self):
+        self.__files.set_statuses(self.__progress_board.take())
+        if self.__metrics is not None and not self.__control.interrupted:
+            received, expected, eta = self.__metrics.estimate()
+            self.statusbar.showMessage(
+                f'강의자료 다운로드 중 ({format_size(received)} / {format_size(expected)}'
+                + (f', 남은 시간 {format_duration(eta)})' if eta is not None else ')')
+            )
+
+    def __refresh_metrics_textfile(self):
+        if self.__metrics is None or not (path := self.__config['download'].get('metrics_textfile', fallback='')):
+            return
+        try:
+            self.__metrics.write_prometheus(path)
+        except OSError as e:  # Warned once, not every time
+            self.__metrics_timer.stop()
+            QMessageBox.warning(self, '통계 저장 실패', str(e))
+
+    def __show_file_menu(self, pos):
+        if self.__control is None or self.__control.cancelled:
+            return
+        control = self.__control
+        menu = QMenu(self)
+        if (row := self.tvFile.indexAt(pos).row()) in self.__download_rows:
+            file_control = control.child(self.__download_rows.index(row))
+            if not file_control.cancelled:
+                if not file_control.paused:
+                    menu.addAction('이 파일 일시정지', file_control.pause)
+                elif not control.paused:  # Paused by itself, not by the batch
+                    menu.addAction('이 파일 재개', file_control.resume)
+                menu.addAction('이 파일 취소', file_control.cancel)
+                menu.addSeparator()
+        menu.addAction('모두 재개' if control.paused else '모두 일시정지', self.__pause_or_resume)
+        menu.addAction('모두 취소', self.__cancel_download)
+        menu.exec(self.tvFile.viewport().mapToGlobal(pos))
     # end display
 
     def __set_destination(self):
@@ -362,13 +461,18 @@ class MainWin(QMainWindow, Ui_MainWin):
                 progress_dialog.reset()
                 return
 
+            self.__files_subject = subject_name
+            destination = self.__config['download']['destination']
             for name, type, url in materials:
-                self.__files.add_data(name, type, url)
+                self.__files.add_data(
+                    name, type, url, self.__ledger.is_present(url, os.path.join(destination, name))
+                )
             for k in range(self.__files.columnCount()):
                 self.tvFile.resizeColumnToContents(k)
             self.__set_item_selection_selected(True)
             progress_dialog.reset()
 
+        subject_name = self.cbSubject.currentText()
         progress_dialog = QProgressDialog('강의자료 목록 가져오는 중', None, 0, 0, self)
         self.__canvas_file_info_getter.start(
             self.__canvas_session,
@@ -418,34 +522,245 @@ class MainWin(QMainWindow, Ui_MainWin):
 
     # Common workers
     def __download(self):
+        def close_sink():
+            if (sink := options.get('sink')) is None:
+                return
+            try:
+                sink.close()
+                if sink.broken:  # Renamed, so it's not taken as a valid archive
+                    os.replace(archive_path, f'{archive_path}.failed')
+                    QMessageBox.warning(
+                        self, '압축 파일 손상', f'이어받을 수 없는 파일이 있어 압축 파일이 손상됨\n\n{archive_path}.failed'
+                    )
+            except OSError as e:
+                QMessageBox.warning(self, '압축 파일 저장 실패', str(e))
+
         def error_cleanup():
-            progress_dialog.reset()
+            self.__progress_timer.stop()
+            self.__metrics_timer.stop()
+            self.__refresh_progress()
+            close_sink()
+            self.__write_metrics(metrics)
+            self.__set_downloading(False)
 
         def end(download_results):
-            self.__files.set_result(download_results)
-            progress_dialog.reset()
+            self.__progress_timer.stop()
+            self.__metrics_timer.stop()
+            self.__refresh_progress()
+            close_sink()
+            self.__files.set_result(download_results, rows=rows)
+            self.__write_metrics(metrics)
+            self.__set_downloading(False)
+            failures = [
+                f'{name} ({text})' for (name, *_), (success, text) in zip(works, download_results)
+                if not success and text != CANCELLED_TEXT
+            ]
+            if failures:
+                QMessageBox.warning(
+                    self, '다운로드 실패', f'{len(failures)}개 파일 다운로드 실패\n\n' + '\n'.join(failures)
+                )
 
-        def new_callback(index: int) -> Callable[[str], None]:
-            def inner(progress: str):
-                self.download_result.emit(self.__files.item(index, 4), progress)
-            return inner
+        def probed(probes: tuple[ProbedMaterial, ...]):
+            nonlocal archive_path
+            self.__files.set_sizes({row: probe.size for row, (probe, _) in zip(rows, probes)})
+            if self.__control.cancelled:
+                self.__set_downloading(False)
+                return
+            sizes = [remaining for _, remaining in probes]
+            expected = sum(size for size in sizes if size is not None)
+            if (free := free_space(download_config['destination'])) is not None and expected > free:
+                self.__set_downloading(False)
+                QMessageBox.warning(
+                    self, '저장 공간 부족',
+                    f'다운로드에 {format_size(expected)} 필요 (남은 공간: {format_size(free)})'
+                )
+                return
+            if sink_type is not SinkType.DIRECTORY:
+                archive_path = os.path.join(
+                    download_config['destination'], archive_name(self.__files_subject, sink_type)
+                )
+                try:
+                    os.makedirs(download_config['destination'], exist_ok=True)
+                    options['sink'] = open_archive(sink_type, archive_path)
+                except OSError as e:
+                    self.__set_downloading(False)
+                    QMessageBox.warning(self, '압축 파일 생성 실패', str(e))
+                    return
+            metrics.expect(expected)
+            downloader.start(
+                works, download_config['destination'], **options, sizes=sizes,
+                end=end, err=error_cleanup
+            )
+            self.statusbar.showMessage('강의자료 다운로드 중')
+            self.__metrics = metrics
+            self.__progress_timer.start()
+            if download_config.get('metrics_textfile', fallback=''):
+                self.__metrics_timer.start()
+
+        def probe_failed():
+            self.__set_downloading(False)
 
         selected: Iterable[tuple[int, str, MaterialTypes, str]] = self.__files.info_of_selected
         if not selected:
             QMessageBox.information(self, '알림', '선택된 파일이 없음')
             return
 
-        progress_dialog = QProgressDialog('강의자료 다운로드 중', None, 0, 0, self)
-        works = [(name, type_, url, new_callback(idx)) for idx, name, type_, url in selected]
-        self.__file_downloader.start(
-            works, self.__config['download']['destination'], end=end, err=error_cleanup
+        try:
+            self.__apply_limits()
+        except ValueError as e:
+            QMessageBox.warning(self, '설정 파일 오류', f'제한 값 오류: {e}')
+            return
+        if fast_hash := self.__config['download'].get('fast_hash', fallback=''):
+            try:
+                new_hash(fast_hash)
+            except ValueError as e:
+                QMessageBox.warning(self, '설정 파일 오류', f'해시 알고리즘 오류: {e}')
+                return
+
+        self.__progress_board.take()  # Drop statuses left from previous download
+        works = [
+            (name, type_, url, self.__progress_board.reporter(idx)) for idx, name, type_, url in selected
+        ]
+        # Results are set to these rows, as checks can be changed while downloading
+        rows = [idx for idx, *_ in selected]
+        download_config = self.__config['download']
+        metrics = DownloadMetrics()
+        options = {
+            'segments': download_config.getint('segments', fallback=SEGMENT_COUNT),
+            'min_chunk_size': download_config.getint('min_chunk_size', fallback=MIN_CHUNK_SIZE),
+            'max_chunk_size': download_config.getint('max_chunk_size', fallback=MAX_CHUNK_SIZE),
+            'ledger': self.__ledger,
+            'store': BlobStore(store_dir) if (store_dir := download_config.get('dedup_store')) else None,
+            'scheduling': self.__SCHEDULING_POLICIES[self.cbSchedule.currentIndex()],
+            'retry_budget': download_config.getint('retry_budget', fallback=RETRY_BUDGET),
+            'fast_hash': download_config.get('fast_hash', fallback=''),
+            'checksum_manifest': download_config.getboolean('checksum_manifest', fallback=False),
+            'write_buffers': download_config.getint('write_buffers', fallback=WRITE_BUFFERS),
+            'fsync': download_config.getboolean('fsync', fallback=False),
+            'metrics': metrics,
+            'auto_tune': download_config.getboolean('auto_tune', fallback=False),
+            'control': TransferControl(),
+        }
+        sink_type = SinkType(download_config.get('sink', fallback=SinkType.DIRECTORY.value))
+        archive_path = ''  # Of the sink, once opened
+        if sink_type is not SinkType.DIRECTORY:  # Files of the subject are written into an archive
+            options['ledger'] = options['store'] = None
+            options['sink'] = None  # Opened after probing, only the thread engine writes archives
+            downloader = self.__file_downloader
+        elif download_config.get('engine', fallback='thread') == 'asyncio':
+            downloader = self.__async_file_downloader
+            options['connections_per_host'] =\
+                download_config.getint('connections_per_host', fallback=CONNECTIONS_PER_HOST)
+        else:
+            downloader = self.__file_downloader
+        # Sizes are probed first, to check free space and to estimate the time
+        self.__material_prober.start(
+            [work[:3] for work in works], download_config['destination'], options['ledger'],
+            end=probed, err=probe_failed
         )
-        progress_dialog.exec()
+        self.__control = options['control']
+        self.__download_rows = rows
+        self.__set_downloading(True)
+        self.statusbar.showMessage('파일 크기 확인 중')
+
+    def __pause_or_resume(self):
+        if self.__control.paused:
+            self.__control.resume()
+            self.btnPause.setText('일시정지')
+            self.statusbar.showMessage('강의자료 다운로드 중')
+        else:
+            self.__control.pause()
+            self.btnPause.setText('재개')
+            self.statusbar.showMessage('일시정지됨')
+
+    def __cancel_download(self):
+        self.__control.cancel()
+        self.__set_download_control_enabled(False)
+        self.statusbar.showMessage('취소 중')
+
+    def __write_metrics(self, metrics: DownloadMetrics):
+        download_config = self.__config['download']
+        try:
+            if path := download_config.get('metrics_report', fallback=''):
+                metrics.write_json(path)
+            if path := download_config.get('metrics_textfile', fallback=''):
+                metrics.write_prometheus(path)
+        except OSError as e:
+            QMessageBox.warning(self, '통계 저장 실패', str(e))
+
+    def __apply_limits(self):
+        limiter = BandwidthLimiter()
+        limiter.set_rate(self.__config['download'].getint('rate_limit', fallback=0))
+        rates = dict(self.__config['host_rate_limit']) if self.__config.has_section('host_rate_limit') else {}
+        for host in self.__rate_limited_hosts - rates.keys():  # Removed from the config
+            limiter.set_host_rate(host, 0)
+        for host, rate in rates.items():
+            limiter.set_host_rate(host, int(rate))
+        self.__rate_limited_hosts = set(rates)
+
+        host_limiter = HostLimiter()
+        host_limiter.set_default_limit(
+            self.__config['download'].getint('host_connections', fallback=DEFAULT_HOST_CONNECTIONS)
+        )
+        limits = dict(self.__config['host_connections']) if self.__config.has_section('host_connections') else {}
+        for host in self.__connection_limited_hosts - limits.keys():
+            host_limiter.set_limit(host, 0)
+        for host, limit in limits.items():
+            host_limiter.set_limit(host, int(limit))
+        self.__connection_limited_hosts = set(limits)
+
+    def __watch_config(self):
+        """Watches the config file, or the nearest folder of it until the file is made."""
+        path = self.__CONFIG_FILE
+        while not os.path.exists(path) and os.path.dirname(path) != path:
+            path = os.path.dirname(path)
+        # Editors may replace the file, which is then no longer watched
+        if path not in self.__config_watcher.files() + self.__config_watcher.directories():
+            self.__config_watcher.addPath(path)
+
+    def __reload_limits(self):
+        """Applies the limits of the edited config file. Other settings are kept as loaded."""
+        self.__watch_config()
+        config = ConfigParser()
+        try:
+            if not config.read(self.__CONFIG_FILE):
+                return
+        except ConfigError:  # Being edited, applied when saved again
+            return
+        for key in ('rate_limit', 'host_connections'):
+            if config.has_option('download', key):
+                self.__config['download'][key] = config['download'][key]
+        for section in ('host_rate_limit', 'host_connections'):
+            self.__config[section] = config[section] if config.has_section(section) else {}
+        try:
+            self.__apply_limits()
+        except ValueError:
+            self.statusbar.showMessage('설정 파일의 제한 값 오류')
 
     def __load_default_config(self):
         self.__config['download'] = {
-            'destination': USER_DIR
+            'destination': USER_DIR,
+            'segments': str(SEGMENT_COUNT),
+            'min_chunk_size': str(MIN_CHUNK_SIZE),
+            'max_chunk_size': str(MAX_CHUNK_SIZE),
+            'rate_limit': '0',
+            'dedup_store': '',
+            'engine': 'thread',
+            'connections_per_host': str(CONNECTIONS_PER_HOST),
+            'scheduling': SchedulingPolicy.FIFO.value,
+            'retry_budget': str(RETRY_BUDGET),
+            'fast_hash': '',
+            'checksum_manifest': 'no',
+            'host_connections': str(DEFAULT_HOST_CONNECTIONS),
+            'write_buffers': str(WRITE_BUFFERS),
+            'fsync': 'no',
+            'metrics_report': '',
+            'metrics_textfile': '',
+            'auto_tune': 'no',
+            'sink': SinkType.DIRECTORY.value
         }
+        self.__config['host_rate_limit'] = {}
+        self.__config['host_connections'] = {}
         self.__config['credentials'] = {
             'username': '',
             'auto_login': 'False',
@@ -458,17 +773,40 @@ class MainWin(QMainWindow, Ui_MainWin):
         else:
             self.__load_default_config()
         self.lbDst.setText(self.__config['download']['destination'])
+        self.cbSchedule.setCurrentIndex(self.__SCHEDULING_POLICIES.index(
+            SchedulingPolicy(self.__config['download'].get('scheduling', SchedulingPolicy.FIFO.value))
+        ))
 
     def __save_config(self):
+        self.__config['download']['scheduling'] =\
+            self.__SCHEDULING_POLICIES[self.cbSchedule.currentIndex()].value
         os.makedirs(self.__CONFIG_DIR, exist_ok=True)
         with open(self.__CONFIG_FILE, 'w', encoding='utf-8') as file:
             self.__config.write(file)
+        self.__watch_config()
     # end Common workers
 
     def closeEvent(self, event: QEvent):
         # self.__logout()
+        if self.__control is not None:
+            self.__control.cancel()
+        # The ledger is closed after the workers using it are finished, so hidden until closed again by them
+        if running := [
+            worker for worker in (self.__material_prober, self.__file_downloader, self.__async_file_downloader)
+            if worker.isRunning()
+        ]:
+            if not self.__closing:
+                self.__closing = True
+                for worker in running:
+                    worker.finished.connect(self.close)
+            self.hide()
+            event.ignore()
+            return
         self.__save_config()
+        self.__ledger.close()
         event.accept()
+        if self.__closing:  # A hidden window being closed doesn't quit the application by itself
+            QApplication.quit()
 
 
 def main(app):
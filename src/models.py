@@ -1,10 +1,11 @@
 from PySide6.QtCore import Qt
 from PySide6.QtGui import QStandardItemModel, QStandardItem
 
-from typing import Union
+from typing import Mapping, Union
 
 from pyside_commons import WorkModelBase
 from workers import MaterialTypes
+from workers.progress import format_size
 
 
 class HelloLMSSubjectsModel(QStandardItemModel):
@@ -56,13 +57,23 @@ class Files(WorkModelBase):
         MaterialTypes.VIDEO: '동영상',
     }
 
+    _PRESENT_TEXT = '이미 있음'
+
     def __init__(self):
-        self._header = ('No.', '종류', '파일명')
+        self._header = ('No.', '종류', '파일명', '크기')
         super().__init__(True, False)
 
-    def add_data(self, name: str, type: str, url: str):
+    def add_data(self, name: str, type: str, url: str, present: bool = False):
         # pylint: disable = arguments-differ
         super().add_data(
-            (str(self.rowCount() + 1), self.__TYPE_TO_NAME[type], name), (name, type, url),
+            (str(self.rowCount() + 1), self.__TYPE_TO_NAME[type], name, ''), (name, type, url),
             chk_state=Qt.Unchecked
         )
+        if present:
+            self.item(self.rowCount() - 1, self.columnCount() - 1).setText(self._PRESENT_TEXT)
+
+    def set_sizes(self, sizes: Mapping[int, int | None]):
+        """Shows the size of given rows. (row number -> size, None if unknown)"""
+        size_col = self.columnCount() - 2
+        for row, size in sizes.items():
+            self.item(row, size_col).setText('?' if size is None else format_size(size))
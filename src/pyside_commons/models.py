@@ -2,20 +2,34 @@ from PySide6.QtCore import Qt, QObject, Signal
 from PySide6.QtGui import QStandardItemModel, QStandardItem
 
 import itertools
+import threading
 from typing import\
-    Callable, Optional, Sequence, Iterable, Union, Any, List, Tuple
+    Callable, Optional, Sequence, Iterable, Mapping, Union, Any, Dict, List, Tuple
 
 
 class _StatusBridge(QObject):
-    _signal = Signal(tuple)
+    """
+    Bridges status of works in worker thread to main thread.
+
+    Statuses are coalesced: only the latest status of each work is kept,
+    and one signal delivers all statuses set until it is handled.
+    """
+    _signal = Signal()
 
     def __init__(self, parent):
         super().__init__(parent)
         self.__functions = {}
+        self.__lock = threading.Lock()
+        self.__pending: Dict[int, str] = {}
         self._signal.connect(self.__send_info)
 
     def __call__(self, progress_info: Tuple[int, str]):
-        self._signal.emit(progress_info)
+        work_id, progress_status = progress_info
+        with self.__lock:
+            emit = not self.__pending
+            self.__pending[work_id] = progress_status
+        if emit:
+            self._signal.emit()
 
     def register_func(self, work_id: int, function: Callable[[str], Any]):
         self.__functions[work_id] = function
@@ -23,9 +37,11 @@ class _StatusBridge(QObject):
     def clear_func(self):
         self.__functions = {}
 
-    def __send_info(self, info: Tuple[int, str]):
-        work_id, progress_status = info
-        self.__functions[work_id](progress_status)
+    def __send_info(self):
+        with self.__lock:
+            pending, self.__pending = self.__pending, {}
+        for work_id, progress_status in pending.items():
+            self.__functions[work_id](progress_status)
 
 
 class ModelBase(QStandardItemModel):
@@ -519,9 +535,12 @@ class WorkModelBase(InfoModelBase):
         def set_result(
             self,
             results: Sequence[Iterable],
-            disable_successed: bool = None
+            disable_successed: bool = None,
+            rows: Sequence[int] = None
         ) -> None:
-            Set results of each selected row.
+            Set results of each selected (or given) row.
+        def set_statuses(self, statuses: Mapping[int, str]) -> None:
+            Set status texts of rows at once.
         def del_successed(self) -> None:
             Remove successed work(s).
     """
@@ -612,10 +631,11 @@ class WorkModelBase(InfoModelBase):
     def set_result(
         self,
         results: Sequence[Iterable],
-        disable_successed: Optional[bool] = None
+        disable_successed: Optional[bool] = None,
+        rows: Optional[Sequence[int]] = None
     ) -> None:
         """
-        Set result of each selected row.
+        Set result of each selected (or given) row.
 
         Args:
             results:
@@ -628,21 +648,47 @@ class WorkModelBase(InfoModelBase):
             disable_successed:
                 If this is true, successed row is disabled.
                 If not given, it will be followed class's configuration.
+            rows:
+                The rows of the results.
+                If not given, the checked rows are used.
+                (Pass the rows of the works, if checks can be changed while working.)
         """
         if disable_successed is None:
             disable_successed = self.__disable_successed
-        result_index = 0
+        if rows is None:
+            rows = self.checked_row
         last_col = self.columnCount() - 1
-        for row in range(self.rowCount()):
-            if self.item(row, 0).checkState() == Qt.Checked:
-                successed, text = results[result_index]
-                if successed:
-                    self.item(row, 0).setCheckState(Qt.Unchecked)
-                    self.__successed_row.add(row)
-                    if disable_successed:
-                        self.item(row, 0).setEnabled(False)
+        for row, (successed, text) in zip(rows, results):
+            if successed:
+                self.item(row, 0).setCheckState(Qt.Unchecked)
+                self.__successed_row.add(row)
+                if disable_successed:
+                    self.item(row, 0).setEnabled(False)
+            self.item(row, last_col).setText(text)
+
+    def set_statuses(self, statuses: Mapping[int, str]) -> None:
+        """
+        Set status texts of given rows at once.
+
+        Only one dataChanged signal (for the status column) is emitted,
+        instead of one for each row.
+
+        Args:
+            statuses: The status text of each row. (row number -> text)
+        """
+        if not statuses:
+            return
+        last_col = self.columnCount() - 1
+        blocked = self.blockSignals(True)
+        try:
+            for row, text in statuses.items():
                 self.item(row, last_col).setText(text)
-                result_index += 1
+        finally:
+            self.blockSignals(blocked)
+        self.dataChanged.emit(
+            self.index(min(statuses), last_col), self.index(max(statuses), last_col),
+            [Qt.DisplayRole]
+        )
 
     def del_row(self, k: int) -> None:
         """
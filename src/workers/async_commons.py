@@ -0,0 +1,545 @@
+from collections import Counter, deque
+from collections.abc import Awaitable, Callable
+from typing import Any, Iterable, Sequence
+import asyncio
+import contextlib
+import itertools
+import os
+import threading
+import time
+import urllib.parse
+
+import aiohttp
+
+from . import MaterialTypes, hls
+from .commons import (
+    FILE_WRITE_SIZE, THROTTLED_WRITE_SIZE, SEGMENT_COUNT, MIN_CHUNK_SIZE, MAX_CHUNK_SIZE,
+    _PAUSED, _Bookkeeper, _ChunkSizer, _ContentHasher, _PartFile, _Segment, _cancelled, _conditional_headers,
+    _counting, _extract_range_from_headers, _failed, _interrupted, _remaining_size, _retry_connection,
+    _retry_response, _stream_headers, _stream_progress, _stream_resumed
+)
+from .concurrency import HostLimiter
+from .control import PAUSED_TEXT, TransferControl, TransferInterrupted
+from .http_client import HttpClient, PoolStats, TIMEOUT
+from .ledger import DownloadLedger
+from .metrics import DownloadMetrics, FileMetrics
+from .retry import RETRY_BUDGET, RetryBudget, backoff_delay
+from .runner import WorkerBase
+from .scheduling import SchedulingPolicy, schedule
+from .store import BlobStore
+from .throttle import BandwidthLimiter
+from .tuning import ConcurrencyTuner
+from .writer import WriterStage, WRITE_BUFFERS
+
+CONNECTIONS_PER_HOST = 16
+MAX_OPEN_FILES = 256
+
+_CONNECTION_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+
+async def _write_response(
+    response: aiohttp.ClientResponse, write: Callable[[bytes], Awaitable[Any]], control: TransferControl | None = None
+) -> int:
+    """
+    Writes body of the response, by given (async) write function. (asyncio version)
+
+    Returns:
+        int: The number of written bytes.
+
+    Raises:
+        TransferInterrupted: If the transfer is paused or cancelled.
+    """
+    limiter = BandwidthLimiter()
+    host = response.url.host
+    written = 0
+    async for chunk in response.content.iter_chunked(
+        THROTTLED_WRITE_SIZE if limiter.is_limited(host) else FILE_WRITE_SIZE
+    ):
+        if wait := limiter.reserve(host, len(chunk)):
+            await asyncio.sleep(wait)
+        if control is not None:
+            control.check()
+        await write(chunk)
+        written += len(chunk)
+    return written
+
+
+async def _get(
+    session: aiohttp.ClientSession, url: str, headers: dict[str, str], tuner: ConcurrencyTuner | None = None
+) -> aiohttp.ClientResponse:
+    """Sends GET request, holding a slot of the tuner (if any) and of HostLimiter until the response is released."""
+    slots = []
+    try:
+        if tuner is not None:
+            slots.append(await tuner.acquire_async())
+        slots.append(await HostLimiter().acquire_async(urllib.parse.urlsplit(url).hostname or ''))
+        response = await session.get(url, headers=headers)
+    except BaseException:
+        for slot in slots:
+            slot.release()
+        raise
+
+    release = response.release
+
+    def release_slot() -> Any:
+        try:
+            return release()
+        finally:
+            for slot in slots:
+                slot.release()
+    response.release = release_slot
+    return response
+
+
+class _PoolTracer:
+    """
+    Counts requests and new connections per host of the session. (asyncio version of HttpClient.pool_stats)
+
+    A request sent over a kept-alive connection of the connector is a pool hit.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()  # Read by the reports, from other threads
+        self.__counts: Counter[tuple[str, str]] = Counter()
+        self.config = aiohttp.TraceConfig()
+        self.config.on_request_start.append(self.__on_request_start)
+        self.config.on_connection_create_end.append(self.__on_connection_created)
+        self.config.on_connection_reuseconn.append(self.__on_connection_reused)
+
+    def pool_stats(self) -> dict[str, PoolStats]:
+        with self.__lock:
+            counts = Counter(self.__counts)
+        hosts = {host for host, _ in counts}
+        return {
+            host: PoolStats(counts[host, 'requests'], counts[host, 'connections'])
+            for host in sorted(hosts)
+        }
+
+    async def __on_request_start(self, _session, context, params: aiohttp.TraceRequestStartParams) -> None:
+        context.host = params.url.host or ''
+
+    async def __on_connection_created(self, _session, context, _params) -> None:
+        with self.__lock:
+            self.__counts[context.host, 'requests'] += 1
+            self.__counts[context.host, 'connections'] += 1
+
+    async def __on_connection_reused(self, _session, context, _params) -> None:
+        with self.__lock:
+            self.__counts[context.host, 'requests'] += 1
+
+
+class _AsyncWriter:
+    """
+    Write function of the asyncio engine, which doesn't block the event loop.
+
+    Data is handed to the writer stage without waiting while it has room,
+    otherwise (or without the stage) it's written in a thread.
+    Writes into memory (not staged) are done directly.
+    """
+
+    def __init__(self, write_many: Callable[[list[bytes]], Any], stage: WriterStage | None, staged: bool):
+        self.__write_many = write_many
+        self.__staged = staged
+        self.__queued = stage.writer(write_many) if stage is not None and staged else None
+
+    async def __call__(self, data: bytes) -> None:
+        if self.__queued is not None:
+            if not self.__queued.offer(data):  # Waits for the writer in a thread
+                await asyncio.to_thread(self.__queued, data)
+        elif self.__staged:
+            await asyncio.to_thread(self.__write_many, [data])
+        else:
+            self.__write_many([data])
+
+    async def flush(self) -> None:
+        """Waits until the queued data is written."""
+        if self.__queued is not None:
+            await asyncio.to_thread(self.__queued.flush)
+
+
+class AsyncFileDownloader(WorkerBase):
+    """
+    asyncio version of FileDownloader.
+
+    Multiplexes every transfer (and segment) on one event loop, instead of
+    blocking a thread per file. Takes the same arguments and reports through
+    the same result_callback, and concurrent connections are bounded per host.
+    """
+
+    async def runner(
+        self,
+        selected_files: Iterable[tuple[str, MaterialTypes, str, Callable[[str], Any]]],
+        destination_dir: str,
+        segments: int = SEGMENT_COUNT,
+        min_chunk_size: int = MIN_CHUNK_SIZE,
+        max_chunk_size: int = MAX_CHUNK_SIZE,
+        ledger: DownloadLedger | None = None,
+        store: BlobStore | None = None,
+        scheduling: SchedulingPolicy = SchedulingPolicy.FIFO,
+        connections_per_host: int = CONNECTIONS_PER_HOST,
+        retry_budget: int = RETRY_BUDGET,
+        fast_hash: str = '',
+        checksum_manifest: bool = False,
+        write_buffers: int = WRITE_BUFFERS,
+        fsync: bool = False,
+        metrics: DownloadMetrics | None = None,
+        auto_tune: bool = False,
+        control: TransferControl | None = None,
+        sizes: Sequence[int | None] | None = None
+    ):
+        async def request(
+            session: aiohttp.ClientSession, url: str, headers: dict[str, str], budget: RetryBudget,
+            file_metrics: FileMetrics
+        ) -> aiohttp.ClientResponse:
+            """Sends GET request, retrying transient failures within the budget of the file."""
+            if cookie := HttpClient().cookie_header(url):
+                headers = headers | {'Cookie': cookie}
+            attempt = 0
+            while True:
+                retry_after = None
+                try:
+                    response = await _get(session, url, headers, tuner)
+                except _CONNECTION_ERRORS:
+                    if not _retry_connection(budget, tuner):
+                        raise
+                else:
+                    if not _retry_response(response.status, 'Range' in headers, budget, file_metrics, tuner):
+                        return response
+                    retry_after = response.headers.get('Retry-After')
+                    response.release()
+                await asyncio.sleep(backoff_delay(attempt, retry_after))
+                attempt += 1
+
+        def writer_of(write_many: Callable[[list[bytes]], Any], staged: bool = True) -> '_AsyncWriter':
+            """
+            Makes write function, which writes by write_many in the writer stage (if enabled) or in a thread.
+            Writes into memory are not staged, and done directly.
+            """
+            return _AsyncWriter(_counting(write_many, metrics, tuner), stage, staged)
+
+        async def download_segment(
+            session: aiohttp.ClientSession, segment: _Segment, url: str, budget: RetryBudget,
+            file_metrics: FileMetrics, file_control: TransferControl
+        ) -> str | None:
+            attempt = 0
+            while segment.pending:
+                write = writer_of(segment.writer().write_many)
+                error = None
+                interrupted = False
+                try:
+                    async with await request(session, url, segment.headers(), budget, file_metrics) as response:
+                        if (reason := segment.check(response.status, response.headers)) is not None:
+                            return reason
+                        await _write_response(response, write, file_control)
+                except _CONNECTION_ERRORS:
+                    error = '연결 오류'
+                except TransferInterrupted:
+                    interrupted = True
+                finally:
+                    await write.flush()
+
+                # Keep received bytes, even on error
+                await asyncio.to_thread(segment.record, error, interrupted)
+                if error is None:
+                    attempt = 0
+                    continue
+                if not segment.retry(error, budget, tuner):
+                    return error
+                await asyncio.sleep(backoff_delay(attempt))
+                attempt += 1
+            return None
+
+        async def download_file(
+            session: aiohttp.ClientSession, open_files: asyncio.Semaphore,
+            name: str, type: MaterialTypes, url: str, result_callback: Callable[[str], Any],
+            budget: RetryBudget, file_metrics: FileMetrics, file_control: TransferControl
+        ):
+            target = f'{destination_dir}/{name}'
+            known = await asyncio.to_thread(book.known, url, target)
+            if known is not None and not known.validator:  # Can't be checked
+                return await asyncio.to_thread(book.reuse, url, target, known, result_callback)
+            part = await asyncio.to_thread(_PartFile, target, url, type, file_metrics, file_control)
+            if part.complete:
+                validator = part.state.validator
+                digests = await asyncio.to_thread(part.hash_complete, algorithms)
+                await asyncio.to_thread(part.finish)
+                return await asyncio.to_thread(
+                    book.succeeded, url, target, validator, digests, budget, result_callback
+                )
+
+            if (stop := _interrupted(file_control, result_callback)) is not None:
+                return stop
+            restart = False
+            async with open_files:
+                started = time.monotonic()
+                headers = part.headers()
+                if known is not None:
+                    headers = headers | _conditional_headers(known.validator)
+                try:
+                    response = await request(session, url, headers, budget, file_metrics)
+                except _CONNECTION_ERRORS:
+                    return _failed('연결 오류', result_callback)
+                async with response:
+                    validator = response.headers.get('ETag') or response.headers.get('Last-Modified', '')
+                    match response.status:
+                        case 304 if known is not None:  # Not changed (Or the condition is ignored, below)
+                            return await asyncio.to_thread(book.reuse, url, target, known, result_callback)
+                        case 200 | 206 if known is not None and validator == known.validator:  # Not changed either
+                            return await asyncio.to_thread(book.reuse, url, target, known, result_callback)
+                        case 200:
+                            await asyncio.to_thread(part.discard)
+                            if response.content_length is not None and (stored := await asyncio.to_thread(
+                                book.find_stored, url, response.content_length, validator
+                            )) is not None:
+                                return await asyncio.to_thread(book.link_stored, url, target, stored, result_callback)
+
+                            hasher = _ContentHasher(algorithms=algorithms)
+                            # Changed on server; unlinked, since it can be a link to a blob
+                            if await asyncio.to_thread(os.path.lexists, target):
+                                await asyncio.to_thread(os.remove, target)
+                            try:
+                                with await asyncio.to_thread(open, target, 'wb') as file:
+                                    def write_many(views: list[bytes]) -> None:
+                                        file.writelines(views)
+                                        for data in views:
+                                            hasher.update(data)
+                                    write = writer_of(write_many)
+                                    try:
+                                        await _write_response(response, write, file_control)
+                                    finally:
+                                        await write.flush()
+                                        file_metrics.record_transfer(hasher.length, time.monotonic() - started)
+                                    if fsync:
+                                        file.flush()
+                                        await asyncio.to_thread(os.fsync, file.fileno())
+                            except _CONNECTION_ERRORS:
+                                # Can't be resumed without range, so downloaded again from the start
+                                await asyncio.to_thread(os.remove, target)
+                                if not budget.take('연결 오류'):
+                                    return _failed('연결 오류', result_callback)
+                                restart = True
+                            except TransferInterrupted:  # Likewise, downloaded again when resumed
+                                await asyncio.to_thread(os.remove, target)
+                                restart = True
+                            if not restart and response.content_length is not None\
+                                    and hasher.length != response.content_length:
+                                await asyncio.to_thread(os.remove, target)
+                                return _failed('크기 불일치', result_callback)
+                        case 206:
+                            range_ = _extract_range_from_headers(response.headers)
+                            if (stored := await asyncio.to_thread(
+                                book.find_stored, url, range_.total_length, validator
+                            )) is not None:
+                                await asyncio.to_thread(part.discard)
+                                return await asyncio.to_thread(book.link_stored, url, target, stored, result_callback)
+                            with await asyncio.to_thread(part.open, range_, validator, algorithms) as output:
+                                sizer = _ChunkSizer(min_chunk_size, max_chunk_size)
+                                first = part.segment(range_.start, range_.end, sizer, result_callback)
+                                write = writer_of(first.writer().write_many)
+                                error = None
+                                try:
+                                    await _write_response(response, write, file_control)
+                                except _CONNECTION_ERRORS:  # The rest is fetched by the segments
+                                    error = '연결 오류'
+                                except TransferInterrupted:  # The rest is fetched by the segments, when resumed
+                                    pass
+                                finally:
+                                    await write.flush()
+                                await asyncio.to_thread(first.record, error)
+                                if error is not None and not budget.take(error):
+                                    return _failed(error, result_callback)
+                                response.release()  # Frees the slot of the host for the segments
+
+                                # Until every range is received; paused segments stop, and resume from the offsets on disk
+                                while pending := part.segments(segments, sizer, result_callback):
+                                    if (stop := _interrupted(file_control, result_callback)) is not None:
+                                        return stop
+                                    results = await asyncio.gather(*(
+                                        download_segment(session, segment, url, budget, file_metrics, file_control)
+                                        for segment in pending
+                                    ))
+                                    for reason in results:
+                                        if reason is not None:
+                                            return _failed(reason, result_callback)
+                                if fsync:
+                                    await asyncio.to_thread(output.sync)
+                                # Ranges received before, if not reached by the segments
+                                await asyncio.to_thread(part.hasher.catch_up)
+                            hasher = part.hasher
+                            if hasher.length != range_.total_length:  # The .part file is kept to resume
+                                return _failed('크기 불일치', result_callback)
+                            await asyncio.to_thread(part.finish)
+                        case _:
+                            return _failed(f'Code: {response.status}', result_callback)
+            if restart:
+                if not file_control.interrupted:
+                    await asyncio.sleep(backoff_delay(budget.used - 1))
+                return await download_file(
+                    session, open_files, name, type, url, result_callback, budget, file_metrics, file_control
+                )
+            return await asyncio.to_thread(
+                book.succeeded, url, target, validator, hasher.hexdigests(), budget, result_callback
+            )
+
+        async def fetch(
+            session: aiohttp.ClientSession, url: str, headers: dict[str, str], budget: RetryBudget,
+            file_metrics: FileMetrics
+        ) -> bytes:
+            """Gets the body of small resource. (e.g. playlist, key) Raises RuntimeError if not succeeded."""
+            async with await request(session, url, headers, budget, file_metrics) as response:
+                if response.status != 200:
+                    raise RuntimeError(f'Code: {response.status}')
+                return await response.read()
+
+        async def download_stream(
+            session: aiohttp.ClientSession, open_files: asyncio.Semaphore,
+            name: str, type: MaterialTypes, url: str, result_callback: Callable[[str], Any],
+            budget: RetryBudget, file_metrics: FileMetrics, file_control: TransferControl
+        ):
+            target = f'{destination_dir}/{name}'
+            destination = f'{target}.part'
+            if (known := await asyncio.to_thread(book.known, url, target)) is not None:  # Playlists have no validator
+                return await asyncio.to_thread(book.reuse, url, target, known, result_callback)
+
+            if (stop := _interrupted(file_control, result_callback)) is not None:
+                return stop
+            headers = _stream_headers(type)
+            plan = hls.StreamPlan(url)
+            try:
+                while (next_url := plan.next_url()) is not None:
+                    plan.feed(await fetch(session, next_url, headers, budget, file_metrics))
+            except _CONNECTION_ERRORS:
+                return _failed('연결 오류', result_callback)
+            except RuntimeError as e:
+                return _failed(str(e), result_callback)
+            except (ValueError, KeyError):
+                return _failed('재생 목록 오류', result_callback)
+            written, hasher = _stream_resumed(
+                paused_streams.pop(target, None), destination, len(plan.segments), algorithms
+            )
+            transfers = asyncio.Semaphore(max(segments, 1))
+
+            async def fetch_segment(segment: hls.Segment) -> bytes:
+                attempt = 0
+                while True:
+                    file_control.check()
+                    buffer = bytearray()
+                    started = time.monotonic()
+
+                    def write_many(views: list[bytes]) -> None:
+                        for data in views:
+                            buffer.extend(data)
+
+                    try:
+                        async with transfers, await request(
+                            session, segment.url, hls.segment_headers(segment, headers), budget, file_metrics
+                        ) as response:
+                            if response.status not in (200, 206):
+                                raise RuntimeError(f'Code: {response.status}')
+                            await _write_response(response, writer_of(write_many, staged=False), file_control)
+                            partial = response.status == 206
+                    except _CONNECTION_ERRORS:
+                        if not _retry_connection(budget, tuner):
+                            raise
+                        await asyncio.sleep(backoff_delay(attempt))
+                        attempt += 1
+                        continue
+                    finally:
+                        file_metrics.record_transfer(len(buffer), time.monotonic() - started)
+                    return plan.content_of(segment, bytes(buffer), partial)
+
+            window = max(segments, 1) * hls.WINDOW_PER_SEGMENT
+            async with open_files:
+                try:
+                    with await asyncio.to_thread(open, destination, 'ab' if written else 'wb') as file:
+                        def write_segment(data: bytes) -> None:
+                            file.write(data)
+                            hasher.update(data)
+
+                        remaining = iter(plan.segments[written:])
+                        pending = deque(
+                            asyncio.create_task(fetch_segment(part)) for part in itertools.islice(remaining, window)
+                        )
+                        try:
+                            for done in range(written + 1, len(plan.segments) + 1):
+                                data = await pending.popleft()
+                                if (part := next(remaining, None)) is not None:
+                                    pending.append(asyncio.create_task(fetch_segment(part)))
+                                await asyncio.to_thread(write_segment, data)
+                                written = done
+                                result_callback(_stream_progress(done, len(plan.segments), hasher.length))
+                        finally:  # Stops the rest, on failure
+                            for task in pending:
+                                task.cancel()
+                            await asyncio.gather(*pending, return_exceptions=True)
+                        if fsync:
+                            file.flush()
+                            await asyncio.to_thread(os.fsync, file.fileno())
+                except TransferInterrupted:
+                    if not file_control.cancelled:  # Goes on from the written segments, when resumed
+                        paused_streams[target] = (written, hasher)
+                        return _PAUSED
+                    await asyncio.to_thread(os.remove, destination)
+                    return _cancelled(result_callback)
+                except _CONNECTION_ERRORS:
+                    await asyncio.to_thread(os.remove, destination)
+                    return _failed('연결 오류', result_callback)
+                except RuntimeError as e:
+                    await asyncio.to_thread(os.remove, destination)
+                    return _failed(str(e), result_callback)
+                except ValueError:
+                    await asyncio.to_thread(os.remove, destination)
+                    return _failed('복호화 실패', result_callback)
+            await asyncio.to_thread(os.rename, destination, target)
+            return await asyncio.to_thread(book.succeeded, url, target, '', hasher.hexdigests(), budget, result_callback)
+
+        async def download_measured(
+            session: aiohttp.ClientSession, open_files: asyncio.Semaphore,
+            index: int, name: str, type: MaterialTypes, url: str, result_callback: Callable[[str], Any]
+        ):
+            """Downloads the file. A paused file gives back its slot of open files, and waits outside it."""
+            budget = RetryBudget(retry_budget, result_callback)
+            file_metrics = metrics.file(name, url)
+            file_control = control.child(index) if control is not None else TransferControl()
+            download = download_stream if hls.is_playlist(url) else download_file
+            while (outcome := await download(
+                session, open_files, name, type, url, result_callback, budget, file_metrics, file_control
+            )) is _PAUSED:
+                result_callback(PAUSED_TEXT)
+                await file_control.wait_async()
+            success, result = outcome
+            file_metrics.finish(success, result, budget.used)
+            return success, result
+
+        if metrics is None:
+            metrics = DownloadMetrics()
+        algorithms = (fast_hash,) if fast_hash else ()
+        book = _Bookkeeper(destination_dir, ledger, store, checksum_manifest, algorithms)
+        paused_streams: dict[str, tuple[int, _ContentHasher]] = {}  # target -> written segments, hasher
+        tuner = ConcurrencyTuner(connections_per_host, on_change=metrics.record_concurrency) if auto_tune else None
+        selected_files = tuple(selected_files)
+        if sizes is None:  # Not probed before
+            sizes = [None] * len(selected_files)
+            if scheduling is not SchedulingPolicy.FIFO:
+                sizes = await asyncio.gather(*(
+                    asyncio.to_thread(_remaining_size, *file[:3], destination_dir, ledger)
+                    for file in selected_files
+                ))
+
+        open_files = asyncio.Semaphore(MAX_OPEN_FILES)
+        tracer = _PoolTracer()
+        metrics.track_pools(tracer.pool_stats)
+        stage = WriterStage(write_buffers, FILE_WRITE_SIZE) if write_buffers > 0 else None
+        # The writer stage is closed after every task is done
+        with stage or contextlib.nullcontext():
+            async with aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=0, limit_per_host=connections_per_host),
+                timeout=aiohttp.ClientTimeout(sock_connect=TIMEOUT[0], sock_read=TIMEOUT[1]),
+                trace_configs=[tracer.config]
+            ) as session:
+                # Tasks take free connections in the order they are created
+                tasks = {
+                    index: asyncio.create_task(download_measured(session, open_files, index, *selected_files[index]))
+                    for index in schedule(sizes, scheduling)
+                }
+                return tuple([await tasks[index] for index in range(len(selected_files))])
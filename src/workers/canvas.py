@@ -21,8 +21,9 @@ from Crypto.Cipher import PKCS1_v1_5
 from Crypto.Hash import SHA256
 import requests
 
-from pyside_commons import ThreadRunner
-from . import MaterialTypes, LectureMaterial
+from . import MaterialTypes, LectureMaterial, hls
+from .http_client import HttpClient
+from .runner import WorkerBase
 
 
 CANVAS_SESSION = '_normandy_session'
@@ -40,7 +41,7 @@ def _join_url_token(
     return url + '?access_token=' + access_token
 
 
-class CanvasLoginWorker(ThreadRunner):
+class CanvasLoginWorker(WorkerBase):
     def runner(self, knu_session: str):
         def parse_form(content: str, form_id: str) -> dict[str, str]:
             parser = BeautifulSoup(content, 'html.parser')
@@ -69,16 +70,14 @@ class CanvasLoginWorker(ThreadRunner):
 
         def get_php_session_id(session: requests.Session) -> None:
             response = session.post(
-                'https://lms1.knu.ac.kr/sso/business.php',
-                timeout=10
+                'https://lms1.knu.ac.kr/sso/business.php'
             )
             if response.status_code != 200:
                 raise RuntimeError(f'Request failed. ({response.status_code})')
 
         def get_login_info(session: requests.Session) -> dict[str, str]:
             response = session.post(
-                'https://knusso.knu.ac.kr/login.html?agentId=311',
-                timeout=10
+                'https://knusso.knu.ac.kr/login.html?agentId=311'
             )
             if response.status_code != 200:
                 raise RuntimeError(f'Request failed. ({response.status_code})')
@@ -87,8 +86,7 @@ class CanvasLoginWorker(ThreadRunner):
         def register_session(session: requests.Session, form_content: str) -> None:
             response = session.post(
                 'https://lms1.knu.ac.kr/sso/checkauth.php',
-                data=form_content,
-                timeout=10
+                data=form_content
             )
             if response.status_code != 200:
                 raise RuntimeError(f'Request failed. ({response.status_code})')
@@ -107,8 +105,7 @@ class CanvasLoginWorker(ThreadRunner):
                 headers={
                     'User-Agent': USER_AGENT,
                     'Accept': 'text/html',
-                },
-                timeout=10
+                }
             )
             if response.status_code != 200:
                 raise RuntimeError(f'Request failed. ({response.status_code})')
@@ -134,13 +131,12 @@ class CanvasLoginWorker(ThreadRunner):
                     'User-Agent': USER_AGENT,
                     'Accept': 'text/html',
                     'Referer': prev_url,
-                },
-                timeout=10
+                }
             )
             if response.status_code != 200:
                 raise RuntimeError(f'Request failed. ({response.status_code})')
 
-        with requests.Session() as session:
+        with HttpClient().session() as session:
             session.cookies.set_cookie(
                 Cookie(
                     version=0,
@@ -177,7 +173,7 @@ class CanvasLoginWorker(ThreadRunner):
             }
 
 
-class CanvasSubjectGetter(ThreadRunner):
+class CanvasSubjectGetter(WorkerBase):
     __URL = f'{CANVAS_URL}/api/v1/courses?include=term&per_page=50'
     __LINK_PATTERN = re.compile(r'<(.+?)>; rel="([a-z]+)"')
     __SEMESTER_PATTERN = re.compile(r'20\d{2}년 (1|2|(여름|겨울)(계절)?)학기')
@@ -188,7 +184,7 @@ class CanvasSubjectGetter(ThreadRunner):
         result: dict[str, list[tuple[str, str]]] = {}
 
         while next_page:
-            response = requests.get(next_page, cookies={CANVAS_SESSION: canvas_session})
+            response = HttpClient().get(next_page, cookies={CANVAS_SESSION: canvas_session})
             if response.status_code != 200:
                 raise RuntimeError(f'Request failed. (Body: {response.text})')
 
@@ -209,7 +205,7 @@ class CanvasSubjectGetter(ThreadRunner):
         return result
 
 
-class CanvasFileInfoGetter(ThreadRunner):
+class CanvasFileInfoGetter(WorkerBase):
     __LEARNINGX_URL_BASE = f'{CANVAS_URL}/learningx/api/v1'
     __LCMS_BASE_URL = 'https://lcms.knu.ac.kr'
 
@@ -232,6 +228,7 @@ class CanvasFileInfoGetter(ThreadRunner):
         self, canvas_session: str, learningx_session: str, course_id: int
     ) -> tuple[LectureMaterial, ...]:
         futures: list[Future] = []
+        HttpClient().reserve(max(self._workers_count, 4))
         with ThreadPoolExecutor(max(self._workers_count, 4)) as executor:
             futures.append(executor.submit(
                 self.__list_module_materials, executor, learningx_session, course_id
@@ -246,7 +243,7 @@ class CanvasFileInfoGetter(ThreadRunner):
     ) -> tuple[LectureMaterial, ...]:
         def list_content_ids() -> list[str]:
             # Get modules
-            response = requests.get(
+            response = HttpClient().get(
                 self.__LEARNINGX_MODULE_URL.format(course_id=course_id),
                 headers={'Authorization': f'Bearer {learningx_session}'}
             )
@@ -276,7 +273,7 @@ class CanvasFileInfoGetter(ThreadRunner):
         def get_uniplayer_content_material(content_id: str) -> LectureMaterial:
             assert content_id.isascii()
 
-            response = requests.get(self.__UNIPLAYER_INFO_BASE.format(content_id=content_id))
+            response = HttpClient().get(self.__UNIPLAYER_INFO_BASE.format(content_id=content_id))
             if response.status_code != 200:
                 raise RuntimeError(f'Request Failed. {response.status_code}')
 
@@ -302,7 +299,15 @@ class CanvasFileInfoGetter(ThreadRunner):
                         content_url = parser.select_one('main_media > desktop > html5 > media_uri').get_text(strip=True)
                         material_type = MaterialTypes.VIDEO
                     case _:
-                        raise ValueError(f'Unsupported content type: {content_type}')
+                        # Streamed lectures are served as HLS playlists
+                        content_url = next((
+                            urllib.parse.urljoin(self.__LCMS_BASE_URL, uri)
+                            for tag in parser.select('media_uri')
+                            if hls.is_playlist(uri := tag.get_text(strip=True))
+                        ), None)
+                        if content_url is None:
+                            raise ValueError(f'Unsupported content type: {content_type}')
+                        material_type = MaterialTypes.VIDEO
 
                 content_name_base = parser.select_one('content_metadata > title').get_text(strip=True)
                 content_name = re.search(r'(<!\[CDATA\[)?(.+)(\]\]>)?', content_name_base)[2]
@@ -312,8 +317,10 @@ class CanvasFileInfoGetter(ThreadRunner):
                     file.write('\n\n-----\n\n')
                 raise e
 
+            # Segments of playlists are saved as a single stream
+            extension = hls.STREAM_EXTENSION if hls.is_playlist(content_url) else os.path.splitext(content_url)[1]
             return LectureMaterial(
-                content_name + os.path.splitext(content_url)[1],
+                content_name + extension,
                 material_type,
                 content_url
             )
@@ -333,7 +340,7 @@ class CanvasFileInfoGetter(ThreadRunner):
             item_per_page: int
 
         def find_material_board_id() -> int:
-            response = requests.get(
+            response = HttpClient().get(
                 self.__LEARNINGX_BOARD_LIST_URL.format(course_id=course_id),
                 headers={'Authorization': f'Bearer {learningx_session}'}
             )
@@ -344,7 +351,7 @@ class CanvasFileInfoGetter(ThreadRunner):
                     return subject['id']
 
         def list_page(board_id: int, page: int) -> PageInfo:
-            response = requests.get(
+            response = HttpClient().get(
                 self.__LEARNINGX_BOARD_POSTS_URL.format(
                     course_id=course_id, board_id=board_id, page_no=page
                 ), headers={'Authorization': f'Bearer {learningx_session}'}
@@ -358,7 +365,7 @@ class CanvasFileInfoGetter(ThreadRunner):
             )
 
         def post_to_material_urls(post_id: str) -> list[LectureMaterial]:
-            response = requests.get(
+            response = HttpClient().get(
                 self.__LEARNINGX_BOARD_POST_URL.format(
                     course_id=course_id, board_id=board_id, post_no=post_id
                 ), headers={'Authorization': f'Bearer {learningx_session}'}
@@ -0,0 +1,71 @@
+from typing import Any
+import hashlib
+import os
+import threading
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+MANIFEST_ALGORITHM = 'sha256'
+
+
+def new_hash(algorithm: str) -> Any:
+    """
+    Makes hash object of the algorithm.
+
+    Algorithms of hashlib (e.g. 'sha256', 'blake2b') are always available,
+    and ones of xxhash (e.g. 'xxh3_64', 'xxh3_128') if it is installed.
+
+    Raises:
+        ValueError: If the algorithm is not available.
+    """
+    if algorithm in hashlib.algorithms_available:
+        return hashlib.new(algorithm)
+    if xxhash is not None and algorithm.startswith('xxh') and hasattr(xxhash, algorithm):
+        return getattr(xxhash, algorithm)()
+    raise ValueError(f'Unavailable hash algorithm. ({algorithm})')
+
+
+class ChecksumManifest:
+    """
+    Checksum manifest of a directory. (e.g. SHA256SUMS)
+
+    Written in the format of coreutils (`<hex digest>  <file name>`),
+    so it can be checked by `sha256sum -c`. Thread-safe.
+    Each record rewrites the manifest atomically, replacing the former
+    digest of the same file.
+    """
+
+    def __init__(self, directory: str, algorithm: str = MANIFEST_ALGORITHM):
+        self.__lock = threading.Lock()
+        self.__path = os.path.join(directory, f'{algorithm.upper()}SUMS')
+        self.__digests: dict[str, str] = {}
+        try:
+            with open(self.__path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    digest, _, name = line.rstrip('\n').partition('  ')
+                    if name:
+                        self.__digests[name] = digest
+        except FileNotFoundError:
+            pass
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    def record(self, name: str, digest: str) -> None:
+        """
+        Records the digest of the file.
+
+        Args:
+            name: The file name, relative to the directory.
+            digest: Hex digest of the file.
+        """
+        with self.__lock:
+            self.__digests[name] = digest
+            with open(f'{self.__path}.tmp', 'w', encoding='utf-8', newline='\n') as file:
+                file.writelines(f'{d}  {n}\n' for n, d in sorted(self.__digests.items()))
+            os.replace(f'{self.__path}.tmp', self.__path)
@@ -1,17 +1,46 @@
+from collections import deque
 from collections.abc import Callable
-from concurrent.futures import ThreadPoolExecutor
-from typing import Any, Iterable, NamedTuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Iterable, NamedTuple, Sequence
+import contextlib
+import hashlib
+import http.client
+import itertools
+import json
 import os
 import re
+import shutil
+import threading
+import time
+import urllib.parse
 
 import requests
 
-from pyside_commons import ThreadRunner, ExceptionBridge
-from . import MaterialTypes
+from . import MaterialTypes, hls
+from .checksums import ChecksumManifest, new_hash
+from .control import CANCELLED_TEXT, PAUSED_TEXT, TransferControl, TransferInterrupted
+from .http_client import HttpClient
+from .ledger import DownloadLedger, LedgerEntry
+from .metrics import DownloadMetrics, FileMetrics
+from .progress import format_size
+from .retry import RETRY_BUDGET, RETRYABLE_STATUS_CODES, RetryBudget, backoff_delay
+from .runner import WorkerBase
+from .scheduling import SchedulingPolicy, schedule
+from .sinks import ArchiveSink
+from .store import BlobStore
+from .throttle import BandwidthLimiter
+from .tuning import ConcurrencyTuner, THROTTLING_STATUS_CODES
+from .writer import QueuedWriter, WriterStage, WRITE_BUFFERS
 
 
 CHUNK_SIZE = 4 * 1024 ** 2  # 4MiB
-FILE_WRITE_SIZE = 32 * 1024 ** 2  # 32MiB
+FILE_WRITE_SIZE = 1024 ** 2  # 1MiB
+THROTTLED_WRITE_SIZE = 64 * 1024  # 64KiB
+SEGMENT_COUNT = 4
+SEGMENT_MIN_SIZE = 4 * CHUNK_SIZE  # 16MiB
+MIN_CHUNK_SIZE = 512 * 1024  # 512KiB
+MAX_CHUNK_SIZE = 64 * 1024 ** 2  # 64MiB
+TARGET_REQUEST_TIME = 2  # seconds
 
 
 HEADER_BY_TYPE = {
@@ -35,58 +64,1367 @@ HEADER_BY_TYPE = {
 }
 
 
-class FileDownloader(ThreadRunner):
-    def runner(self, selected_files: Iterable[tuple[str, MaterialTypes, str, Callable[[str], Any]]], destination_dir: str):
-        class Range(NamedTuple):
-            start: int
-            end: int
-            total_length: int
-
-        def extract_range_from_body(response_headers: dict[str, str]):
-            keys = {k.lower(): k for k in response_headers.keys()}
-            length_str = response_headers[keys['content-range']]
-            length_match = re.search('([a-z]+) (\\d+)-(\\d+)/(\\d+)', length_str)
-            if length_match is None or length_match.group(1).lower() != 'bytes':
-                raise ValueError(f'Illegal length header value. ({length_str})')
-            return Range(int(length_match.group(2)), int(length_match.group(3)), int(length_match.group(4)))
-
-        def download_file(name: str, type: MaterialTypes, url: str, result_callback: Callable[[str], Any]):
-            response = requests.get(url, headers=HEADER_BY_TYPE[type])
-            match response.status_code:
-                case 200:
-                    with open(f'{destination_dir}/{name}', 'wb') as file:
-                        file.write(response.content)
-                    result_callback('성공')
-                    return True, '성공'
-                case 206:
-                    buf = bytearray()
-                    target = f'{destination_dir}/{name}'
-                    destination = f'{target}.part'
-                    with open(destination, 'wb') as file:
-                        buf += response.content
-                    with open(destination, 'ab') as file:
-                        while True:
-                            if len(buf) >= FILE_WRITE_SIZE:
-                                file.write(buf)
-                                buf.clear()
-                            range_ = extract_range_from_body(response.headers)
-                            if (range_.end >= range_.total_length - 1):
-                                file.write(buf)
-                                break
-                            result_callback(f'{round(range_.end / range_.total_length * 100, 1)}%')
-                            response = requests.get(url, headers=HEADER_BY_TYPE[type] | {'Range': f'bytes={range_.end + 1}-{range_.end + CHUNK_SIZE + 1}'})
-                            if response.status_code != 206:
-                                ExceptionBridge().warning('다운로드 실패', f'파일 다운로드 실패\n이름: {name}\n응답 Code: {response.status_code}')
-                                result_callback(f'실패 (Code: {response.status_code})')
-                                return False, f'실패 (Code: {response.status_code})'
-                            buf += response.content
-                    os.rename(destination, target)
-                    result_callback('성공')
-                    return True, '성공'
-                case _:
-                    ExceptionBridge().warning('다운로드 실패', f'파일 다운로드 실패\n이름: {name}\n응답 Code: {response.status_code}')
-                    result_callback(f'실패 (Code: {response.status_code})')
-                    return False, f'실패 (Code: {response.status_code})'
+_receive_buffers = threading.local()
+
+
+def _receive_buffer(size: int) -> memoryview:
+    """Gets the receive buffer of this thread, which is reused by every response."""
+    buffer = getattr(_receive_buffers, 'buffer', None)
+    if buffer is None or len(buffer) < size:
+        buffer = _receive_buffers.buffer = memoryview(bytearray(size))
+    return buffer[:size]
+
+
+def _raw_body(response: requests.Response) -> http.client.HTTPResponse | None:
+    """
+    Gets the body stream under urllib3, which can be read into a buffer.
+
+    None if the body must be decoded by urllib3. (compressed, or chunked)
+    """
+    body = getattr(response.raw, '_fp', None)
+    if not isinstance(body, http.client.HTTPResponse) or body.chunked:
+        return None
+    if response.headers.get('Content-Encoding', 'identity').lower() != 'identity':
+        return None
+    return body
+
+
+def _write_response(
+    response: requests.Response, write: Callable[[bytes | memoryview], Any], control: TransferControl | None = None
+) -> int:
+    """
+    Writes body of the (streamed) response, by given write function.
+
+    At most FILE_WRITE_SIZE bytes are held in memory at once,
+    regardless of the size of the body. (Or the buffers of the writer stage,
+    if write is a QueuedWriter)
+    Received bytes are charged to the BandwidthLimiter, in smaller pieces
+    when its limit is applied.
+
+    If the body is not encoded, it is read from the socket directly into the
+    reused buffer of the thread (or a buffer of the writer stage), and given
+    to write as a view of the buffer. (So write must not keep the data.)
+
+    The control (if given) is checked between the buffers, so an interrupted
+    transfer stops after the last written buffer.
+
+    Returns:
+        int: The number of written bytes.
+
+    Raises:
+        requests.ConnectionError: If the connection is broken.
+        TransferInterrupted: If the transfer is paused or cancelled.
+    """
+    limiter = BandwidthLimiter()
+    host = urllib.parse.urlsplit(response.url).hostname
+    size = THROTTLED_WRITE_SIZE if limiter.is_limited(host) else FILE_WRITE_SIZE
+    written = 0
+    if (body := _raw_body(response)) is None:
+        for chunk in response.iter_content(size):
+            limiter.consume(host, len(chunk))
+            if control is not None:
+                control.check()
+            write(chunk)
+            written += len(chunk)
+        return written
+
+    def read_into(buffer: memoryview) -> int:
+        try:
+            return body.readinto(buffer)
+        except (OSError, http.client.HTTPException) as e:
+            raise requests.ConnectionError(e, response=response) from e
+
+    if isinstance(write, QueuedWriter):
+        receive = write.receive
+    else:
+        def receive(read_into: Callable[[memoryview], int], size: int) -> int:
+            buffer = _receive_buffer(size)
+            if received := read_into(buffer):
+                write(buffer[:received])
+            return received
+
+    while True:
+        if control is not None:
+            control.check()
+        if not (received := receive(read_into, size)):
+            break
+        limiter.consume(host, received)
+        written += received
+    if body.length:  # Closed before Content-Length
+        raise requests.ConnectionError(
+            f'Connection broken: {written} bytes read, {body.length} more expected', response=response
+        )
+    response.raw.release_conn()  # Read to the end, so the connection can be reused
+    return written
+
+
+def _get(url: str, headers: dict[str, str], tuner: ConcurrencyTuner | None = None) -> requests.Response:
+    """Sends streamed GET request, holding a slot of the tuner (if any) until the response is closed."""
+    if tuner is None:
+        return HttpClient().get(url, headers=headers, stream=True)
+    slot = tuner.acquire()
+    try:
+        response = HttpClient().get(url, headers=headers, stream=True)
+    except BaseException:
+        slot.release()
+        raise
+
+    close = response.close
+
+    def close_and_release() -> None:
+        try:
+            close()
+        finally:
+            slot.release()
+    response.close = close_and_release
+    return response
+
+
+class ProbeResult(NamedTuple):
+    size: int | None
+    content_type: str
+    validator: str
+
+
+def probe_material(url: str, type: MaterialTypes) -> ProbeResult:
+    """
+    Gets size, content type and validator of the material, without downloading its body.
+
+    Videos (LCMS) are probed by 1-byte range request, others by HEAD request.
+    Size is None if it can't be known. (e.g. of HLS playlists, which are not requested)
+    """
+    if hls.is_playlist(url):
+        return ProbeResult(None, hls.PLAYLIST_CONTENT_TYPE, '')
+    try:
+        if type is MaterialTypes.VIDEO:
+            response = HttpClient().get(url, headers=HEADER_BY_TYPE[type] | {'Range': 'bytes=0-0'}, stream=True)
+        else:
+            response = HttpClient().head(url, headers=HEADER_BY_TYPE[type], allow_redirects=True)
+    except requests.RequestException:
+        return ProbeResult(None, '', '')
+    with response:
+        match response.status_code:
+            case 206:
+                size = _extract_range_from_headers(response.headers).total_length
+                response.content  # pylint: disable = pointless-statement  # 1 byte, read to reuse the connection
+            case 200 if 'Content-Length' in response.headers:
+                size = int(response.headers['Content-Length'])
+            case _:
+                size = None
+        return ProbeResult(
+            size, response.headers.get('Content-Type', ''),
+            response.headers.get('ETag') or response.headers.get('Last-Modified', '')
+        )
+
+
+def _remaining_size(
+    name: str, type: MaterialTypes, url: str, destination_dir: str, ledger: DownloadLedger | None
+) -> int | None:
+    """Gets the number of bytes left to download the material. Probes it if not known locally."""
+    target = f'{destination_dir}/{name}'
+    if ledger is not None and ledger.is_present(url, target):
+        return 0
+    if (state := _PartState.load(f'{target}.part.json', url)) is not None:
+        return state.total_length - state.received_length
+    return probe_material(url, type).size
+
+
+def free_space(directory: str) -> int | None:
+    """Gets free bytes of the disk of the directory (or of its nearest existing parent). None if unknown."""
+    directory = os.path.abspath(directory)
+    while not os.path.isdir(directory) and os.path.dirname(directory) != directory:
+        directory = os.path.dirname(directory)
+    try:
+        return shutil.disk_usage(directory).free
+    except OSError:
+        return None
+
+
+class ProbedMaterial(NamedTuple):
+    probe: ProbeResult
+    remaining: int | None  # Bytes left to download. (0 if already downloaded, None if unknown)
+
+
+class MaterialProber(WorkerBase):
+    """
+    Probes the materials concurrently, before downloading them.
+
+    Materials already downloaded (by the ledger), and not changed since, have nothing
+    remaining, and bytes received by .part files are not counted as remaining.
+    """
+
+    def runner(
+        self,
+        selected_files: Iterable[tuple[str, MaterialTypes, str]],
+        destination_dir: str,
+        ledger: DownloadLedger | None = None
+    ) -> tuple[ProbedMaterial, ...]:
+        def probe(name: str, type: MaterialTypes, url: str) -> ProbedMaterial:
+            target = f'{destination_dir}/{name}'
+            result = probe_material(url, type)
+            if ledger is not None and ledger.is_present(url, target, result.validator):
+                return ProbedMaterial(result._replace(size=ledger.get(url).size), 0)
+            state = _PartState.load(f'{target}.part.json', url)
+            if state is not None and result.size in (None, state.total_length):
+                return ProbedMaterial(result, state.total_length - state.received_length)
+            return ProbedMaterial(result, result.size)
 
         with ThreadPoolExecutor(max(self._workers_count, 4)) as executor:
-            return tuple(executor.map(download_file, *zip(*selected_files)))
+            return tuple(executor.map(lambda file: probe(*file[:3]), selected_files))
+
+
+class _Range(NamedTuple):
+    start: int
+    end: int
+    total_length: int
+
+
+def _extract_range_from_headers(response_headers: dict[str, str]) -> _Range:
+    keys = {k.lower(): k for k in response_headers.keys()}
+    length_str = response_headers[keys['content-range']]
+    length_match = re.search('([a-z]+) (\\d+)-(\\d+)/(\\d+)', length_str)
+    if length_match is None or length_match.group(1).lower() != 'bytes':
+        raise ValueError(f'Illegal length header value. ({length_str})')
+    return _Range(int(length_match.group(2)), int(length_match.group(3)), int(length_match.group(4)))
+
+
+def _split_range(start: int, end: int, count: int) -> list[tuple[int, int]]:
+    """
+    Splits inclusive byte range [start, end] into (at most) count segments.
+
+    Segments smaller than SEGMENT_MIN_SIZE are not made,
+    so small files are fetched by fewer (or single) connections.
+    """
+    length = end - start + 1
+    if length <= 0:
+        return []
+    count = max(1, min(count, length // SEGMENT_MIN_SIZE))
+    step = -(-length // count)
+    return [(k, min(k + step - 1, end)) for k in range(start, end + 1, step)]
+
+
+class _ChunkSizer:
+    """
+    Adaptive range size of a file, shared by its segments.
+
+    After each range request, the size is moved toward the size which takes
+    TARGET_REQUEST_TIME with the measured throughput (at most doubled or
+    halved at once), and is halved on each error. The size is kept within
+    [min_size, max_size].
+    """
+
+    def __init__(self, min_size: int, max_size: int, initial_size: int = CHUNK_SIZE):
+        self.__lock = threading.Lock()
+        self.__min_size = min_size
+        self.__max_size = max_size
+        self.__size = min(max(initial_size, min_size), max_size)
+
+    @property
+    def size(self) -> int:
+        return self.__size
+
+    def record(self, received: int, elapsed: float) -> None:
+        """Records a succeeded request, which received given bytes in given seconds."""
+        if received <= 0:
+            return
+        wanted = int(received / max(elapsed, 0.001) * TARGET_REQUEST_TIME)
+        with self.__lock:
+            wanted = min(max(wanted, self.__size // 2), self.__size * 2)
+            self.__size = min(max(wanted, self.__min_size), self.__max_size)
+
+    def record_error(self) -> None:
+        """Records a failed request."""
+        with self.__lock:
+            self.__size = max(self.__size // 2, self.__min_size)
+
+
+class _ProgressCounter:
+    """Thread-safe counter of received bytes, which reports percentage."""
+
+    def __init__(self, done: int, total: int, result_callback: Callable[[str], Any]):
+        self.__lock = threading.Lock()
+        self.__done = done
+        self.__total = total
+        self.__result_callback = result_callback
+
+    def __call__(self, received: int, chunk_size: int) -> None:
+        with self.__lock:
+            self.__done += received
+            self.__result_callback(
+                f'{round(self.__done / self.__total * 100, 1)}% ({format_size(chunk_size)})'
+            )
+
+
+class _ContentHasher:
+    """
+    SHA-256 (and other hashes) of a file, computed while its ranges are written.
+
+    Bytes written at the hashed position are hashed directly from the stream.
+    Ranges written ahead of it (by other segments, or by previous run) can't
+    be hashed until the position reaches them, so they are read back from the
+    file by catch_up: with N segments, up to (N-1)/N of the file is read back.
+    catch_up is called by the fetchers after their writes are flushed, not by
+    the writer, and reads without holding the lock, so writes of other ranges
+    (and files) go on meanwhile. Reads are done in FILE_WRITE_SIZE pieces.
+    """
+
+    def __init__(self, read_at: Callable[[int, int], bytes] | None = None, algorithms: Iterable[str] = ()):
+        self.__lock = threading.Lock()
+        self.__hashes = {'sha256': hashlib.sha256()} | {name: new_hash(name) for name in algorithms}
+        self.__position = 0
+        self.__pending: dict[int, int] = {}  # start -> end (exclusive), written but not hashed
+        self.__catching_up = False
+        self.__read_at = read_at
+
+    def update(self, data: bytes, offset: int | None = None) -> None:
+        """Hashes (or keeps for catch_up) the data written at the offset. (Default: the hashed position)"""
+        with self.__lock:
+            if offset is None or (offset == self.__position and not self.__catching_up):
+                self.__update(data)
+                self.__position += len(data)
+            else:
+                self.__pending[offset] = offset + len(data)
+
+    def add_written(self, start: int, end: int) -> None:
+        """Marks (inclusive) range, which is already written to the file. It's hashed by catch_up."""
+        with self.__lock:
+            self.__pending[start] = end + 1
+
+    def catch_up(self) -> None:
+        """
+        Hashes the written ranges which the hashed position has reached, by reading them back.
+        Returns at once if another thread is catching up; it hashes the ranges marked meanwhile.
+        """
+        while True:
+            with self.__lock:
+                if self.__catching_up or (end := self.__pending.pop(self.__position, None)) is None:
+                    return
+                self.__catching_up = True
+                position = self.__position
+            try:
+                while position < end:
+                    data = self.__read_at(position, min(FILE_WRITE_SIZE, end - position))
+                    if not data:
+                        raise OSError('Unexpected end of file.')
+                    self.__update(data)
+                    position += len(data)
+            finally:
+                with self.__lock:
+                    if position < end:  # Failed, left to hash later
+                        self.__pending[position] = end
+                    self.__position = position
+                    self.__catching_up = False
+
+    @property
+    def length(self) -> int:
+        """The number of hashed bytes. (from the start of the file)"""
+        return self.__position
+
+    def hexdigest(self) -> str:
+        with self.__lock:
+            return self.__hashes['sha256'].hexdigest()
+
+    def hexdigests(self) -> dict[str, str]:
+        """Gets hex digest of each algorithm. (algorithm -> digest)"""
+        with self.__lock:
+            return {name: hash_.hexdigest() for name, hash_ in self.__hashes.items()}
+
+    def __update(self, data: bytes) -> None:
+        for hash_ in self.__hashes.values():
+            hash_.update(data)
+
+
+class _OutputFile:
+    """
+    Output file, which is preallocated and written at offsets.
+
+    Shared by the segments of a file. posix_fallocate is used to reserve
+    the space if available, otherwise the file is (sparsely) extended.
+    """
+
+    def __init__(self, path: str, length: int, create: bool):
+        flags = os.O_RDWR | getattr(os, 'O_BINARY', 0)
+        if create:
+            flags |= os.O_CREAT | os.O_TRUNC
+        self.__fd = os.open(path, flags, 0o666)
+        self.__lock = threading.Lock()
+        if os.fstat(self.__fd).st_size != length:
+            try:
+                os.posix_fallocate(self.__fd, 0, length)
+            except (AttributeError, OSError):  # Not supported by platform or filesystem
+                os.ftruncate(self.__fd, length)
+
+    def __enter__(self) -> '_OutputFile':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def write_at(self, data: bytes, offset: int) -> None:
+        view = memoryview(data)
+        if hasattr(os, 'pwrite'):
+            while view:
+                written = os.pwrite(self.__fd, view, offset)
+                view = view[written:]
+                offset += written
+        else:
+            with self.__lock:
+                os.lseek(self.__fd, offset, os.SEEK_SET)
+                while view:
+                    view = view[os.write(self.__fd, view):]
+
+    def write_many_at(self, views: list[bytes | memoryview], offset: int) -> None:
+        """Writes the data sequentially from the offset, at once if possible."""
+        if not hasattr(os, 'pwritev') or len(views) == 1:
+            for data in views:
+                self.write_at(data, offset)
+                offset += len(data)
+            return
+        written = os.pwritev(self.__fd, views, offset)
+        for data in views:  # Rest of partial write
+            if written < len(data):
+                self.write_at(memoryview(data)[written:], offset + written)
+            offset += len(data)
+            written = max(written - len(data), 0)
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        if hasattr(os, 'pread'):
+            return os.pread(self.__fd, size, offset)
+        with self.__lock:
+            os.lseek(self.__fd, offset, os.SEEK_SET)
+            return os.read(self.__fd, size)
+
+    def writer(self, offset: int, hasher: '_ContentHasher') -> '_RangeWriter':
+        """Makes write function, which writes (and hashes) sequentially from the offset."""
+        return _RangeWriter(self, offset, hasher)
+
+    def sync(self) -> None:
+        """Flushes the written data to the disk."""
+        os.fsync(self.__fd)
+
+    def close(self) -> None:
+        os.close(self.__fd)
+
+
+class _RangeWriter:
+    """
+    Write function of _OutputFile, which writes (and hashes) sequentially from the offset.
+
+    Keeps the position to write next, so bytes received before an error are known.
+    """
+
+    def __init__(self, output: _OutputFile, offset: int, hasher: _ContentHasher):
+        self.__output = output
+        self.__hasher = hasher
+        self.position = offset
+
+    def __call__(self, data: bytes | memoryview) -> None:
+        self.write_many([data])
+
+    def write_many(self, views: list[bytes | memoryview]) -> None:
+        self.__output.write_many_at(views, self.position)
+        for data in views:
+            self.__hasher.update(data, self.position)
+            self.position += len(data)
+
+
+class _PartState:
+    """
+    Download state of a .part file, persisted to the sidecar file next to it.
+
+    Keeps the received (inclusive) byte ranges with the url, total length
+    and validator (ETag or Last-Modified) of the file, so an interrupted
+    download can be resumed without transferring received bytes again.
+    """
+
+    def __init__(
+        self, path: str, url: str, total_length: int, validator: str,
+        received: Iterable[tuple[int, int]] = ()
+    ):
+        self.__lock = threading.Lock()
+        self.__path = path
+        self.url = url
+        self.total_length = total_length
+        self.validator = validator
+        self.__received = sorted(received)
+
+    @classmethod
+    def load(cls, path: str, url: str) -> '_PartState | None':
+        """Loads the sidecar file. Returns None if it is missing, broken or for other url."""
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data['url'] != url:
+                return None
+            return cls(
+                path, url, data['total_length'], data['validator'],
+                (tuple(r) for r in data['received'])
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    @property
+    def received(self) -> list[tuple[int, int]]:
+        with self.__lock:
+            return list(self.__received)
+
+    @property
+    def received_length(self) -> int:
+        with self.__lock:
+            return sum(end - start + 1 for start, end in self.__received)
+
+    def missing(self) -> list[tuple[int, int]]:
+        """Returns not received (inclusive) byte ranges."""
+        result = []
+        position = 0
+        with self.__lock:
+            for start, end in self.__received:
+                if position < start:
+                    result.append((position, start - 1))
+                position = max(position, end + 1)
+        if position < self.total_length:
+            result.append((position, self.total_length - 1))
+        return result
+
+    def add(self, start: int, end: int) -> None:
+        """Marks [start, end] as received (written to the .part file), and saves the state."""
+        with self.__lock:
+            merged: list[tuple[int, int]] = []
+            for range_ in sorted((*self.__received, (start, end))):
+                if merged and range_[0] <= merged[-1][1] + 1:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], range_[1]))
+                else:
+                    merged.append(range_)
+            self.__received = merged
+            self.__save()
+
+    def remove(self) -> None:
+        """Removes the sidecar file."""
+        try:
+            os.remove(self.__path)
+        except FileNotFoundError:
+            pass
+
+    def __save(self) -> None:
+        with open(f'{self.__path}.tmp', 'w', encoding='utf-8') as file:
+            json.dump({
+                'url': self.url,
+                'total_length': self.total_length,
+                'validator': self.validator,
+                'received': self.__received,
+            }, file)
+        os.replace(f'{self.__path}.tmp', self.__path)
+
+
+# Engine-independent steps of the downloads, shared by FileDownloader and AsyncFileDownloader.
+# The engines only send the requests and move the bodies.
+
+
+def _failed(reason: str, result_callback: Callable[[str], Any]) -> tuple[bool, str]:
+    result_callback(f'실패 ({reason})')
+    return False, f'실패 ({reason})'
+
+
+def _cancelled(result_callback: Callable[[str], Any]) -> tuple[bool, str]:
+    result_callback(CANCELLED_TEXT)
+    return False, CANCELLED_TEXT
+
+
+_PAUSED = (False, PAUSED_TEXT)  # Result of paused download, which is run again when resumed
+
+
+def _interrupted(control: TransferControl, result_callback: Callable[[str], Any]) -> tuple[bool, str] | None:
+    """Gets the result if the file is cancelled, or _PAUSED if paused. None if it goes on."""
+    if control.cancelled:
+        return _cancelled(result_callback)
+    return _PAUSED if control.paused else None
+
+
+def _finished(budget: RetryBudget, result_callback: Callable[[str], Any]) -> tuple[bool, str]:
+    result = f'성공 (재시도 {budget.used}회)' if budget.used else '성공'
+    result_callback(result)
+    return True, result
+
+
+def _retry_response(
+    status: int, ranged: bool, budget: RetryBudget, file_metrics: FileMetrics, tuner: ConcurrencyTuner | None
+) -> bool:
+    """Records the response, and decides whether it is retried. (Transient failure, within the budget)"""
+    file_metrics.record_response(status, ranged)
+    if tuner is not None and status in THROTTLING_STATUS_CODES:
+        tuner.record_error(throttled=True)
+    return status in RETRYABLE_STATUS_CODES and budget.take(f'Code: {status}')
+
+
+def _retry_connection(budget: RetryBudget, tuner: ConcurrencyTuner | None) -> bool:
+    """Records the connection error, and decides whether the request is retried within the budget."""
+    if tuner is not None:
+        tuner.record_error()
+    return budget.take('연결 오류')
+
+
+def _counting(
+    write_many: Callable[[list[bytes | memoryview]], Any], metrics: DownloadMetrics, tuner: ConcurrencyTuner | None
+) -> Callable[[list[bytes | memoryview]], None]:
+    """Wraps write_many, to count the written bytes to the metrics and the tuner."""
+    def counted(views: list[bytes | memoryview]) -> None:
+        write_many(views)
+        received = sum(len(data) for data in views)
+        metrics.record_received(received)
+        if tuner is not None:
+            tuner.record(received)
+    return counted
+
+
+def _conditional_headers(validator: str) -> dict[str, str]:
+    """Headers, by which the server answers 304 if the content still has the validator. (ETag or Last-Modified)"""
+    if validator.startswith(('"', 'W/')):
+        return {'If-None-Match': validator}
+    return {'If-Modified-Since': validator}
+
+
+def _stream_headers(type: MaterialTypes) -> dict[str, str]:
+    """Headers of the requests of a HLS stream. (Ranges are of the segments, if any)"""
+    return {key: value for key, value in HEADER_BY_TYPE[type].items() if key != 'Range'}
+
+
+def _stream_progress(done: int, total: int, written: int) -> str:
+    return f'{round(done / total * 100, 1)}% ({format_size(written)})'
+
+
+def _stream_resumed(
+    paused: tuple[int, _ContentHasher] | None, destination: str, count: int, algorithms: Iterable[str]
+) -> tuple[int, _ContentHasher]:
+    """
+    Gets the number of segments written to the .part file of the stream, and the hasher of them.
+
+    A stream paused in this run goes on from the written segments. (They are kept in memory,
+    since the hash can't be saved.) Otherwise, it's written from the start.
+    """
+    if paused is not None and paused[0] <= count and os.path.isfile(destination)\
+            and os.path.getsize(destination) == paused[1].length:
+        return paused
+    return 0, _ContentHasher(algorithms=algorithms)
+
+
+class _Bookkeeper:
+    """
+    Records of the downloaded files: the ledger, the blob store and the checksum manifests.
+
+    Methods return the result of the file, as the download functions do.
+    They touch the disk (and the ledger), so the asyncio engine calls them in threads.
+
+    Raises:
+        ValueError: If an algorithm is not available. (Checked once, rather than failing every file)
+    """
+
+    def __init__(
+        self, destination_dir: str, ledger: DownloadLedger | None, store: BlobStore | None,
+        checksum_manifest: bool, algorithms: Iterable[str]
+    ):
+        for algorithm in algorithms:
+            new_hash(algorithm)
+        self.__ledger = ledger
+        self.__store = store
+        self.__manifests = {
+            algorithm: ChecksumManifest(destination_dir, algorithm) for algorithm in ('sha256', *algorithms)
+        } if checksum_manifest else {}
+
+    def known(self, url: str, target: str) -> LedgerEntry | None:
+        """
+        Gets the entry of the url, if its file is at the target or in the store.
+
+        The file needn't be downloaded, unless it's changed on the server since.
+        So if the entry has a validator, it's checked by a conditional request. (304: reuse)
+        """
+        if self.__ledger is not None and self.__ledger.is_present(url, target):
+            return self.__ledger.get(url)
+        return self.find_stored(url)
+
+    def reuse(
+        self, url: str, target: str, entry: LedgerEntry, result_callback: Callable[[str], Any]
+    ) -> tuple[bool, str]:
+        """Keeps the known file at the target, or links it from the store."""
+        if not self.__ledger.is_present(url, target):
+            return self.link_stored(url, target, entry, result_callback)
+        self.__write_checksums(target, {'sha256': entry.sha256})
+        result_callback('이미 있음')
+        return True, '이미 있음'
+
+    def succeeded(
+        self, url: str, target: str, validator: str, digests: dict[str, str], budget: RetryBudget,
+        result_callback: Callable[[str], Any]
+    ) -> tuple[bool, str]:
+        if self.__ledger is not None:
+            self.__ledger.record(url, target, validator, digests['sha256'])
+            if self.__store is not None:
+                self.__store.add(target, digests['sha256'])
+        self.__write_checksums(target, digests)
+        return _finished(budget, result_callback)
+
+    def find_stored(self, url: str, size: int | None = None, validator: str = '') -> LedgerEntry | None:
+        """Finds stored blob of the url, or (if size given) of the same content."""
+        if self.__ledger is None or self.__store is None:
+            return None
+        entry = self.__ledger.get(url) if size is None else self.__ledger.find_same_content(size, validator)
+        return entry if entry is not None and self.__store.has(entry.sha256) else None
+
+    def link_stored(
+        self, url: str, target: str, entry: LedgerEntry, result_callback: Callable[[str], Any]
+    ) -> tuple[bool, str]:
+        self.__store.link(entry.sha256, target)
+        self.__ledger.record(url, target, entry.validator, entry.sha256)
+        self.__write_checksums(target, {'sha256': entry.sha256})
+        result_callback('성공 (중복)')
+        return True, '성공 (중복)'
+
+    def __write_checksums(self, target: str, digests: dict[str, str]) -> None:
+        for algorithm, digest in digests.items():
+            if digest and (manifest := self.__manifests.get(algorithm)) is not None:
+                manifest.record(os.path.basename(target), digest)
+
+
+class _PartFile:
+    """
+    The .part file of a target with its state, which a ranged download is written (and resumed) in.
+
+    Methods touch the disk, so the asyncio engine calls them in threads.
+    """
+
+    def __init__(self, target: str, url: str, type: MaterialTypes, file_metrics: FileMetrics, control: TransferControl):
+        self.target = target
+        self.path = f'{target}.part'
+        self.url = url
+        self.type = type
+        self.file_metrics = file_metrics
+        self.control = control
+        self.state = _PartState.load(f'{self.path}.json', url) if os.path.isfile(self.path) else None
+        self.output: _OutputFile | None = None
+        self.hasher: _ContentHasher | None = None
+
+    @property
+    def complete(self) -> bool:
+        """Whether every byte is received (by previous run)."""
+        return self.state is not None and not self.state.missing()
+
+    def headers(self) -> dict[str, str]:
+        """Headers of the first request: of the first missing range, if resumed."""
+        headers = HEADER_BY_TYPE[self.type]
+        if self.state is not None and (missing := self.state.missing()):
+            start, end = missing[0]
+            headers = headers | {'Range': f'bytes={start}-{min(start + CHUNK_SIZE, end)}'}
+            if self.state.validator:
+                headers['If-Range'] = self.state.validator
+        return headers
+
+    def hash_complete(self, algorithms: Iterable[str]) -> dict[str, str]:
+        """Hashes the complete file. Gets hex digest of each algorithm."""
+        with _OutputFile(self.path, self.state.total_length, False) as output:
+            hasher = _ContentHasher(output.read_at, algorithms)
+            hasher.add_written(0, self.state.total_length - 1)
+            hasher.catch_up()
+        return hasher.hexdigests()
+
+    def discard(self) -> None:
+        """Removes the file and its state, if any. (e.g. when the server sends the whole file)"""
+        if self.state is not None:
+            os.remove(self.path)
+            self.state.remove()
+            self.state = None
+
+    def open(self, range_: _Range, validator: str, algorithms: Iterable[str]) -> _OutputFile:
+        """
+        Opens the file for the ranged response. Ranges received before are left to hash by catch_up,
+        or dropped if the file is changed on the server.
+        """
+        if self.state is not None and (
+            self.state.total_length != range_.total_length or self.state.validator != validator
+        ):  # Changed on server
+            self.state.remove()
+            self.state = None
+        create = self.state is None
+        if create:
+            self.state = _PartState(f'{self.path}.json', self.url, range_.total_length, validator)
+        self.output = _OutputFile(self.path, range_.total_length, create)
+        self.hasher = _ContentHasher(self.output.read_at, algorithms)
+        for received_range in self.state.received:
+            self.hasher.add_written(*received_range)
+        return self.output
+
+    def segment(self, start: int, end: int, sizer: _ChunkSizer, result_callback: Callable[[str], Any]) -> '_Segment':
+        """Makes a segment of [start, end] alone. (e.g. of the first response)"""
+        progress = _ProgressCounter(self.state.received_length, self.state.total_length, result_callback)
+        return _Segment(self, start, end, sizer, progress, threading.Event())
+
+    def segments(self, count: int, sizer: _ChunkSizer, result_callback: Callable[[str], Any]) -> list['_Segment']:
+        """Splits each missing range into at most count segments, which are fetched concurrently. Empty if complete."""
+        progress = _ProgressCounter(self.state.received_length, self.state.total_length, result_callback)
+        aborted = threading.Event()
+        return [
+            _Segment(self, *segment, sizer, progress, aborted)
+            for gap in self.state.missing() for segment in _split_range(*gap, count)
+        ]
+
+    def finish(self) -> None:
+        """Renames the complete file to the target."""
+        os.rename(self.path, self.target)
+        self.state.remove()
+
+
+class _Segment:
+    """
+    Range [start, end] of a .part file, fetched chunk by chunk over a connection.
+
+    Each request asks the next chunk (sized by the sizer) from the received bytes.
+    Segments of a pass share the aborted flag, so a failure stops the others.
+    """
+
+    def __init__(
+        self, part: _PartFile, start: int, end: int, sizer: _ChunkSizer, progress: _ProgressCounter,
+        aborted: threading.Event
+    ):
+        self.__part = part
+        self.start = start
+        self.end = end
+        self.__sizer = sizer
+        self.__progress = progress
+        self.__aborted = aborted
+        self.__writer: _RangeWriter | None = None
+        self.__started = 0.0
+
+    @property
+    def pending(self) -> bool:
+        """Whether a chunk is left to request. (Not if aborted, or if the file is paused or cancelled)"""
+        return self.start <= self.end and not self.__aborted.is_set() and not self.__part.control.interrupted
+
+    def headers(self) -> dict[str, str]:
+        return HEADER_BY_TYPE[self.__part.type] | {
+            'Range': f'bytes={self.start}-{min(self.start + self.__sizer.size - 1, self.end)}'
+        }
+
+    def writer(self) -> _RangeWriter:
+        """Makes the writer of a response, from the received bytes."""
+        self.__started = time.monotonic()
+        self.__writer = self.__part.output.writer(self.start, self.__part.hasher)
+        return self.__writer
+
+    def check(self, status: int, headers: Any) -> str | None:
+        """Checks the response. Returns the reason, if the file fails (and the others are aborted)."""
+        if status != 206:
+            self.__sizer.record_error()
+            self.__aborted.set()
+            return f'Code: {status}'
+        if _extract_range_from_headers(headers).start != self.start:
+            self.__aborted.set()
+            return '잘못된 응답 범위'
+        return None
+
+    def record(self, error: str | None, interrupted: bool = False) -> None:
+        """Records the bytes written by the response, even on error, so they are not requested again."""
+        if (received := self.__writer.position - self.start) > 0:
+            elapsed = time.monotonic() - self.__started
+            self.__part.file_metrics.record_transfer(received, elapsed)
+            if error is None and not interrupted:
+                self.__sizer.record(received, elapsed)
+            self.__part.state.add(self.start, self.__writer.position - 1)
+            self.__progress(received, self.__sizer.size)
+            self.start = self.__writer.position
+            self.__part.hasher.catch_up()  # Off the writer, as the bytes are flushed
+        if error is not None:
+            self.__sizer.record_error()
+
+    def retry(self, error: str, budget: RetryBudget, tuner: ConcurrencyTuner | None) -> bool:
+        """Decides whether the failed request is retried within the budget. Otherwise the others are aborted."""
+        if tuner is not None:
+            tuner.record_error()
+        if self.__aborted.is_set() or not budget.take(error):
+            self.__aborted.set()
+            return False
+        return True
+
+
+class FileDownloader(WorkerBase):
+    def runner(
+        self,
+        selected_files: Iterable[tuple[str, MaterialTypes, str, Callable[[str], Any]]],
+        destination_dir: str,
+        segments: int = SEGMENT_COUNT,
+        min_chunk_size: int = MIN_CHUNK_SIZE,
+        max_chunk_size: int = MAX_CHUNK_SIZE,
+        ledger: DownloadLedger | None = None,
+        store: BlobStore | None = None,
+        scheduling: SchedulingPolicy = SchedulingPolicy.FIFO,
+        retry_budget: int = RETRY_BUDGET,
+        fast_hash: str = '',
+        checksum_manifest: bool = False,
+        write_buffers: int = WRITE_BUFFERS,
+        fsync: bool = False,
+        metrics: DownloadMetrics | None = None,
+        auto_tune: bool = False,
+        control: TransferControl | None = None,
+        sizes: Sequence[int | None] | None = None,
+        sink: ArchiveSink | None = None
+    ):
+        def wait_resumed(file_control: TransferControl, result_callback: Callable[[str], Any]) -> bool:
+            """Waits (in place) while the file is paused. Returns False if cancelled."""
+            if file_control.paused:
+                result_callback(PAUSED_TEXT)
+            return file_control.wait()
+
+        def request(
+            url: str, headers: dict[str, str], budget: RetryBudget, file_metrics: FileMetrics
+        ) -> requests.Response:
+            """Sends (streamed) GET request, retrying transient failures within the budget of the file."""
+            attempt = 0
+            while True:
+                retry_after = None
+                try:
+                    response = _get(url, headers, tuner)
+                except requests.RequestException:
+                    if not _retry_connection(budget, tuner):
+                        raise
+                else:
+                    if not _retry_response(response.status_code, 'Range' in headers, budget, file_metrics, tuner):
+                        return response
+                    retry_after = response.headers.get('Retry-After')
+                    response.close()
+                time.sleep(backoff_delay(attempt, retry_after))
+                attempt += 1
+
+        def writer_of(
+            write_many: Callable[[list[bytes | memoryview]], Any], staged: bool = True
+        ) -> Callable[[bytes | memoryview], Any]:
+            """
+            Makes write function, which writes by write_many in the writer stage (if enabled) or directly.
+            Writes into memory, or which can block (on the turn of an archive), are not staged.
+            """
+            write_many = _counting(write_many, metrics, tuner)
+            if stage is None or not staged:
+                return lambda data: write_many([data])
+            return stage.writer(write_many)
+
+        def flush(write: Callable[[bytes | memoryview], Any]) -> None:
+            if isinstance(write, QueuedWriter):
+                write.flush()
+
+        def download_segment(
+            segment: _Segment, url: str, budget: RetryBudget, file_metrics: FileMetrics, file_control: TransferControl
+        ) -> str | None:
+            """
+            Downloads the range of the segment at its offset. Returns the reason on failure.
+
+            Stops (without failure) when the file is paused or cancelled; the rest is left missing.
+            """
+            attempt = 0
+            while segment.pending:
+                write = writer_of(segment.writer().write_many)
+                error = None
+                interrupted = False
+                try:
+                    with request(url, segment.headers(), budget, file_metrics) as response:
+                        if (reason := segment.check(response.status_code, response.headers)) is not None:
+                            return reason
+                        _write_response(response, write, file_control)
+                except requests.RequestException:
+                    error = '연결 오류'
+                except TransferInterrupted:
+                    interrupted = True
+                finally:
+                    flush(write)
+
+                segment.record(error, interrupted)  # Keep received bytes, even on error
+                if error is None:
+                    attempt = 0
+                    continue
+                if not segment.retry(error, budget, tuner):
+                    return error
+                time.sleep(backoff_delay(attempt))
+                attempt += 1
+            return None
+
+        def download_file(
+            name: str, type: MaterialTypes, url: str, result_callback: Callable[[str], Any],
+            budget: RetryBudget, file_metrics: FileMetrics, file_control: TransferControl
+        ):
+            target = f'{destination_dir}/{name}'
+            if (known := book.known(url, target)) is not None and not known.validator:  # Can't be checked
+                return book.reuse(url, target, known, result_callback)
+            part = _PartFile(target, url, type, file_metrics, file_control)
+            if part.complete:
+                validator = part.state.validator
+                digests = part.hash_complete(algorithms)
+                part.finish()
+                return book.succeeded(url, target, validator, digests, budget, result_callback)
+
+            if (stop := _interrupted(file_control, result_callback)) is not None:
+                return stop
+            restart = False
+            started = time.monotonic()
+            headers = part.headers()
+            if known is not None:
+                headers = headers | _conditional_headers(known.validator)
+            try:
+                response = request(url, headers, budget, file_metrics)
+            except requests.RequestException:
+                return _failed('연결 오류', result_callback)
+            with response:
+                validator = response.headers.get('ETag') or response.headers.get('Last-Modified', '')
+                match response.status_code:
+                    case 304 if known is not None:  # Not changed (Or the condition is ignored, below)
+                        return book.reuse(url, target, known, result_callback)
+                    case 200 | 206 if known is not None and validator == known.validator:  # Not changed either
+                        return book.reuse(url, target, known, result_callback)
+                    case 200:
+                        part.discard()
+                        length = response.headers.get('Content-Length')
+                        if length is not None and (stored := book.find_stored(url, int(length), validator)) is not None:
+                            return book.link_stored(url, target, stored, result_callback)
+
+                        hasher = _ContentHasher(algorithms=algorithms)
+                        if os.path.lexists(target):  # Changed on server; unlinked, since it can be a link to a blob
+                            os.remove(target)
+                        try:
+                            with open(target, 'wb') as file:
+                                def write_many(views: list[bytes | memoryview]) -> None:
+                                    file.writelines(views)
+                                    for data in views:
+                                        hasher.update(data)
+                                write = writer_of(write_many)
+                                try:
+                                    _write_response(response, write, file_control)
+                                finally:
+                                    flush(write)
+                                    file_metrics.record_transfer(hasher.length, time.monotonic() - started)
+                                if fsync:
+                                    file.flush()
+                                    os.fsync(file.fileno())
+                        except requests.RequestException:
+                            # Can't be resumed without range, so downloaded again from the start
+                            os.remove(target)
+                            if not budget.take('연결 오류'):
+                                return _failed('연결 오류', result_callback)
+                            restart = True
+                        except TransferInterrupted:  # Likewise, downloaded again when resumed
+                            os.remove(target)
+                            restart = True
+                        if not restart and length is not None and hasher.length != int(length):
+                            os.remove(target)
+                            return _failed('크기 불일치', result_callback)
+                    case 206:
+                        range_ = _extract_range_from_headers(response.headers)
+                        if (stored := book.find_stored(url, range_.total_length, validator)) is not None:
+                            part.discard()
+                            return book.link_stored(url, target, stored, result_callback)
+                        with part.open(range_, validator, algorithms) as output:
+                            sizer = _ChunkSizer(min_chunk_size, max_chunk_size)
+                            first = part.segment(range_.start, range_.end, sizer, result_callback)
+                            write = writer_of(first.writer().write_many)
+                            error = None
+                            try:
+                                _write_response(response, write, file_control)
+                            except requests.RequestException:  # The rest is fetched by the segments
+                                error = '연결 오류'
+                            except TransferInterrupted:  # The rest is fetched by the segments, when resumed
+                                pass
+                            finally:
+                                flush(write)
+                            first.record(error)
+                            if error is not None and not budget.take(error):
+                                return _failed(error, result_callback)
+                            response.close()  # Frees the slot of the host for the segments
+
+                            # Until every range is received; paused segments stop, and resume from the offsets on disk
+                            while pending := part.segments(segments, sizer, result_callback):
+                                if (stop := _interrupted(file_control, result_callback)) is not None:
+                                    return stop
+                                with ThreadPoolExecutor(min(len(pending), segments)) as segment_executor:
+                                    results = tuple(segment_executor.map(
+                                        lambda segment: download_segment(
+                                            segment, url, budget, file_metrics, file_control
+                                        ),
+                                        pending
+                                    ))
+                                for reason in results:
+                                    if reason is not None:
+                                        return _failed(reason, result_callback)
+                            if fsync:
+                                output.sync()
+                            part.hasher.catch_up()  # Ranges received before, if not reached by the segments
+                        hasher = part.hasher
+                        if hasher.length != range_.total_length:  # The .part file is kept to resume
+                            return _failed('크기 불일치', result_callback)
+                        part.finish()
+                    case _:
+                        return _failed(f'Code: {response.status_code}', result_callback)
+            if restart:
+                if not file_control.interrupted:
+                    time.sleep(backoff_delay(budget.used - 1))
+                return download_file(name, type, url, result_callback, budget, file_metrics, file_control)
+            return book.succeeded(url, target, validator, hasher.hexdigests(), budget, result_callback)
+
+        def download_into_archive(
+            name: str, type: MaterialTypes, url: str, result_callback: Callable[[str], Any],
+            budget: RetryBudget, file_metrics: FileMetrics, file_control: TransferControl
+        ):
+            """
+            Downloads the file into the entry of the archive sink, as a sequential stream.
+
+            Broken (or paused) transfers are resumed by range request from the received bytes.
+            A streamed entry takes the turn of the archive before requesting its body,
+            so no connection is held while waiting for the turn.
+            Once the sink is broken (by a streamed entry which can't be resumed), files fail at once.
+            """
+            if hls.is_playlist(url):
+                return _failed('스트리밍 영상은 압축 파일에 저장 불가', result_callback)
+            entry = None
+            size = None
+            attempt = 0
+
+            def write_many(views: list[bytes | memoryview]) -> None:
+                entry.write_many(views)
+                if size:
+                    result_callback(f'{round(entry.written / size * 100, 1)}%')
+                else:
+                    result_callback(format_size(entry.written))
+
+            try:
+                while True:
+                    if sink.broken:
+                        return _failed('압축 파일 손상', result_callback)
+                    if entry is None:
+                        if (stop := _interrupted(file_control, result_callback)) is not None:
+                            return stop
+                    elif not wait_resumed(file_control, result_callback):  # Holds the entry (and the turn)
+                        return _cancelled(result_callback)
+                    received = entry.written if entry is not None else 0
+                    headers = HEADER_BY_TYPE[type]
+                    if received or 'Range' in headers:
+                        headers = headers | {'Range': f'bytes={received}-'}
+                    started = time.monotonic()
+                    try:
+                        response = request(url, headers, budget, file_metrics)
+                    except requests.RequestException:
+                        return _failed('연결 오류', result_callback)
+                    with response:
+                        match response.status_code:
+                            case 206:
+                                range_ = _extract_range_from_headers(response.headers)
+                                if range_.start != received:
+                                    return _failed('이어받기 불가', result_callback)
+                                size = range_.total_length
+                            case 200 if not received or not entry.streamed:
+                                if received:  # Range ignored; the buffered entry is fetched again from the start
+                                    entry.discard()
+                                    entry = None
+                                    received = 0
+                                length = response.headers.get('Content-Length')
+                                size = int(length) if length is not None else None
+                            case 200:  # Range ignored, and the streamed bytes can't be taken back
+                                return _failed('이어받기 불가', result_callback)
+                            case _:
+                                return _failed(f'Code: {response.status_code}', result_callback)
+                        if entry is None:
+                            entry = sink.entry(name, size)
+                            if entry.streamed:
+                                response.close()
+                                result_callback('대기 중')
+                                entry.begin()
+                                continue
+                        error = None
+                        try:
+                            _write_response(response, writer_of(write_many, staged=False), file_control)
+                        except requests.RequestException:
+                            error = '연결 오류'
+                        except TransferInterrupted:  # Resumed from the received bytes
+                            continue
+                        finally:
+                            file_metrics.record_transfer(entry.written - received, time.monotonic() - started)
+                    if error is None:
+                        break
+                    if not budget.take(error):
+                        return _failed(error, result_callback)
+                    time.sleep(backoff_delay(attempt))
+                    attempt += 1
+                if size is not None and entry.written != size:
+                    return _failed('크기 불일치', result_callback)
+                entry.commit()
+                entry = None
+            finally:
+                if entry is not None:
+                    entry.discard()
+            return _finished(budget, result_callback)
+
+        def fetch(url: str, headers: dict[str, str], budget: RetryBudget, file_metrics: FileMetrics) -> bytes:
+            """Gets the body of small resource. (e.g. playlist, key) Raises RuntimeError if not succeeded."""
+            with request(url, headers, budget, file_metrics) as response:
+                if response.status_code != 200:
+                    raise RuntimeError(f'Code: {response.status_code}')
+                return response.content
+
+        def download_stream(
+            name: str, type: MaterialTypes, url: str, result_callback: Callable[[str], Any],
+            budget: RetryBudget, file_metrics: FileMetrics, file_control: TransferControl
+        ):
+            """
+            Downloads the HLS playlist into a file.
+
+            Segments of the chosen variant are fetched concurrently, within a window
+            ahead of the writer, and written in order. The file is not resumed by
+            later runs; it is written again from the start. (But a paused stream
+            goes on from its written segments, when resumed)
+            """
+            target = f'{destination_dir}/{name}'
+            destination = f'{target}.part'
+            if (known := book.known(url, target)) is not None:  # Playlists have no validator to check
+                return book.reuse(url, target, known, result_callback)
+
+            if (stop := _interrupted(file_control, result_callback)) is not None:
+                return stop
+            headers = _stream_headers(type)
+            plan = hls.StreamPlan(url)
+            try:
+                while (next_url := plan.next_url()) is not None:
+                    plan.feed(fetch(next_url, headers, budget, file_metrics))
+            except requests.RequestException:
+                return _failed('연결 오류', result_callback)
+            except RuntimeError as e:
+                return _failed(str(e), result_callback)
+            except (ValueError, KeyError):
+                return _failed('재생 목록 오류', result_callback)
+            written, hasher = _stream_resumed(
+                paused_streams.pop(target, None), destination, len(plan.segments), algorithms
+            )
+            aborted = threading.Event()
+
+            def fetch_segment(segment: hls.Segment) -> bytes:
+                """
+                Fetches the segment (decrypted), retrying within the budget.
+                Raises TransferInterrupted if paused or cancelled.
+                """
+                attempt = 0
+                while True:
+                    if aborted.is_set():
+                        raise TransferInterrupted()
+                    file_control.check()
+                    buffer = bytearray()
+                    started = time.monotonic()
+
+                    def write_many(views: list[bytes | memoryview]) -> None:
+                        for data in views:
+                            buffer.extend(data)
+
+                    try:
+                        with request(
+                            segment.url, hls.segment_headers(segment, headers), budget, file_metrics
+                        ) as response:
+                            if response.status_code not in (200, 206):
+                                raise RuntimeError(f'Code: {response.status_code}')
+                            _write_response(response, writer_of(write_many, staged=False), file_control)
+                            partial = response.status_code == 206
+                    except requests.RequestException:
+                        if not _retry_connection(budget, tuner):
+                            raise
+                        time.sleep(backoff_delay(attempt))
+                        attempt += 1
+                        continue
+                    finally:
+                        file_metrics.record_transfer(len(buffer), time.monotonic() - started)
+                    return plan.content_of(segment, bytes(buffer), partial)
+
+            window = max(segments, 1) * hls.WINDOW_PER_SEGMENT
+            try:
+                with open(destination, 'ab' if written else 'wb') as file,\
+                        ThreadPoolExecutor(max(segments, 1)) as segment_executor:
+                    remaining = iter(plan.segments[written:])
+                    pending: deque[Future] = deque(
+                        segment_executor.submit(fetch_segment, part) for part in itertools.islice(remaining, window)
+                    )
+                    try:
+                        for done in range(written + 1, len(plan.segments) + 1):
+                            data = pending.popleft().result()
+                            if (part := next(remaining, None)) is not None:
+                                pending.append(segment_executor.submit(fetch_segment, part))
+                            file.write(data)
+                            hasher.update(data)
+                            written = done
+                            result_callback(_stream_progress(done, len(plan.segments), hasher.length))
+                    finally:  # Stops the rest, on failure
+                        aborted.set()
+                        for future in pending:
+                            future.cancel()
+                    if fsync:
+                        file.flush()
+                        os.fsync(file.fileno())
+            except TransferInterrupted:
+                if not file_control.cancelled:  # Goes on from the written segments, when resumed
+                    paused_streams[target] = (written, hasher)
+                    return _PAUSED
+                os.remove(destination)
+                return _cancelled(result_callback)
+            except requests.RequestException:
+                os.remove(destination)
+                return _failed('연결 오류', result_callback)
+            except RuntimeError as e:
+                os.remove(destination)
+                return _failed(str(e), result_callback)
+            except ValueError:
+                os.remove(destination)
+                return _failed('복호화 실패', result_callback)
+            os.rename(destination, target)
+            return book.succeeded(url, target, '', hasher.hexdigests(), budget, result_callback)
+
+        def download_measured(
+            index: int, name: str, type: MaterialTypes, url: str, result_callback: Callable[[str], Any]
+        ) -> Future:
+            """
+            Downloads the file in the pool. A paused file gives back its worker,
+            and is queued again when resumed.
+            """
+            budget = RetryBudget(retry_budget, result_callback)
+            file_metrics = metrics.file(name, url)
+            file_control = control.child(index) if control is not None else TransferControl()
+            if sink is not None:
+                download = download_into_archive
+            else:
+                download = download_stream if hls.is_playlist(url) else download_file
+            future = Future()
+
+            def run() -> None:
+                try:
+                    result = download(name, type, url, result_callback, budget, file_metrics, file_control)
+                except BaseException as e:  # pylint: disable = broad-except  # Raised by result() of the future
+                    future.set_exception(e)
+                    return
+                if result is _PAUSED:
+                    result_callback(PAUSED_TEXT)
+                    file_control.when_resumed(lambda: executor.submit(run))
+                    return
+                file_metrics.finish(*result, budget.used)
+                future.set_result(result)
+            executor.submit(run)
+            return future
+
+        if metrics is None:
+            metrics = DownloadMetrics()
+        algorithms = (fast_hash,) if fast_hash else ()
+        book = _Bookkeeper(destination_dir, ledger, store, checksum_manifest, algorithms)
+        paused_streams: dict[str, tuple[int, _ContentHasher]] = {}  # target -> written segments, hasher
+        tuner = ConcurrencyTuner(
+            max(self._workers_count, 4) * segments, on_change=metrics.record_concurrency
+        ) if auto_tune else None
+        selected_files = tuple(selected_files)
+        HttpClient().reserve(max(self._workers_count, 4) * segments)
+        metrics.track_pools(HttpClient().pool_stats)
+        stage = WriterStage(write_buffers, FILE_WRITE_SIZE) if write_buffers > 0 else None
+        # The writer stage is closed after every fetcher is done
+        with stage or contextlib.nullcontext(), ThreadPoolExecutor(max(self._workers_count, 4)) as executor:
+            if sizes is None:  # Not probed before
+                sizes = [None] * len(selected_files)
+                if scheduling is not SchedulingPolicy.FIFO:
+                    sizes = tuple(executor.map(
+                        lambda file: _remaining_size(*file[:3], destination_dir, ledger), selected_files
+                    ))
+            futures = {
+                index: download_measured(index, *selected_files[index]) for index in schedule(sizes, scheduling)
+            }
+            return tuple(futures[index].result() for index in range(len(selected_files)))
@@ -0,0 +1,180 @@
+from collections import deque
+import asyncio
+import threading
+
+
+DEFAULT_HOST_CONNECTIONS = 8
+
+
+class _Waiter:
+    """A thread (or asyncio task) waiting for a slot."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop | None = None):
+        self.loop = loop
+        self.event = threading.Event() if loop is None else loop.create_future()
+
+    def wake(self) -> None:
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self.__resolve)
+
+    def __resolve(self) -> None:
+        if not self.event.done():
+            self.event.set_result(None)
+
+
+class _HostSlots:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.waiters: deque[_Waiter] = deque()
+
+
+class HostSlot:
+    """An acquired slot of a host. Released once, however many times release is called."""
+
+    def __init__(self, limiter: 'HostLimiter', host: str):
+        self.__limiter = limiter
+        self.__host = host
+        self.__released = False
+        self.__lock = threading.Lock()
+
+    def release(self) -> None:
+        with self.__lock:
+            if self.__released:
+                return
+            self.__released = True
+        self.__limiter._release(self.__host)  # pylint: disable = protected-access
+
+    def __enter__(self) -> 'HostSlot':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.release()
+
+
+class HostLimiter:
+    """
+    Process-wide limiter of concurrent requests per host.
+
+    Every outgoing request (of threads, and of asyncio tasks) takes a slot of
+    its host until the response is closed, so concurrency against a server is
+    shaped by the limit of the server, not by the number of local workers.
+    Slots are given in the order they are requested.
+
+    Public functions and its signature:
+        def set_default_limit(self, limit: int) -> None:
+            Sets the limit of hosts without their own limit.
+        def set_limit(self, host: str, limit: int) -> None:
+            Sets the limit of a host.
+        def limit_of(self, host: str) -> int:
+            Gets the limit of a host.
+        def acquire(self, host: str) -> HostSlot:
+            Takes a slot of the host, blocks until available.
+        async def acquire_async(self, host: str) -> HostSlot:
+            Takes a slot of the host, waits until available. (For asyncio)
+    """
+    _instance = None
+    _inited = False
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if self._inited:
+            return
+        self.__lock = threading.Lock()
+        self.__default_limit = DEFAULT_HOST_CONNECTIONS
+        self.__limits: dict[str, int] = {}
+        self.__hosts: dict[str, _HostSlots] = {}
+        self._inited = True
+
+    def set_default_limit(self, limit: int) -> None:
+        """
+        Sets the limit of hosts without their own limit.
+
+        Args:
+            limit: The number of concurrent requests. At least 1.
+        """
+        with self.__lock:
+            self.__default_limit = max(limit, 1)
+            for host, slots in self.__hosts.items():
+                if host not in self.__limits:
+                    self.__set_slots_limit(slots, self.__default_limit)
+
+    def set_limit(self, host: str, limit: int) -> None:
+        """
+        Sets the limit of the host.
+
+        Args:
+            host: The host name. (e.g. lcms.knu.ac.kr)
+            limit: The number of concurrent requests. 0 means the default limit.
+        """
+        with self.__lock:
+            if limit > 0:
+                self.__limits[host] = limit
+            else:
+                self.__limits.pop(host, None)
+            if host in self.__hosts:
+                self.__set_slots_limit(self.__hosts[host], self.__limits.get(host, self.__default_limit))
+
+    def limit_of(self, host: str) -> int:
+        with self.__lock:
+            return self.__limits.get(host, self.__default_limit)
+
+    def acquire(self, host: str) -> HostSlot:
+        """Takes a slot of the host, blocks until available. The slot must be released."""
+        with self.__lock:
+            slots = self.__slots_of(host)
+            if slots.active < slots.limit and not slots.waiters:
+                slots.active += 1
+                return HostSlot(self, host)
+            waiter = _Waiter()
+            slots.waiters.append(waiter)
+        waiter.event.wait()  # The slot is handed over by _release
+        return HostSlot(self, host)
+
+    async def acquire_async(self, host: str) -> HostSlot:
+        """Takes a slot of the host, waits until available. The slot must be released."""
+        with self.__lock:
+            slots = self.__slots_of(host)
+            if slots.active < slots.limit and not slots.waiters:
+                slots.active += 1
+                return HostSlot(self, host)
+            waiter = _Waiter(asyncio.get_running_loop())
+            slots.waiters.append(waiter)
+        try:
+            await waiter.event
+        except asyncio.CancelledError:
+            with self.__lock:
+                handed_over = waiter not in slots.waiters
+                if not handed_over:
+                    slots.waiters.remove(waiter)
+            if handed_over:
+                self._release(host)
+            raise
+        return HostSlot(self, host)
+
+    def _release(self, host: str) -> None:
+        with self.__lock:
+            slots = self.__hosts[host]
+            if not slots.waiters or slots.active > slots.limit:
+                slots.active -= 1
+                return
+            waiter = slots.waiters.popleft()  # Hand over the slot
+        waiter.wake()
+
+    def __slots_of(self, host: str) -> _HostSlots:
+        if host not in self.__hosts:
+            self.__hosts[host] = _HostSlots(self.__limits.get(host, self.__default_limit))
+        return self.__hosts[host]
+
+    @staticmethod
+    def __set_slots_limit(slots: _HostSlots, limit: int) -> None:
+        slots.limit = limit
+        while slots.waiters and slots.active < slots.limit:
+            slots.active += 1
+            slots.waiters.popleft().wake()
@@ -0,0 +1,129 @@
+from collections.abc import Callable
+from typing import Any, Hashable
+import asyncio
+import threading
+
+
+PAUSED_TEXT = '일시정지'
+CANCELLED_TEXT = '취소됨'
+POLL_INTERVAL = 0.1  # seconds, of asyncio waiters
+
+
+class TransferInterrupted(Exception):
+    """Raised in the middle of a transfer, when it is paused or cancelled."""
+
+
+class TransferControl:
+    """
+    Cooperative pause/cancel token of transfers. Thread-safe.
+
+    The download engine checks it between ranges and buffer writes:
+    an interrupted transfer closes its response (so its network slots are
+    freed at once), keeps received bytes, and waits until resumed. A paused
+    file gives back its place in the pool, and is queued again by when_resumed.
+    A token of a batch has a child token for each file, which is paused
+    (or cancelled) when either itself or the batch is.
+
+    Public functions and its signature:
+        def child(self, key: Hashable) -> TransferControl:
+            Gets (or creates) the token of a file of the batch.
+        def pause(self) -> None:
+            Pauses the transfers.
+        def resume(self) -> None:
+            Resumes the transfers.
+        def cancel(self) -> None:
+            Cancels the transfers. (Can't be resumed)
+        def wait(self) -> bool:
+            Blocks while paused. Returns False if cancelled.
+        def when_resumed(self, callback: Callable[[], Any]) -> None:
+            Calls the callback when not paused, instead of blocking. (e.g. to queue the file again)
+        async def wait_async(self) -> bool:
+            Waits while paused. Returns False if cancelled. (For asyncio)
+        def check(self) -> None:
+            Raises TransferInterrupted if paused or cancelled.
+    """
+
+    def __init__(self, parent: 'TransferControl | None' = None):
+        self.__parent = parent
+        self.__condition = threading.Condition() if parent is None else parent.__condition
+        self.__children: dict[Hashable, TransferControl] = {}
+        self.__paused = False
+        self.__cancelled = False
+        self.__callbacks: list[Callable[[], Any]] = []
+
+    def child(self, key: Hashable) -> 'TransferControl':
+        with self.__condition:
+            if key not in self.__children:
+                self.__children[key] = TransferControl(self)
+            return self.__children[key]
+
+    @property
+    def paused(self) -> bool:
+        return not self.cancelled and (
+            self.__paused or (self.__parent is not None and self.__parent.paused)
+        )
+
+    @property
+    def cancelled(self) -> bool:
+        return self.__cancelled or (self.__parent is not None and self.__parent.cancelled)
+
+    @property
+    def interrupted(self) -> bool:
+        return self.paused or self.cancelled
+
+    def pause(self) -> None:
+        with self.__condition:
+            self.__paused = True
+
+    def resume(self) -> None:
+        """Resumes the transfers. Resuming a batch resumes its paused files, too."""
+        with self.__condition:
+            self.__paused = False
+            for child in self.__children.values():
+                child.__paused = False
+            self.__condition.notify_all()
+            callbacks = self.__root().__take_callbacks()
+        for callback in callbacks:
+            callback()
+
+    def cancel(self) -> None:
+        with self.__condition:
+            self.__cancelled = True
+            self.__condition.notify_all()
+            callbacks = self.__root().__take_callbacks()
+        for callback in callbacks:
+            callback()
+
+    def wait(self) -> bool:
+        with self.__condition:
+            self.__condition.wait_for(lambda: not self.paused)
+        return not self.cancelled
+
+    def when_resumed(self, callback: Callable[[], Any]) -> None:
+        """Calls the callback (once) at once if not paused, otherwise when resumed or cancelled."""
+        with self.__condition:
+            if self.paused:
+                self.__callbacks.append(callback)
+                return
+        callback()
+
+    async def wait_async(self) -> bool:
+        while self.paused:
+            await asyncio.sleep(POLL_INTERVAL)
+        return not self.cancelled
+
+    def check(self) -> None:
+        if self.interrupted:
+            raise TransferInterrupted()
+
+    def __root(self) -> 'TransferControl':
+        return self if self.__parent is None else self.__parent.__root()
+
+    def __take_callbacks(self) -> list[Callable[[], Any]]:
+        """Takes the callbacks of the tokens which are not paused anymore. (Under the lock)"""
+        callbacks = []
+        if not self.paused:
+            callbacks, self.__callbacks = self.__callbacks, []
+        for child in self.__children.values():
+            callbacks += child.__take_callbacks()
+        return callbacks
@@ -0,0 +1,203 @@
+from typing import NamedTuple
+import re
+import urllib.parse
+
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import unpad
+
+
+PLAYLIST_EXTENSION = '.m3u8'
+PLAYLIST_CONTENT_TYPE = 'application/vnd.apple.mpegurl'
+STREAM_EXTENSION = '.ts'  # Of the file the segments are concatenated into
+WINDOW_PER_SEGMENT = 2  # Segments fetched ahead of the writer, per parallel transfer
+
+_ATTRIBUTE_PATTERN = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+class Variant(NamedTuple):
+    url: str
+    bandwidth: int
+    resolution: int  # Pixels, 0 if unknown
+
+
+class Key(NamedTuple):
+    url: str
+    iv: bytes | None  # None if the IV is the media sequence number of the segment
+
+
+class Segment(NamedTuple):
+    url: str
+    byte_range: tuple[int, int] | None  # (start, end), inclusive
+    key: Key | None
+    sequence: int | None  # Media sequence number, None of an initialization section
+
+
+def is_playlist(url: str) -> bool:
+    return urllib.parse.urlsplit(url).path.lower().endswith(PLAYLIST_EXTENSION)
+
+
+def is_master(text: str) -> bool:
+    """Whether the playlist lists variants (of bandwidth or resolution), instead of segments."""
+    return '#EXT-X-STREAM-INF' in text
+
+
+def _attributes(text: str) -> dict[str, str]:
+    return {key: value.strip('"') for key, value in _ATTRIBUTE_PATTERN.findall(text)}
+
+
+def _check_header(text: str) -> list[str]:
+    lines = [line.strip() for line in text.splitlines()]
+    if not lines or lines[0] != '#EXTM3U':
+        raise ValueError('Not an m3u8 playlist')
+    return lines
+
+
+def parse_master(text: str, url: str) -> list[Variant]:
+    """Parses variants of the master playlist at the url."""
+    lines = _check_header(text)
+    variants = []
+    for k, line in enumerate(lines):
+        if not line.startswith('#EXT-X-STREAM-INF:'):
+            continue
+        attributes = _attributes(line.partition(':')[2])
+        uri = next((uri for uri in lines[k + 1:] if uri and not uri.startswith('#')), None)
+        if uri is None:
+            break
+        width, _, height = attributes.get('RESOLUTION', '').partition('x')
+        variants.append(Variant(
+            urllib.parse.urljoin(url, uri),
+            int(attributes.get('BANDWIDTH', '0') or 0),
+            int(width) * int(height) if width.isdigit() and height.isdigit() else 0
+        ))
+    if not variants:
+        raise ValueError('No variants in the playlist')
+    return variants
+
+
+def select_variant(variants: list[Variant]) -> Variant:
+    """Chooses the variant of the best quality: of the highest resolution, and then of the highest bandwidth."""
+    return max(variants, key=lambda variant: (variant.resolution, variant.bandwidth))
+
+
+def parse_media(text: str, url: str) -> list[Segment]:
+    """
+    Parses segments of the media playlist at the url, in order.
+
+    Initialization sections (EXT-X-MAP) are listed before the segments they apply to,
+    so the segments are playable when concatenated.
+    Only AES-128 encryption is supported.
+    """
+    lines = _check_header(text)
+    segments: list[Segment] = []
+    sequence = 0
+    key = None
+    byte_range = None
+    init = None
+    offsets: dict[str, int] = {}  # The end of the last byte range of each uri
+
+    def parse_range(spec: str, uri: str) -> tuple[int, int]:
+        length, _, offset = spec.partition('@')
+        if not offset and uri not in offsets:
+            raise ValueError(f'Byte range without offset: {spec}')
+        start = int(offset) if offset else offsets[uri]
+        offsets[uri] = start + int(length)
+        return start, start + int(length) - 1
+
+    for line in lines[1:]:
+        tag, _, value = line.partition(':')
+        match tag:
+            case '#EXT-X-MEDIA-SEQUENCE':
+                sequence = int(value)
+            case '#EXT-X-KEY':
+                attributes = _attributes(value)
+                match attributes.get('METHOD'):
+                    case 'NONE':
+                        key = None
+                    case 'AES-128':
+                        iv = attributes.get('IV')
+                        key = Key(
+                            urllib.parse.urljoin(url, attributes['URI']),
+                            bytes.fromhex(iv[2:]).rjust(16, b'\0') if iv else None
+                        )
+                    case method:
+                        raise ValueError(f'Unsupported encryption: {method}')
+            case '#EXT-X-MAP':
+                attributes = _attributes(value)
+                uri = urllib.parse.urljoin(url, attributes['URI'])
+                section = (uri, attributes.get('BYTERANGE'))
+                if section != init:  # Repeated before each discontinuity, but written once
+                    init = section
+                    if key is not None and key.iv is None:
+                        raise ValueError('Encrypted initialization section without IV')
+                    segments.append(Segment(uri, parse_range(section[1], uri) if section[1] else None, key, None))
+            case '#EXT-X-BYTERANGE':
+                byte_range = value
+            case _ if line and not line.startswith('#'):
+                uri = urllib.parse.urljoin(url, line)
+                segments.append(Segment(uri, parse_range(byte_range, uri) if byte_range else None, key, sequence))
+                sequence += 1
+                byte_range = None
+    if not any(segment.sequence is not None for segment in segments):
+        raise ValueError('No segments in the playlist')
+    return segments
+
+
+def decrypt(data: bytes, key: bytes, segment: Segment) -> bytes:
+    """Decrypts the AES-128 encrypted segment by the key. Raises ValueError if the data is malformed."""
+    iv = segment.key.iv if segment.key.iv is not None else segment.sequence.to_bytes(16, 'big')
+    return unpad(AES.new(key, AES.MODE_CBC, iv).decrypt(data), AES.block_size)
+
+
+def segment_headers(segment: Segment, headers: dict[str, str]) -> dict[str, str]:
+    """Headers of the request of the segment. (With its byte range, if any)"""
+    if segment.byte_range is None:
+        return headers
+    return headers | {'Range': f'bytes={segment.byte_range[0]}-{segment.byte_range[1]}'}
+
+
+class StreamPlan:
+    """
+    Loads the playlist (and keys) of a stream, without doing I/O.
+
+    The engines fetch each url it asks for, and feed the body. A master
+    playlist is resolved to the best variant, and then the keys of its
+    segments are fetched.
+
+    Public functions and its signature:
+        def next_url(self) -> str | None:
+            Gets the url to fetch next. None if loaded.
+        def feed(self, body: bytes) -> None:
+            Feeds the body of the url. Raises ValueError (or KeyError) if malformed.
+        def content_of(self, segment: Segment, data: bytes, partial: bool) -> bytes:
+            Gets the content of the fetched segment: its byte range, decrypted.
+    """
+
+    def __init__(self, url: str):
+        self.__url: str | None = url
+        self.__key_urls: list[str] = []
+        self.segments: list[Segment] = []
+        self.keys: dict[str, bytes] = {}
+
+    def next_url(self) -> str | None:
+        return self.__url
+
+    def feed(self, body: bytes) -> None:
+        if self.segments:  # Keys of the segments
+            self.keys[self.__url] = body
+        else:
+            text = body.decode('utf-8-sig')
+            if is_master(text):
+                self.__url = select_variant(parse_master(text, self.__url)).url
+                return
+            self.segments = parse_media(text, self.__url)
+            self.__key_urls = list(dict.fromkeys(
+                segment.key.url for segment in self.segments if segment.key is not None
+            ))
+        self.__url = self.__key_urls.pop(0) if self.__key_urls else None
+
+    def content_of(self, segment: Segment, data: bytes, partial: bool) -> bytes:
+        if segment.byte_range is not None and not partial:  # Range ignored by the server
+            data = data[segment.byte_range[0]:segment.byte_range[1] + 1]
+        if segment.key is not None:
+            data = decrypt(data, self.keys[segment.key.url], segment)
+        return data
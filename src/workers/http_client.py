@@ -0,0 +1,181 @@
+from collections import Counter
+from multiprocessing import cpu_count
+from typing import NamedTuple
+import threading
+import urllib.parse
+
+from requests.adapters import HTTPAdapter
+import requests
+
+from .concurrency import HostLimiter
+
+TIMEOUT = (10, 30)  # (connect, read) in seconds
+HOST_POOLS = 16
+
+
+class PoolStats(NamedTuple):
+    requests: int
+    connections: int
+
+    @property
+    def hits(self) -> int:
+        """The number of requests sent over reused (kept-alive) connection."""
+        return self.requests - self.connections
+
+    @property
+    def misses(self) -> int:
+        """The number of requests which needed new connection."""
+        return self.connections
+
+
+class _PooledSession(requests.Session):
+    """
+    Session which sends requests over the shared adapter, with default timeout.
+
+    Each request holds a slot of HostLimiter until the response is read,
+    or (if streamed) until the response is closed.
+    """
+
+    def __init__(self, adapter: HTTPAdapter):
+        super().__init__()
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        # pylint: disable = arguments-differ
+        kwargs.setdefault('timeout', TIMEOUT)
+        slot = HostLimiter().acquire(urllib.parse.urlsplit(url).hostname or '')
+        try:
+            response = super().request(method, url, **kwargs)
+        except BaseException:
+            slot.release()
+            raise
+        if not kwargs.get('stream'):
+            slot.release()
+            return response
+
+        close = response.close
+
+        def close_and_release() -> None:
+            try:
+                close()
+            finally:
+                slot.release()
+        response.close = close_and_release
+        return response
+
+    def close(self) -> None:
+        # The adapter (and its pools) is shared, so it must not be closed.
+        pass
+
+
+class HttpClient:
+    """
+    Process-wide HTTP client.
+
+    Every worker sends requests through this class, so keep-alive connections
+    are reused across requests (and workers) instead of connecting every time.
+    Connections are pooled per host, and cookies and headers are shared.
+
+    Public functions and its signature:
+        def get(self, url: str, **kwargs) -> requests.Response:
+            Sends GET request.
+        def post(self, url: str, **kwargs) -> requests.Response:
+            Sends POST request.
+        def head(self, url: str, **kwargs) -> requests.Response:
+            Sends HEAD request.
+        def session(self) -> requests.Session:
+            Makes session with its own cookies, on shared pools.
+        def reserve(self, connections: int) -> None:
+            Grows per-host pools to keep given number of connections.
+        def pool_stats(self) -> dict[str, PoolStats]:
+            Gets request and new connection counts per host.
+        def cookie_header(self, url: str) -> str | None:
+            Gets Cookie header value of shared cookies for the url.
+    """
+    _instance = None
+    _inited = False
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if self._inited:
+            return
+        self.__lock = threading.Lock()
+        self.__pool_size = cpu_count() * 2
+        self.__retired_stats: Counter[tuple[str, str]] = Counter()
+        self.__adapter = HTTPAdapter(pool_connections=HOST_POOLS, pool_maxsize=self.__pool_size)
+        self.__session = _PooledSession(self.__adapter)
+        self._inited = True
+
+    @property
+    def cookies(self) -> requests.cookies.RequestsCookieJar:
+        return self.__session.cookies
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return self.__session.headers
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.__session.get(url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.__session.post(url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        return self.__session.head(url, **kwargs)
+
+    def session(self) -> requests.Session:
+        """
+        Makes new session with its own cookies, which shares the pools.
+
+        Used where cookies must not be mixed with others. (e.g. login)
+        """
+        return _PooledSession(self.__adapter)
+
+    def reserve(self, connections: int) -> None:
+        """
+        Grows pool of each host to keep (at least) given number of connections alive.
+
+        Args:
+            connections: The number of concurrent connections to a host.
+        """
+        with self.__lock:
+            if connections <= self.__pool_size:
+                return
+            self.__retired_stats.update(self.__collect_stats())
+            self.__pool_size = connections
+            self.__adapter.init_poolmanager(HOST_POOLS, connections)
+
+    def pool_stats(self) -> dict[str, PoolStats]:
+        """
+        Gets the number of sent requests and made connections per host.
+
+        Requests beyond made connections are pool hits (connection reused),
+        and each made connection is a pool miss.
+        """
+        with self.__lock:
+            counts = self.__retired_stats + self.__collect_stats()
+        hosts = {host for host, _ in counts}
+        return {
+            host: PoolStats(counts[host, 'requests'], counts[host, 'connections'])
+            for host in sorted(hosts)
+        }
+
+    def cookie_header(self, url: str) -> str | None:
+        """Gets Cookie header value of shared cookies for the url. (For other HTTP clients)"""
+        return requests.cookies.get_cookie_header(self.__session.cookies, requests.Request('GET', url))
+
+    def __collect_stats(self) -> Counter[tuple[str, str]]:
+        counts: Counter[tuple[str, str]] = Counter()
+        pools = self.__adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            counts[pool.host, 'requests'] += pool.num_requests
+            counts[pool.host, 'connections'] += pool.num_connections
+        return counts
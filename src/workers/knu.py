@@ -1,17 +1,18 @@
 from bs4 import BeautifulSoup
 import requests
 
-from pyside_commons import ThreadRunner
+from .http_client import HttpClient
+from .runner import WorkerBase
 
 
-class KNUIdPwLoginWorker(ThreadRunner):
+class KNUIdPwLoginWorker(WorkerBase):
     LOGIN_URL = 'https://knusso.knu.ac.kr/authentication/idpw/loginProcess'
 
     def runner(self, id: str, pw: str):
         try:
-            response = requests.post(
+            response = HttpClient().session().post(
                 self.LOGIN_URL,
-                data={'id': id, 'pw': pw, 'agentId': '2'}, timeout=10
+                data={'id': id, 'pw': pw, 'agentId': '2'}
             )
         except requests.exceptions.Timeout:
             return {'success': False, 'code': 'Timeout', 'message': '로그인 실패'}
@@ -27,15 +28,14 @@ class KNUIdPwLoginWorker(ThreadRunner):
             }
         return {'success': True, 'knu_session': response.cookies['JSESSIONID']}
 
-class KNULoginPushSender(ThreadRunner):
+class KNULoginPushSender(WorkerBase):
     NOTIFICATION_URL = 'https://appfn.knu.ac.kr/login/notification'
 
     def runner(self, id: str):
         try:
-            response = requests.post(
+            response = HttpClient().session().post(
                 self.NOTIFICATION_URL,
-                json={'type': 'login', 'userId': id},
-                timeout=10
+                json={'type': 'login', 'userId': id}
             )
         except requests.exceptions.Timeout:
             return {'success': False, 'code': 'Timeout', 'message': '로그인 알림 전송 실패'}
@@ -48,12 +48,12 @@ class KNULoginPushSender(ThreadRunner):
             return {'success': False, 'code': '-', 'message': '로그인 알림 전송 실패'}
         return {'success': True, 'trial': response_json['data']['trId']}
 
-class KNUPushLoginWorker(ThreadRunner):
+class KNUPushLoginWorker(WorkerBase):
     REQUEST_URL = 'https://knusso.knu.ac.kr/authentication/raonuaf/loginProcess'
 
     def runner(self, id: str, trial: str):
         try:
-            response = requests.post(
+            response = HttpClient().session().post(
                 self.REQUEST_URL,
                 data={
                     'agentId': '2',
@@ -61,8 +61,7 @@ class KNUPushLoginWorker(ThreadRunner):
                     'svcId': 'SVC01SIT01KNUAC00000',
                     'svcTrId': trial,
                     'loginId': id,
-                },
-                timeout=10
+                }
             )
         except requests.exceptions.Timeout:
             return {'success': False, 'code': 'Timeout', 'message': '로그인 실패'}
@@ -0,0 +1,122 @@
+from typing import NamedTuple
+import os
+import sqlite3
+import threading
+import time
+
+
+class LedgerEntry(NamedTuple):
+    url: str
+    path: str
+    size: int
+    validator: str
+    sha256: str
+
+
+class DownloadLedger:
+    """
+    Persistent record of downloaded materials. (SQLite)
+
+    Maps url of a material to local path, size, validator and hash of the
+    downloaded file, so unchanged materials are not downloaded again.
+    Thread-safe.
+
+    Public functions and its signature:
+        def get(self, url: str) -> LedgerEntry | None:
+            Gets the entry of the url.
+        def is_present(self, url: str, path: str, validator: str | None = None) -> bool:
+            Checks whether the material is already downloaded to the path (and unchanged).
+        def find_same_content(self, size: int, validator: str) -> LedgerEntry | None:
+            Finds hashed entry with the size and validator. (Strong ETag only)
+        def record(self, url: str, path: str, validator: str = '', sha256: str = '') -> None:
+            Records downloaded material.
+        def close(self) -> None:
+            Closes the database.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open (or create) the ledger.
+
+        Args:
+            path: The path of database file.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        with self.__lock, self.__connection:
+            self.__connection.execute(
+                'CREATE TABLE IF NOT EXISTS materials ('
+                'url TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL, '
+                "validator TEXT NOT NULL DEFAULT '', sha256 TEXT NOT NULL DEFAULT '', "
+                'downloaded_at REAL NOT NULL)'
+            )
+            self.__connection.execute(
+                'CREATE INDEX IF NOT EXISTS materials_content ON materials (size, validator)'
+            )
+
+    def get(self, url: str) -> LedgerEntry | None:
+        with self.__lock:
+            row = self.__connection.execute(
+                'SELECT url, path, size, validator, sha256 FROM materials WHERE url = ?', (url,)
+            ).fetchone()
+        return None if row is None else LedgerEntry(*row)
+
+    def is_present(self, url: str, path: str, validator: str | None = None) -> bool:
+        """
+        Checks whether the material is already downloaded to the path.
+
+        True if the url is recorded with the path,
+        and the file is still there with the recorded size.
+        If the validator of the material on the server is given, it must be the recorded one.
+        (Unless either is empty, then they can't be compared)
+        """
+        entry = self.get(url)
+        if entry is None or entry.path != os.path.abspath(path):
+            return False
+        if validator and entry.validator and validator != entry.validator:  # Changed on server
+            return False
+        try:
+            return os.path.getsize(entry.path) == entry.size
+        except OSError:
+            return False
+
+    def find_same_content(self, size: int, validator: str) -> LedgerEntry | None:
+        """
+        Finds an entry (with hash) which has the same size and validator.
+
+        Returns None unless the validator is a strong ETag, since then the content can't be
+        identified: weak ETags and Last-Modified dates can be shared by different contents.
+        (Those are deduplicated by hash, once downloaded)
+        """
+        if not validator.startswith('"'):
+            return None
+        with self.__lock:
+            row = self.__connection.execute(
+                'SELECT url, path, size, validator, sha256 FROM materials '
+                "WHERE size = ? AND validator = ? AND sha256 != '' LIMIT 1",
+                (size, validator)
+            ).fetchone()
+        return None if row is None else LedgerEntry(*row)
+
+    def record(self, url: str, path: str, validator: str = '', sha256: str = '') -> None:
+        """
+        Records downloaded material. Size is taken from the file.
+
+        Args:
+            url: The url of the material.
+            path: The path of downloaded file.
+            validator: The ETag or Last-Modified of the response, if any.
+            sha256: Hex digest of the file, if known.
+        """
+        path = os.path.abspath(path)
+        size = os.path.getsize(path)
+        with self.__lock, self.__connection:
+            self.__connection.execute(
+                'INSERT OR REPLACE INTO materials VALUES (?, ?, ?, ?, ?, ?)',
+                (url, path, size, validator, sha256, time.time())
+            )
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__connection.close()
@@ -0,0 +1,282 @@
+from collections import Counter
+from collections.abc import Callable
+from typing import Any
+import json
+import os
+import threading
+import time
+
+from .http_client import PoolStats
+
+
+METRIC_PREFIX = 'lecture_downloader'
+
+
+def _write_atomic(path: str, text: str) -> None:
+    """Writes the file by replacing, so readers (e.g. node-exporter) never see partial one."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(f'{path}.tmp', 'w', encoding='utf-8', newline='\n') as file:
+        file.write(text)
+    os.replace(f'{path}.tmp', path)
+
+
+class FileMetrics:
+    """
+    Metrics of a file, recorded by the download engine. Thread-safe.
+
+    Time to first byte is from the start of the file to the first response
+    with a body. (Retried responses are counted, but are not the first byte)
+    Peak throughput is the highest throughput of a response.
+    """
+
+    def __init__(self, name: str, url: str):
+        self.__lock = threading.Lock()
+        self.name = name
+        self.url = url
+        self.started = time.time()
+        self.__started = time.monotonic()
+        self.__first_byte: float | None = None
+        self.__finished: float | None = None
+        self.__bytes = 0
+        self.__requests = 0
+        self.__range_requests = 0
+        self.__peak_throughput = 0.
+        self.__statuses: Counter[int] = Counter()
+        self.retries = 0
+        self.success: bool | None = None
+        self.result = ''
+
+    def record_response(self, status: int, ranged: bool = False) -> None:
+        """Records a response of the file."""
+        with self.__lock:
+            self.__requests += 1
+            self.__range_requests += ranged
+            self.__statuses[status] += 1
+            if self.__first_byte is None and status in (200, 206):
+                self.__first_byte = time.monotonic() - self.__started
+
+    def record_transfer(self, received: int, seconds: float) -> None:
+        """Records bytes received by a response, in given seconds."""
+        with self.__lock:
+            self.__bytes += received
+            if seconds > 0:
+                self.__peak_throughput = max(self.__peak_throughput, received / seconds)
+
+    def finish(self, success: bool, result: str, retries: int = 0) -> None:
+        with self.__lock:
+            self.__finished = time.monotonic() - self.__started
+            self.success = success
+            self.result = result
+            self.retries = retries
+
+    @property
+    def statuses(self) -> Counter[int]:
+        with self.__lock:
+            return Counter(self.__statuses)
+
+    def to_dict(self) -> dict[str, Any]:
+        with self.__lock:
+            wall_time = self.__finished if self.__finished is not None else time.monotonic() - self.__started
+            return {
+                'name': self.name,
+                'url': self.url,
+                'started': self.started,
+                'finished': self.__finished is not None,
+                'success': self.success,
+                'result': self.result,
+                'bytes': self.__bytes,
+                'wall_time': round(wall_time, 3),
+                'ttfb': None if self.__first_byte is None else round(self.__first_byte, 3),
+                'mean_throughput': round(self.__bytes / wall_time, 1) if wall_time > 0 else 0.,
+                'peak_throughput': round(self.__peak_throughput, 1),
+                'requests': self.__requests,
+                'range_requests': self.__range_requests,
+                'retries': self.retries,
+                'statuses': {str(status): count for status, count in sorted(self.__statuses.items())},
+            }
+
+
+class DownloadMetrics:
+    """
+    Metrics of a download run: of each file, and of the whole run.
+
+    Can be exported as a JSON report, and as a Prometheus text file
+    (for the textfile collector of node-exporter). Exported while the run
+    is in progress, unfinished files are included as they are.
+
+    The ETA is weighted by bytes: the bytes left (of the sizes probed
+    before the run) over the mean throughput of the run so far.
+
+    Pools of the HTTP client are shared by the process, so the requests
+    and connections of the run are counted from its start.
+
+    Public functions and its signature:
+        def file(self, name: str, url: str) -> FileMetrics:
+            Starts recording metrics of a file.
+        def expect(self, size: int) -> None:
+            Sets the number of bytes to be received by the run.
+        def record_received(self, received: int) -> None:
+            Records bytes as they are received. (Of any file)
+        def estimate(self) -> tuple[int, int | None, float | None]:
+            Gets received bytes, expected bytes, and the ETA in seconds.
+        def record_concurrency(self, level: int, reason: str) -> None:
+            Records the number of parallel transfers, chosen by the tuner.
+        def track_pools(self, pool_stats: Callable[[], dict[str, PoolStats]]) -> None:
+            Counts requests and new connections per host, by pool_stats, from now.
+        def report(self) -> dict[str, Any]:
+            Makes the report of the run. (Aggregate, and of each file)
+        def write_json(self, path: str) -> None:
+            Writes the report as JSON.
+        def write_prometheus(self, path: str) -> None:
+            Writes the aggregate metrics in Prometheus text format.
+    """
+
+    def __init__(self, on_concurrency: Callable[[int, str], Any] | None = None):
+        """
+        Args:
+            on_concurrency: Called with the number of parallel transfers and the reason,
+                when the tuner changes it.
+        """
+        self.__lock = threading.Lock()
+        self.__files: list[FileMetrics] = []
+        self.__concurrency: list[tuple[float, int, str]] = []  # (seconds from start, level, reason)
+        self.__on_concurrency = on_concurrency
+        self.started = time.time()
+        self.__started = time.monotonic()
+        self.__expected: int | None = None
+        self.__received = 0
+        self.__pool_stats: Callable[[], dict[str, PoolStats]] | None = None
+        self.__pools_before: dict[str, PoolStats] = {}
+
+    def file(self, name: str, url: str) -> FileMetrics:
+        file_metrics = FileMetrics(name, url)
+        with self.__lock:
+            self.__files.append(file_metrics)
+        return file_metrics
+
+    def expect(self, size: int) -> None:
+        with self.__lock:
+            self.__expected = size
+
+    def record_received(self, received: int) -> None:
+        with self.__lock:
+            self.__received += received
+
+    def estimate(self) -> tuple[int, int | None, float | None]:
+        """
+        Gets the progress of the run.
+
+        Returns:
+            tuple[int, int | None, float | None]:
+                Received bytes, expected bytes (None if not set),
+                and the ETA in seconds (None if not known yet).
+        """
+        with self.__lock:
+            received, expected = self.__received, self.__expected
+        if expected is None or not received:
+            return received, expected, None
+        throughput = received / (time.monotonic() - self.__started)
+        return received, expected, max(expected - received, 0) / throughput
+
+    def record_concurrency(self, level: int, reason: str) -> None:
+        with self.__lock:
+            self.__concurrency.append((round(time.monotonic() - self.__started, 3), level, reason))
+        if self.__on_concurrency is not None:
+            self.__on_concurrency(level, reason)
+
+    def track_pools(self, pool_stats: Callable[[], dict[str, PoolStats]]) -> None:
+        pools_before = pool_stats()
+        with self.__lock:
+            self.__pool_stats = pool_stats
+            self.__pools_before = pools_before
+
+    def __pools(self) -> dict[str, dict[str, int]]:
+        """Requests, new connections and reused connections per host, since tracked."""
+        with self.__lock:
+            pool_stats, pools_before = self.__pool_stats, self.__pools_before
+        if pool_stats is None:
+            return {}
+        pools = {}
+        for host, stats in pool_stats().items():
+            before = pools_before.get(host, PoolStats(0, 0))
+            stats = PoolStats(stats.requests - before.requests, stats.connections - before.connections)
+            if stats.requests:
+                pools[host] = {'requests': stats.requests, 'connections': stats.misses, 'reused': stats.hits}
+        return pools
+
+    def report(self) -> dict[str, Any]:
+        with self.__lock:
+            files = list(self.__files)
+            concurrency = list(self.__concurrency)
+            expected = self.__expected
+        file_reports = [file_metrics.to_dict() for file_metrics in files]
+        statuses: Counter[int] = sum((file_metrics.statuses for file_metrics in files), Counter())
+        wall_time = time.monotonic() - self.__started
+        total_bytes = sum(report['bytes'] for report in file_reports)
+        ttfbs = [report['ttfb'] for report in file_reports if report['ttfb'] is not None]
+        return {
+            'started': self.started,
+            'wall_time': round(wall_time, 3),
+            'files': len(file_reports),
+            'finished': sum(report['finished'] for report in file_reports),
+            'succeeded': sum(report['success'] is True for report in file_reports),
+            'failed': sum(report['success'] is False for report in file_reports),
+            'bytes': total_bytes,
+            'expected_bytes': expected,
+            'mean_throughput': round(total_bytes / wall_time, 1) if wall_time > 0 else 0.,
+            'peak_throughput': max((report['peak_throughput'] for report in file_reports), default=0.),
+            'mean_ttfb': round(sum(ttfbs) / len(ttfbs), 3) if ttfbs else None,
+            'requests': sum(report['requests'] for report in file_reports),
+            'range_requests': sum(report['range_requests'] for report in file_reports),
+            'retries': sum(report['retries'] for report in file_reports),
+            'statuses': {str(status): count for status, count in sorted(statuses.items())},
+            'concurrency': [
+                {'time': at, 'level': level, 'reason': reason} for at, level, reason in concurrency
+            ],
+            'pools': self.__pools(),
+            'file_reports': file_reports,
+        }
+
+    def write_json(self, path: str) -> None:
+        _write_atomic(path, json.dumps(self.report(), ensure_ascii=False, indent=2))
+
+    def write_prometheus(self, path: str) -> None:
+        report = self.report()
+        lines = []
+
+        def metric(name: str, type_: str, help_: str, samples: list[tuple[str, Any]]):
+            lines.append(f'# HELP {METRIC_PREFIX}_{name} {help_}')
+            lines.append(f'# TYPE {METRIC_PREFIX}_{name} {type_}')
+            lines.extend(f'{METRIC_PREFIX}_{name}{labels} {value}' for labels, value in samples)
+
+        metric('run_start_time_seconds', 'gauge', 'Start time of the run.', [('', report['started'])])
+        metric('run_duration_seconds', 'gauge', 'Wall time of the run.', [('', report['wall_time'])])
+        metric('files', 'gauge', 'Files of the run.', [('', report['files'])])
+        metric('files_finished', 'gauge', 'Finished files, by result.', [
+            ('{result="success"}', report['succeeded']), ('{result="failure"}', report['failed'])
+        ])
+        metric('bytes_total', 'counter', 'Received bytes.', [('', report['bytes'])])
+        if report['expected_bytes'] is not None:
+            metric('expected_bytes', 'gauge', 'Bytes to be received by the run.', [('', report['expected_bytes'])])
+        metric('throughput_bytes_per_second', 'gauge', 'Mean and peak throughput.', [
+            ('{stat="mean"}', report['mean_throughput']), ('{stat="peak"}', report['peak_throughput'])
+        ])
+        if report['mean_ttfb'] is not None:
+            metric('ttfb_seconds', 'gauge', 'Mean time to first byte of files.', [('', report['mean_ttfb'])])
+        metric('requests_total', 'counter', 'Requests, including range requests.', [('', report['requests'])])
+        metric('range_requests_total', 'counter', 'Range requests.', [('', report['range_requests'])])
+        metric('retries_total', 'counter', 'Retries of requests.', [('', report['retries'])])
+        metric('responses_total', 'counter', 'Responses, by HTTP status.', [
+            (f'{{code="{status}"}}', count) for status, count in report['statuses'].items()
+        ])
+        if report['concurrency']:
+            metric('concurrency', 'gauge', 'Parallel transfers, chosen by the tuner.', [
+                ('', report['concurrency'][-1]['level'])
+            ])
+        if report['pools']:
+            metric('pool_requests_total', 'counter', 'Requests of the HTTP pools, by host and connection.', [
+                (f'{{host="{host}",connection="{connection}"}}', stats[key])
+                for host, stats in report['pools'].items()
+                for connection, key in (('new', 'connections'), ('reused', 'reused'))
+            ])
+        _write_atomic(path, '\n'.join(lines) + '\n')
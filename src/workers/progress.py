@@ -0,0 +1,64 @@
+from collections.abc import Callable
+import threading
+
+
+REFRESH_INTERVAL = 50  # ms (20Hz)
+
+
+def format_size(size: int) -> str:
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            return f'{round(size, 1)}{unit}'
+        size /= 1024
+    return f'{round(size, 1)}GiB'
+
+
+def format_duration(seconds: float) -> str:
+    seconds = round(seconds)
+    if seconds < 60:
+        return f'{seconds}초'
+    if seconds < 3600:
+        return f'{seconds // 60}분 {seconds % 60}초'
+    return f'{seconds // 3600}시간 {seconds % 3600 // 60}분'
+
+
+class ProgressBoard:
+    """
+    Thread-safe board of the latest status of each row.
+
+    Download workers write statuses here (as often as they want) instead of
+    signaling UI for each chunk, and UI takes the pending ones periodically,
+    so only the latest status of each row is shown once per refresh.
+
+    Public functions and its signature:
+        def reporter(self, row: int) -> Callable[[str], None]:
+            Makes result callback which writes status of the row.
+        def set(self, row: int, status: str) -> None:
+            Writes status of the row.
+        def take(self) -> dict[int, str]:
+            Takes statuses written after last take.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__pending: dict[int, str] = {}
+
+    def reporter(self, row: int) -> Callable[[str], None]:
+        def inner(status: str) -> None:
+            self.set(row, status)
+        return inner
+
+    def set(self, row: int, status: str) -> None:
+        with self.__lock:
+            self.__pending[row] = status
+
+    def take(self) -> dict[int, str]:
+        """
+        Takes statuses written after last take.
+
+        Returns:
+            dict[int, str]: The latest status of each row. (row number -> status)
+        """
+        with self.__lock:
+            pending, self.__pending = self.__pending, {}
+        return pending
@@ -0,0 +1,44 @@
+"""
+Workers for GUI, which run in QThread.
+
+Each class runs runner of the Qt-free worker of the same name,
+by ThreadRunner (or AsyncioThreadRunner) of pyside_commons.
+"""
+from pyside_commons import ThreadRunner, AsyncioThreadRunner
+from . import async_commons, canvas, commons, knu
+
+
+class KNUIdPwLoginWorker(knu.KNUIdPwLoginWorker, ThreadRunner):
+    pass
+
+
+class KNULoginPushSender(knu.KNULoginPushSender, ThreadRunner):
+    pass
+
+
+class KNUPushLoginWorker(knu.KNUPushLoginWorker, ThreadRunner):
+    pass
+
+
+class CanvasLoginWorker(canvas.CanvasLoginWorker, ThreadRunner):
+    pass
+
+
+class CanvasSubjectGetter(canvas.CanvasSubjectGetter, ThreadRunner):
+    pass
+
+
+class CanvasFileInfoGetter(canvas.CanvasFileInfoGetter, ThreadRunner):
+    pass
+
+
+class MaterialProber(commons.MaterialProber, ThreadRunner):
+    pass
+
+
+class FileDownloader(commons.FileDownloader, ThreadRunner):
+    pass
+
+
+class AsyncFileDownloader(async_commons.AsyncFileDownloader, AsyncioThreadRunner):
+    pass
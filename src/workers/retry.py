@@ -0,0 +1,87 @@
+from collections.abc import Callable
+from email.utils import parsedate_to_datetime
+from typing import Any
+import datetime
+import random
+import threading
+
+
+RETRY_BUDGET = 8  # per file
+BACKOFF_BASE = 0.5  # seconds
+BACKOFF_MAX = 30  # seconds
+RETRYABLE_STATUS_CODES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Parses Retry-After header value. (delay in seconds, or HTTP-date)
+
+    Returns:
+        float | None: Seconds to wait. None if not given or illegal.
+    """
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return max((date - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0.)
+
+
+def backoff_delay(attempt: int, retry_after: str | None = None) -> float:
+    """
+    Gets seconds to wait before the retry.
+
+    Exponential backoff with full jitter, so retries of segments (and files)
+    which failed together are spread out. Retry-After of the server is
+    honoured if given, but capped to BACKOFF_MAX.
+
+    Args:
+        attempt: The number of retries of the request before this one. (from 0)
+        retry_after: The Retry-After header value of the response, if any.
+    """
+    delay = parse_retry_after(retry_after)
+    if delay is None:
+        delay = random.uniform(0, min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX))
+    return min(delay, BACKOFF_MAX)
+
+
+class RetryBudget:
+    """
+    Thread-safe retry budget of a file, shared by its segments.
+
+    Each retry takes one from the budget and is reported to the result
+    callback, so retries are shown in the status column of the file.
+    """
+
+    def __init__(self, budget: int, result_callback: Callable[[str], Any]):
+        self.__lock = threading.Lock()
+        self.__budget = budget
+        self.__used = 0
+        self.__result_callback = result_callback
+
+    @property
+    def used(self) -> int:
+        return self.__used
+
+    def take(self, reason: str) -> bool:
+        """
+        Takes one retry, if left.
+
+        Args:
+            reason: The reason of retry, to display. (e.g. 'Code: 502')
+
+        Returns:
+            bool: Whether the retry is allowed.
+        """
+        with self.__lock:
+            if self.__used >= self.__budget:
+                return False
+            self.__used += 1
+            used = self.__used
+        self.__result_callback(f'재시도 {used}/{self.__budget} ({reason})')
+        return True
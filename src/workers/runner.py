@@ -0,0 +1,17 @@
+from multiprocessing import cpu_count
+import platform
+
+
+class WorkerBase:
+    """
+    Qt-free base class of workers.
+
+    The work is done by runner, which takes the arguments and returns the
+    result (runner of asyncio workers is coroutine function). GUI runs it
+    in QThread, by the classes in workers.qt, and headless callers (e.g. cli)
+    call runner directly.
+    """
+    _workers_count = 4 if 'faked' in platform.release() else cpu_count() * 2
+
+    def runner(self, *args, **kwargs):
+        raise NotImplementedError
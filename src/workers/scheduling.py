@@ -0,0 +1,36 @@
+from collections.abc import Sequence
+from enum import Enum
+
+
+class SchedulingPolicy(Enum):
+    FIFO = 'fifo'
+    SHORTEST_FIRST = 'sjf'
+    LONGEST_FIRST = 'lpt'
+
+
+def schedule(sizes: Sequence[int | None], policy: SchedulingPolicy) -> list[int]:
+    """
+    Decides the order to start downloads.
+
+    SHORTEST_FIRST gives the best mean time until each file is done,
+    LONGEST_FIRST gives the shortest time until all files are done,
+    and FIFO keeps the given order.
+    Files of unknown size are started last, in the given order.
+
+    Args:
+        sizes: The (remaining) size of each file. None if unknown.
+        policy: The scheduling policy.
+
+    Returns:
+        list[int]: The indexes of files, in order to start.
+    """
+    indexes = range(len(sizes))
+    match policy:
+        case SchedulingPolicy.FIFO:
+            return list(indexes)
+        case SchedulingPolicy.SHORTEST_FIRST:
+            return sorted(indexes, key=lambda k: (sizes[k] is None, sizes[k] or 0))
+        case SchedulingPolicy.LONGEST_FIRST:
+            return sorted(indexes, key=lambda k: (sizes[k] is None, -(sizes[k] or 0)))
+        case _:
+            raise ValueError(f'Unknown scheduling policy. ({policy})')
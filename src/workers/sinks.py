@@ -0,0 +1,267 @@
+from enum import Enum
+from typing import Any, BinaryIO
+import re
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+
+
+ARCHIVE_BUFFER_SIZE = 8 * 1024 ** 2  # 8MiB, files up to this size are fetched concurrently into memory
+STREAM_BUFFER_SIZE = 1024 ** 2  # 1MiB, buffer of archive files
+
+
+class SinkType(Enum):
+    DIRECTORY = 'directory'
+    ZIP = 'zip'
+    TAR = 'tar'
+
+
+class _Unseekable:
+    """Write-only view of the stream, which hides seek, so archives are written strictly in order."""
+
+    def __init__(self, stream: BinaryIO):
+        self.__stream = stream
+
+    def write(self, data: bytes | memoryview) -> int:
+        return self.__stream.write(data)
+
+    def flush(self) -> None:
+        self.__stream.flush()
+
+
+class ArchiveEntry:
+    """
+    Entry of an archive, written by the fetcher of a file.
+
+    Small files (and files of unknown size) are buffered, and written to
+    the archive at once on commit, so they can be fetched concurrently.
+    Buffers are kept in memory up to ARCHIVE_BUFFER_SIZE; only the rest of
+    a file of unknown size (which can't be streamed, as tar needs the size
+    in the header) is spilled to a temporary file.
+    Larger files are streamed into the archive as bytes arrive, in the turn
+    of the archive, which is taken by begin (or the first write).
+    Fetchers should take the turn before requesting the body of a streamed
+    entry, so no connection is held while waiting for it.
+    """
+
+    def __init__(self, sink: 'ArchiveSink', name: str, size: int | None):
+        self.__sink = sink
+        self.__name = name
+        self.__size = size
+        self.streamed = size is not None and size > ARCHIVE_BUFFER_SIZE
+        self.__buffer: tempfile.SpooledTemporaryFile | None =\
+            None if self.streamed else tempfile.SpooledTemporaryFile(ARCHIVE_BUFFER_SIZE)
+        self.__turn = False
+        self.__handle: Any = None  # Of the sink, once started
+        self.written = 0
+
+    def begin(self) -> None:
+        """Waits for the turn of the archive. The entry is started by its first bytes."""
+        if not self.__turn:
+            self.__sink._take_turn()
+            self.__turn = True
+
+    def write(self, data: bytes | memoryview) -> None:
+        self.written += len(data)
+        if self.__buffer is not None:
+            self.__buffer.write(data)
+            return
+        self.__start(self.__size)
+        self.__sink._write(self.__handle, data)
+
+    def write_many(self, views: list[bytes | memoryview]) -> None:
+        for data in views:
+            self.write(data)
+
+    def commit(self) -> None:
+        """Finishes the entry."""
+        if self.__buffer is not None:
+            buffer, self.__buffer = self.__buffer, None
+            with buffer:
+                self.__start(self.written)
+                buffer.seek(0)
+                while data := buffer.read(STREAM_BUFFER_SIZE):
+                    self.__sink._write(self.__handle, data)
+        self.__start(self.__size)
+        handle, self.__handle = self.__handle, None
+        self.__end(handle, True)
+
+    def discard(self) -> None:
+        """Drops the entry. (An entry being streamed can't be taken back from tar; the sink is then broken)"""
+        if self.__buffer is not None:
+            self.__buffer.close()
+            self.__buffer = None
+        handle, self.__handle = self.__handle, None
+        self.__end(handle, False)
+
+    def __start(self, size: int | None) -> None:
+        self.begin()
+        if self.__handle is None:
+            self.__handle = self.__sink._begin_entry(self.__name, size)
+
+    def __end(self, handle: Any, complete: bool) -> None:
+        try:
+            if handle is not None:
+                self.__sink._end_entry(handle, complete)
+        finally:
+            if self.__turn:
+                self.__turn = False
+                self.__sink._give_turn()
+
+
+class ArchiveSink:
+    """
+    Base of the sinks, which write downloaded files into an archive stream.
+
+    The stream is written strictly in order, without seek: only one entry
+    is written at once. (The turn of the archive) Entries are in the order
+    they are finished.
+
+    If an entry is dropped after its bytes were written, and they can't be
+    taken back, the sink is broken: the archive is invalid, and files after
+    it should not be fetched.
+
+    Public functions and its signature:
+        def entry(self, name: str, size: int | None) -> ArchiveEntry:
+            Makes entry of the file, of given size (None if unknown).
+        def close(self) -> None:
+            Finishes the archive. (And closes the stream, if owned)
+    """
+
+    def __init__(self, stream: BinaryIO, close_stream: bool = False):
+        """
+        Args:
+            stream: The stream to write the archive.
+            close_stream: Whether the stream is closed by close.
+        """
+        self._stream = stream
+        self.__close_stream = close_stream
+        self.__turn = threading.Lock()
+        self.broken = False
+
+    def __enter__(self) -> 'ArchiveSink':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def entry(self, name: str, size: int | None) -> ArchiveEntry:
+        return ArchiveEntry(self, name, size)
+
+    def close(self) -> None:
+        self._stream.flush()
+        if self.__close_stream:
+            self._stream.close()
+
+    def _take_turn(self) -> None:
+        self.__turn.acquire()  # pylint: disable = consider-using-with  # Released by _give_turn
+
+    def _give_turn(self) -> None:
+        self.__turn.release()
+
+    def _write(self, handle: Any, data: bytes | memoryview) -> None:
+        raise NotImplementedError
+
+    def _begin_entry(self, name: str, size: int | None) -> Any:
+        raise NotImplementedError
+
+    def _end_entry(self, handle: Any, complete: bool) -> None:
+        raise NotImplementedError
+
+
+class ZipSink(ArchiveSink):
+    """
+    Streaming ZIP sink. Entries are stored (without compression), with data descriptors.
+
+    Discarded entries are left out of the central directory, so their bytes
+    are ignored by extractors.
+    """
+
+    def __init__(self, stream: BinaryIO, close_stream: bool = False):
+        super().__init__(stream, close_stream)
+        self.__zip = zipfile.ZipFile(_Unseekable(stream), 'w', zipfile.ZIP_STORED)
+
+    def close(self) -> None:
+        self.__zip.close()
+        super().close()
+
+    def _begin_entry(self, name: str, size: int | None) -> Any:
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        info.external_attr = 0o644 << 16
+        if size is not None:
+            info.file_size = size
+        return info, self.__zip.open(info, 'w', force_zip64=size is None)
+
+    def _write(self, handle: Any, data: bytes | memoryview) -> None:
+        handle[1].write(data)
+
+    def _end_entry(self, handle: Any, complete: bool) -> None:
+        info, file = handle
+        file.close()
+        if not complete:
+            self.__zip.filelist.remove(info)
+            del self.__zip.NameToInfo[info.filename]
+
+
+class _TarEntry:
+    def __init__(self, size: int):
+        self.size = size
+        self.written = 0
+
+
+class TarSink(ArchiveSink):
+    """
+    Streaming tar sink (POSIX pax format), e.g. to stdout for piping into other tools.
+
+    Bytes after a header can't be taken back, so a discarded entry being
+    streamed is padded with zeros to keep the stream readable, and breaks the sink.
+    """
+
+    def __init__(self, stream: BinaryIO, close_stream: bool = False):
+        super().__init__(stream, close_stream)
+        self.__offset = 0
+
+    def close(self) -> None:
+        self.__put(tarfile.NUL * (tarfile.BLOCKSIZE * 2))  # End of archive
+        if remainder := self.__offset % tarfile.RECORDSIZE:
+            self.__put(tarfile.NUL * (tarfile.RECORDSIZE - remainder))
+        super().close()
+
+    def _begin_entry(self, name: str, size: int | None) -> Any:
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        self.__put(info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape'))
+        return _TarEntry(size)
+
+    def _write(self, handle: Any, data: bytes | memoryview) -> None:
+        data = data[:handle.size - handle.written]  # Never beyond the size in the header
+        self.__put(data)
+        handle.written += len(data)
+
+    def _end_entry(self, handle: Any, complete: bool) -> None:
+        if not complete:
+            self.broken = True
+        self.__put(tarfile.NUL * (handle.size - handle.written))
+        if remainder := handle.size % tarfile.BLOCKSIZE:
+            self.__put(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+
+    def __put(self, data: bytes | memoryview) -> None:
+        self._stream.write(data)
+        self.__offset += len(data)
+
+
+def archive_name(name: str, type: SinkType) -> str:
+    """File name of the archive of given name (e.g. of the course), without characters not allowed in paths."""
+    name = re.sub(r'[\\/:*?"<>|]', '_', name).strip(' .') or '_'
+    return f'{name}.{type.value}'
+
+
+def open_archive(type: SinkType, path: str) -> ArchiveSink:
+    """Opens sink of the archive type, which writes (and closes) the file."""
+    sink_class = {SinkType.ZIP: ZipSink, SinkType.TAR: TarSink}[type]
+    return sink_class(open(path, 'wb', buffering=STREAM_BUFFER_SIZE), close_stream=True)  # pylint: disable = consider-using-with
@@ -0,0 +1,82 @@
+import contextlib
+import os
+import shutil
+
+
+class BlobStore:
+    """
+    Content-addressed store of downloaded files.
+
+    Each distinct content is kept once, as a blob named by its SHA-256,
+    and hardlinked into every destination it is downloaded to.
+    (Copied instead, if hardlink is not possible. e.g. other filesystem)
+
+    Public functions and its signature:
+        def has(self, sha256: str) -> bool:
+            Checks whether the blob exists.
+        def add(self, path: str, sha256: str) -> None:
+            Adds the file as the blob.
+        def link(self, sha256: str, target: str) -> None:
+            Places the blob at the target path.
+    """
+
+    def __init__(self, root: str):
+        """
+        Create an instance of this class.
+
+        Args:
+            root: The directory which blobs are stored in.
+        """
+        self.__root = root
+
+    def path_of(self, sha256: str) -> str:
+        return os.path.join(self.__root, sha256[:2], sha256)
+
+    def has(self, sha256: str) -> bool:
+        return bool(sha256) and os.path.isfile(self.path_of(sha256))
+
+    def add(self, path: str, sha256: str) -> None:
+        """
+        Adds the file as the blob. If the blob exists already, the file is
+        replaced by a hardlink to it, so the content is kept once.
+        (The file is kept as is, if hardlink is not possible.)
+
+        Args:
+            path: The path of the file.
+            sha256: Hex digest of the file.
+        """
+        blob = self.path_of(sha256)
+        if self.has(sha256):
+            if not os.path.samefile(blob, path):
+                with contextlib.suppress(OSError):
+                    self.__replace_by_link(blob, path)
+            return
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        self.__place(path, blob)
+
+    def link(self, sha256: str, target: str) -> None:
+        """
+        Places the blob at the target path. (Existing file is replaced.)
+
+        Args:
+            sha256: Hex digest of the blob.
+            target: The path to place the blob.
+        """
+        self.__place(self.path_of(sha256), target)
+
+    @staticmethod
+    def __replace_by_link(source: str, destination: str) -> None:
+        """Replaces the destination by a hardlink to the source, at once."""
+        temporary = f'{destination}.tmp'
+        if os.path.lexists(temporary):
+            os.remove(temporary)
+        os.link(source, temporary)
+        os.replace(temporary, destination)
+
+    @classmethod
+    def __place(cls, source: str, destination: str) -> None:
+        try:
+            cls.__replace_by_link(source, destination)
+        except OSError:
+            shutil.copyfile(source, f'{destination}.tmp')
+            os.replace(f'{destination}.tmp', destination)
@@ -0,0 +1,128 @@
+import threading
+import time
+
+
+BURST_TIME = 0.25  # seconds
+MIN_BURST = 64 * 1024  # 64KiB
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket, which limits rate of bytes.
+
+    Consumers reserve tokens at once and sleep only for their own debt,
+    so waiting threads are spread out instead of waking up together.
+    Rate 0 means unlimited.
+    """
+
+    def __init__(self, rate: int = 0):
+        self.__lock = threading.Lock()
+        self.__rate = 0
+        self.__burst = 0
+        self.__tokens = 0.
+        self.__last = time.monotonic()
+        self.set_rate(rate)
+
+    @property
+    def rate(self) -> int:
+        return self.__rate
+
+    def set_rate(self, rate: int) -> None:
+        """Changes the rate (bytes per second). Takes effect immediately."""
+        with self.__lock:
+            self.__rate = max(rate, 0)
+            self.__burst = max(self.__rate * BURST_TIME, MIN_BURST)
+            self.__tokens = min(self.__tokens, self.__burst)
+            self.__last = time.monotonic()
+
+    def reserve(self, amount: int) -> float:
+        """Takes given number of tokens, returns seconds to wait until they are available."""
+        with self.__lock:
+            if not self.__rate:
+                return 0.
+            now = time.monotonic()
+            self.__tokens = min(self.__tokens + (now - self.__last) * self.__rate, self.__burst)
+            self.__last = now
+            self.__tokens -= amount
+            return max(-self.__tokens / self.__rate, 0.)
+
+    def consume(self, amount: int) -> None:
+        """Takes given number of tokens, blocks until they are available."""
+        wait = self.reserve(amount)
+        if wait:
+            time.sleep(wait)
+
+
+class BandwidthLimiter:
+    """
+    Process-wide bandwidth limiter of downloads.
+
+    Shared by every download thread (and segment). Received bytes are
+    charged to the global bucket and to the bucket of their host, if any.
+
+    Public functions and its signature:
+        def set_rate(self, rate: int) -> None:
+            Sets the global limit.
+        def set_host_rate(self, host: str, rate: int) -> None:
+            Sets the limit of a host.
+        def is_limited(self, host: str) -> bool:
+            Checks whether any limit is applied to the host.
+        def reserve(self, host: str, amount: int) -> float:
+            Charges received bytes, returns seconds to wait to keep the limits.
+        def consume(self, host: str, amount: int) -> None:
+            Charges received bytes, blocks to keep the limits.
+    """
+    _instance = None
+    _inited = False
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if self._inited:
+            return
+        self.__lock = threading.Lock()
+        self.__global = TokenBucket()
+        self.__hosts: dict[str, TokenBucket] = {}
+        self._inited = True
+
+    def set_rate(self, rate: int) -> None:
+        """
+        Sets the global limit.
+
+        Args:
+            rate: The limit in bytes per second. 0 means unlimited.
+        """
+        self.__global.set_rate(rate)
+
+    def set_host_rate(self, host: str, rate: int) -> None:
+        """
+        Sets the limit of the host.
+
+        Args:
+            host: The host name. (e.g. lcms.knu.ac.kr)
+            rate: The limit in bytes per second. 0 means unlimited.
+        """
+        with self.__lock:
+            if rate:
+                self.__hosts.setdefault(host, TokenBucket()).set_rate(rate)
+            elif host in self.__hosts:
+                self.__hosts.pop(host).set_rate(0)
+
+    def is_limited(self, host: str) -> bool:
+        return bool(self.__global.rate) or host in self.__hosts
+
+    def reserve(self, host: str, amount: int) -> float:
+        """Charges received bytes without blocking. (For asyncio) Returns seconds to wait."""
+        wait = self.__global.reserve(amount)
+        host_bucket = self.__hosts.get(host)
+        if host_bucket is not None:
+            wait = max(wait, host_bucket.reserve(amount))
+        return wait
+
+    def consume(self, host: str, amount: int) -> None:
+        wait = self.reserve(host, amount)
+        if wait:
+            time.sleep(wait)
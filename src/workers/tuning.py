@@ -0,0 +1,189 @@
+from collections import deque
+from collections.abc import Callable
+from typing import Any
+import asyncio
+import threading
+import time
+
+from .concurrency import _Waiter
+
+
+TUNING_INTERVAL = 2.  # seconds
+INITIAL_CONCURRENCY = 2
+GAIN_THRESHOLD = 0.1  # throughput must improve by 10% to keep adding transfers
+THROTTLING_STATUS_CODES = {429, 503}
+
+
+class TransferSlot:
+    """An acquired slot of ConcurrencyTuner. Released once, however many times release is called."""
+
+    def __init__(self, tuner: 'ConcurrencyTuner'):
+        self.__tuner = tuner
+        self.__released = False
+        self.__lock = threading.Lock()
+
+    def release(self) -> None:
+        with self.__lock:
+            if self.__released:
+                return
+            self.__released = True
+        self.__tuner._release()  # pylint: disable = protected-access
+
+
+class ConcurrencyTuner:
+    """
+    Tunes the number of parallel transfers of a download run, from measured throughput.
+
+    Starts with a few transfers, and adds one at each interval while the
+    aggregate throughput keeps improving (and every slot is in use).
+    When throughput stops improving, goes back to the level of the best
+    throughput. Errors take one transfer away, and throttling responses
+    (429, 503) halve the transfers; then it starts climbing again.
+    Each transfer (request, until its response is closed) takes a slot.
+
+    Public functions and its signature:
+        @property
+        def limit(self) -> int:
+            The current number of parallel transfers.
+        def acquire(self) -> TransferSlot:
+            Takes a slot, blocks until available.
+        async def acquire_async(self) -> TransferSlot:
+            Takes a slot, waits until available. (For asyncio)
+        def record(self, received: int) -> None:
+            Records received bytes.
+        def record_error(self, throttled: bool = False) -> None:
+            Records a failed (or throttled) transfer.
+    """
+
+    def __init__(
+        self, maximum: int, initial: int = INITIAL_CONCURRENCY,
+        on_change: Callable[[int, str], Any] | None = None
+    ):
+        """
+        Args:
+            maximum: The maximum number of parallel transfers.
+            initial: The number of parallel transfers to start with.
+            on_change: Called with the new number of transfers and the reason, when it is changed.
+        """
+        self.__lock = threading.Lock()
+        self.__maximum = max(maximum, 1)
+        self.__limit = min(max(initial, 1), self.__maximum)
+        self.__active = 0
+        self.__waiters: deque[_Waiter] = deque()
+        self.__on_change = on_change
+
+        self.__window_start = time.monotonic()
+        self.__window_bytes = 0
+        self.__window_errors = 0
+        self.__window_throttled = False
+        self.__saturated = False  # Whether every slot was used in the window
+        self.__best_throughput = 0.
+        self.__best_limit = self.__limit
+        if on_change is not None:
+            on_change(self.__limit, '시작')
+
+    @property
+    def limit(self) -> int:
+        with self.__lock:
+            return self.__limit
+
+    def acquire(self) -> TransferSlot:
+        """Takes a slot, blocks until available. The slot must be released."""
+        with self.__lock:
+            if self.__try_acquire():
+                return TransferSlot(self)
+            waiter = _Waiter()
+            self.__waiters.append(waiter)
+        waiter.event.wait()  # The slot is handed over by _release
+        return TransferSlot(self)
+
+    async def acquire_async(self) -> TransferSlot:
+        """Takes a slot, waits until available. The slot must be released."""
+        with self.__lock:
+            if self.__try_acquire():
+                return TransferSlot(self)
+            waiter = _Waiter(asyncio.get_running_loop())
+            self.__waiters.append(waiter)
+        try:
+            await waiter.event
+        except asyncio.CancelledError:
+            with self.__lock:
+                handed_over = waiter not in self.__waiters
+                if not handed_over:
+                    self.__waiters.remove(waiter)
+            if handed_over:
+                self._release()
+            raise
+        return TransferSlot(self)
+
+    def record(self, received: int) -> None:
+        with self.__lock:
+            self.__window_bytes += received
+        self.__evaluate()
+
+    def record_error(self, throttled: bool = False) -> None:
+        with self.__lock:
+            self.__window_errors += 1
+            self.__window_throttled |= throttled
+        self.__evaluate()
+
+    def _release(self) -> None:
+        with self.__lock:
+            if not self.__waiters or self.__active > self.__limit:
+                self.__active -= 1
+                return
+            waiter = self.__waiters.popleft()  # Hand over the slot
+        waiter.wake()
+
+    def __try_acquire(self) -> bool:
+        if self.__active < self.__limit and not self.__waiters:
+            self.__active += 1
+            self.__saturated |= self.__active == self.__limit
+            return True
+        self.__saturated = True
+        return False
+
+    def __evaluate(self) -> None:
+        """Changes the limit, at the end of each interval."""
+        changed = None
+        with self.__lock:
+            now = time.monotonic()
+            if now - self.__window_start < TUNING_INTERVAL:
+                return
+            throughput = self.__window_bytes / (now - self.__window_start)
+            limit = self.__limit
+            if self.__window_throttled:
+                limit = max(limit // 2, 1)
+                reason = '서버 제한'
+            elif self.__window_errors:
+                limit = max(limit - 1, 1)
+                reason = '오류'
+            elif throughput > self.__best_throughput * (1 + GAIN_THRESHOLD):
+                self.__best_throughput = throughput
+                self.__best_limit = limit
+                if self.__saturated:
+                    limit = min(limit + 1, self.__maximum)
+                reason = '처리량 증가'
+            else:  # Plateau
+                limit = min(self.__best_limit, limit)
+                reason = '처리량 정체'
+            if self.__window_errors:  # Climbs again from the lowered level
+                self.__best_throughput = 0.
+                self.__best_limit = limit
+
+            self.__window_start = now
+            self.__window_bytes = self.__window_errors = 0
+            self.__window_throttled = False
+            self.__saturated = self.__active >= limit
+            if limit != self.__limit:
+                self.__limit = limit
+                changed = (limit, reason)
+                woken = []
+                while self.__waiters and self.__active < self.__limit:
+                    self.__active += 1
+                    woken.append(self.__waiters.popleft())
+        if changed is not None:
+            for waiter in woken:
+                waiter.wake()
+            if self.__on_change is not None:
+                self.__on_change(*changed)
@@ -0,0 +1,196 @@
+from collections.abc import Callable
+from typing import Any
+import queue
+import threading
+
+
+WRITE_BUFFERS = 16  # buffers in flight between the fetchers and the writer
+MAX_BATCH = 64  # queued writes, which are written at once
+
+
+class QueuedWriter:
+    """
+    Write function, which queues the data to the writer stage.
+
+    Queued data is written in order by the writer thread, with the write
+    function of the destination. Errors of the destination are raised by
+    the next call (or flush) in the fetcher thread.
+    """
+
+    def __init__(self, stage: 'WriterStage', write_many: Callable[[list[bytes | memoryview]], Any]):
+        self.__stage = stage
+        self.__write_many = write_many
+        self.__condition = threading.Condition()
+        self.__pending = 0
+        self.__error: Exception | None = None
+
+    def __call__(self, data: bytes | memoryview) -> None:
+        """Queues the data. Unless it is a buffer of the stage, it is copied to be kept."""
+        if not self.__stage.owns(data):
+            data = bytes(data)
+        self.__submit(data)
+
+    def offer(self, data: bytes | memoryview) -> bool:
+        """
+        Queues the data without blocking, if the queue has room. (For the event loop)
+
+        Returns:
+            bool: Whether the data is queued. If not, it must be queued by calling the writer.
+        """
+        if not self.__stage.owns(data):
+            data = bytes(data)
+        self.__raise_error()
+        with self.__condition:
+            self.__pending += 1
+        if self.__stage._offer(self, data):  # pylint: disable = protected-access
+            return True
+        with self.__condition:
+            self.__pending -= 1
+            self.__condition.notify_all()
+        return False
+
+    def receive(self, read_into: Callable[[memoryview], int], size: int) -> int:
+        """
+        Reads at most size bytes into a free buffer of the stage by read_into, and queues them.
+
+        Blocks while every buffer is queued. (Backpressure from the disk)
+
+        Returns:
+            int: The number of read bytes. 0 means the end of the stream.
+        """
+        buffer = self.__stage.take_buffer()
+        try:
+            received = read_into(buffer[:size])
+        except BaseException:
+            self.__stage.give_back(buffer)
+            raise
+        if received:
+            self.__submit(buffer[:received])
+        else:
+            self.__stage.give_back(buffer)
+        return received
+
+    def flush(self) -> None:
+        """Blocks until the queued data is written."""
+        with self.__condition:
+            self.__condition.wait_for(lambda: not self.__pending)
+        self.__raise_error()
+
+    def _write(self, views: list[bytes | memoryview]) -> None:
+        """Writes the queued data. (In the writer thread)"""
+        try:
+            if self.__error is None:
+                self.__write_many(views)
+        except Exception as e:  # pylint: disable = broad-except  # Raised in the fetcher thread
+            self.__error = e
+        finally:
+            for data in views:
+                self.__stage.give_back(data)
+            with self.__condition:
+                self.__pending -= len(views)
+                self.__condition.notify_all()
+
+    def __submit(self, data: bytes | memoryview) -> None:
+        self.__raise_error()
+        with self.__condition:
+            self.__pending += 1
+        self.__stage._put(self, data)  # pylint: disable = protected-access
+
+    def __raise_error(self) -> None:
+        if self.__error is not None:
+            raise self.__error
+
+
+class WriterStage:
+    """
+    Dedicated writer thread, fed by the fetcher threads through a bounded queue.
+
+    Fetchers receive into the buffers of the stage, and go on receiving
+    while the writer writes, so slow disks and slow networks don't stall
+    each other. When every buffer is queued, fetchers wait for the writer.
+    Consecutive writes of a destination are written at once.
+
+    Public functions and its signature:
+        def writer(self, write_many: Callable[[list[bytes | memoryview]], Any]) -> QueuedWriter:
+            Makes write function, which queues the data to be written by write_many.
+        def take_buffer(self) -> memoryview:
+            Takes a free buffer, blocks until available.
+        def give_back(self, data: bytes | memoryview) -> None:
+            Gives back the buffer of the data, if it is of the stage.
+        def owns(self, data: bytes | memoryview) -> bool:
+            Checks whether the data is in a buffer of the stage.
+        def close(self) -> None:
+            Writes the queued data, and stops the writer thread.
+    """
+
+    def __init__(self, buffers: int = WRITE_BUFFERS, buffer_size: int = 1024 ** 2):
+        self.__buffer_size = buffer_size
+        self.__buffers_count = max(buffers, 1)
+        self.__buffers: dict[int, bytearray] = {}  # id -> buffer
+        self.__free: list[bytearray] = []
+        self.__condition = threading.Condition()
+        self.__queue: queue.Queue[tuple[QueuedWriter, bytes | memoryview] | None] =\
+            queue.Queue(self.__buffers_count)
+        self.__thread = threading.Thread(target=self.__run, name='writer', daemon=True)
+        self.__thread.start()
+
+    def __enter__(self) -> 'WriterStage':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def writer(self, write_many: Callable[[list[bytes | memoryview]], Any]) -> QueuedWriter:
+        return QueuedWriter(self, write_many)
+
+    def take_buffer(self) -> memoryview:
+        with self.__condition:
+            if not self.__free and len(self.__buffers) < self.__buffers_count:
+                buffer = bytearray(self.__buffer_size)
+                self.__buffers[id(buffer)] = buffer
+                return memoryview(buffer)
+            self.__condition.wait_for(lambda: self.__free)
+            return memoryview(self.__free.pop())
+
+    def give_back(self, data: bytes | memoryview) -> None:
+        if self.owns(data):
+            with self.__condition:
+                self.__free.append(data.obj)
+                self.__condition.notify()
+
+    def owns(self, data: bytes | memoryview) -> bool:
+        return isinstance(data, memoryview) and self.__buffers.get(id(data.obj)) is data.obj
+
+    def close(self) -> None:
+        if self.__thread.is_alive():
+            self.__queue.put(None)
+            self.__thread.join()
+
+    def _put(self, writer: QueuedWriter, data: bytes | memoryview) -> None:
+        self.__queue.put((writer, data))
+
+    def _offer(self, writer: QueuedWriter, data: bytes | memoryview) -> bool:
+        try:
+            self.__queue.put_nowait((writer, data))
+        except queue.Full:
+            return False
+        return True
+
+    def __run(self) -> None:
+        stopped = False
+        while not stopped:
+            batch = [self.__queue.get()]
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stopped = True
+                batch = [job for job in batch if job is not None]
+
+            start = 0
+            for end in range(1, len(batch) + 1):  # Consecutive writes of a destination at once
+                if end == len(batch) or batch[end][0] is not batch[start][0]:
+                    batch[start][0]._write([data for _, data in batch[start:end]])  # pylint: disable = protected-access
+                    start = end